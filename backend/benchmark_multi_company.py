@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多公司匹配基准测试 - 对比主进程内匹配与不同进程数的常驻进程池
+
+用法: python benchmark_multi_company.py [公司数] [价格表行数] [询价行数]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from match_result_cache import match_result_cache
+from multi_company_matcher import MultiCompanyMatcher, shutdown_pool
+from multi_company_models import PriceTableInfo
+from price_table_fixtures import build_price_table, build_queries
+
+
+def build_inquiry(rows: int) -> pd.DataFrame:
+    """生成模拟询价表（品名取型号，规格取 DN）"""
+    queries = build_queries(rows)
+    return pd.DataFrame({
+        '品名': [model for _, model, _, _ in queries],
+        '规格型号': [dn for _, _, _, dn in queries],
+        '数量': 1,
+    })
+
+
+def run_benchmark(companies: int = 4, rows: int = 2000, inquiry_rows: int = 200):
+    inquiry = build_inquiry(inquiry_rows)
+    cores = os.cpu_count() or 1
+    print(f"📊 [BENCH] 公司数: {companies}, 价格表行数: {rows}, 询价行数: {inquiry_rows}, CPU 核数: {cores}")
+
+    # 关闭匹配结果缓存（工作进程由当前进程派生，一并关闭），只比较实际匹配的耗时
+    cache_entries, match_result_cache.max_entries = match_result_cache.max_entries, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # 进程池按路径载入价格表，价格表需写成文件
+        price_tables = []
+        for j in range(companies):
+            path = os.path.join(tmp, f'公司{j}.csv')
+            data = build_price_table(rows, seed=j)
+            data.to_csv(path, index=False)
+            price_tables.append(PriceTableInfo(file_path=path, company_name=f'公司{j}', file_format='csv',
+                                               is_valid=True, data=data))
+
+        def timed(matcher: MultiCompanyMatcher):
+            # 先调用一次：建进程池、各进程载入价格表索引；计时的是常驻进程池上的一次匹配
+            matcher.match_products_multi_company(inquiry, price_tables)
+            start = time.perf_counter()
+            result = matcher.match_products_multi_company(inquiry, price_tables)
+            return time.perf_counter() - start, result
+
+        baseline_time, baseline = timed(MultiCompanyMatcher(executor="inline"))
+        timings = [("主进程", baseline_time)]
+        workers = 1
+        while workers <= cores:
+            elapsed, result = timed(MultiCompanyMatcher(max_workers=workers, executor="process"))
+            assert result.matched_products == baseline.matched_products, "进程池结果与主进程不一致"
+            timings.append((f"进程池 x{workers}", elapsed))
+            workers *= 2
+        shutdown_pool()
+    match_result_cache.max_entries = cache_entries
+
+    # 只有一个 CPU 核时进程池不会比主进程快，结果仅反映任务分发的开销
+    for label, elapsed in timings:
+        print(f"   {label}: {elapsed:.2f} s（相对主进程 {baseline_time / max(elapsed, 1e-9):.2f}x）")
+    return timings
+
+
+if __name__ == "__main__":
+    companies = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    inquiry_rows = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    run_benchmark(companies, rows, inquiry_rows)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+价格表编辑基准测试 - 单次编辑耗时基本不随价格表行数增长
+
+对不同行数的价格表分别计时 更新行 / 追加行 / 删除行，每轮编辑之间有一次读取（读完即释放快照）；
+最后一列是读取方一直持有快照时的更新耗时，此时每次编辑都要先复制索引，耗时随行数增长。
+用法: python benchmark_price_table_edits.py [编辑次数] [行数 ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from price_table_cache import load_price_table_index, price_table_cache
+from price_table_fixtures import build_price_table
+from price_table_journal import remove_journal
+from price_table_store import PriceTableStore
+
+
+def _time_edits(edit, count: int) -> float:
+    """执行 count 次编辑，返回每次的平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for i in range(count):
+        edit(i)
+    return (time.perf_counter() - start) / count * 1000
+
+
+def run_benchmark(rows_list=(1000, 10000, 100000), edit_count: int = 200):
+    print(f"📊 [BENCH] 每种编辑 {edit_count} 次，单位 ms/次")
+    print(f"   {'行数':>8} {'更新行':>8} {'追加行':>8} {'删除行':>8} {'持有快照时更新':>14}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in rows_list:
+            path = os.path.join(tmp, f'价格表_{rows}.csv')
+            build_price_table(rows).to_csv(path, index=False)
+            store = PriceTableStore(max_journal_age=3600)
+            try:
+                # 第一次编辑复制缓存中的冻结索引，不计入
+                store.update_row(path, 0, {'型号': 'WARMUP'})
+                update = _time_edits(lambda i: store.update_row(path, i, {'型号': f'U-{i}', '规格': 'DN80'}), edit_count)
+                len(load_price_table_index(path))
+                append = _time_edits(lambda i: store.add_row(path, {'产品名称': '球阀', '型号': f'A-{i}', '单价': i}), edit_count)
+                len(load_price_table_index(path))
+                delete = _time_edits(lambda i: store.delete_row(path, i), edit_count)
+
+                # 每次编辑后读取方都取得并持有新快照
+                pinned = [load_price_table_index(path)]
+
+                def update_pinned(i):
+                    store.update_row(path, i, {'型号': f'P-{i}'})
+                    pinned[0] = load_price_table_index(path)
+
+                pinned_update = _time_edits(update_pinned, max(edit_count // 20, 1))
+                pinned.clear()
+            finally:
+                price_table_cache.invalidate(path)
+                remove_journal(path)
+            results[rows] = (update, append, delete, pinned_update)
+            print(f"   {rows:>8} {update:>8.3f} {append:>8.3f} {delete:>8.3f} {pinned_update:>14.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    edit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rows_list = [int(arg) for arg in sys.argv[2:]] or [1000, 10000, 100000]
+    run_benchmark(rows_list, edit_count)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+三匹配打分基准测试 - 对比逐行 iterrows 打分与 PriceTableIndex 向量化打分
+
+用法: python benchmark_tri_match.py [价格表行数] [查询次数]
+"""
+
+import sys
+import time
+
+from price_table_fixtures import build_price_table, build_queries, legacy_tri_match
+from price_table_index import PriceTableIndex
+
+def run_benchmark(rows: int = 20000, query_count: int = 20):
+    price_df = build_price_table(rows)
+    queries = build_queries(query_count)
+
+    print(f"📊 [BENCH] 价格表行数: {rows}, 查询次数: {query_count}")
+
+    start = time.perf_counter()
+    index = PriceTableIndex(price_df)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [index.best_match(model, name, brand, dn) for name, model, brand, dn in queries]
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy = [legacy_tri_match(price_df, name, model, brand, dn) for name, model, brand, dn in queries]
+    legacy_time = time.perf_counter() - start
+
+    # 原实现按“规格包含数字”过滤 DN（DN15 会命中 DN150），索引按整数 DN 相等过滤，
+    # 因此只有不带 DN 的查询要求结果完全一致，带 DN 的查询统计差异数
+    dn_differences = 0
+    for (_, _, _, dn), got, expected in zip(queries, vectorized, legacy):
+        got_label = (price_df.index[got[0]], got[1]) if got else None
+        if dn:
+            dn_differences += got_label != expected
+        else:
+            assert got_label == expected, f"结果不一致: {got_label} != {expected}"
+
+    print(f"   索引构建: {build_time * 1000:.1f} ms")
+    print(f"   逐行打分: {legacy_time / query_count * 1000:.1f} ms/查询")
+    print(f"   向量打分: {vectorized_time / query_count * 1000:.2f} ms/查询")
+    print(f"   加速比: {legacy_time / max(vectorized_time, 1e-9):.0f}x")
+    print(f"   DN 过滤规则不同导致结果不同的查询: {dn_differences}/{sum(1 for q in queries if q[3])}")
+    return legacy_time, vectorized_time
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    run_benchmark(rows, query_count)
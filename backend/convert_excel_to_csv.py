@@ -1,10 +1,34 @@
 # 只保留主流程相关内容
 import os
+import numpy as np
 import pandas as pd
 import glob
 import re
 import traceback
 import datetime
+from keyword_automaton import KeywordAutomaton
+
+# 品牌库（按优先级排列，同一文本出现多个品牌时取靠前的）
+BRAND_LIST = ["上海沪工", "上海良工", "中核苏阀", "上海泰科", "上海科尼特"]
+_BRAND_AUTOMATON = KeywordAutomaton(BRAND_LIST)
+
+# 单元格中的 DN 口径（只在含大写“DN”的单元格中查找）
+_CELL_DN_PATTERN = re.compile(r'DN\s*(\d+)', re.IGNORECASE)
+
+
+def first_cell_dn(df: pd.DataFrame) -> pd.Series:
+    """每行从左到右第一个含 DN 的单元格中的 DN（如“DN50”），没有时为 NaN；按列整列解析"""
+    found = pd.Series(np.nan, index=df.index, dtype=object)
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        text = column.astype(str).str.strip()
+        dn = text.str.extract(_CELL_DN_PATTERN.pattern, flags=_CELL_DN_PATTERN.flags, expand=False)
+        dn = ('DN' + dn).where(column.notna() & text.str.contains('DN', regex=False, na=False) & dn.notna())
+        found = found.fillna(dn)
+        if found.notna().all():
+            break
+    return found
+
 
 def detect_table_structure(df):
     header_row = None
@@ -233,6 +257,8 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
     import os
     import glob
     from valve_model_generator import parse_valve_info
+    from valve_parser import DN_COLUMN, MATERIAL_COLUMN, PN_COLUMN, extract_spec_columns
+    from price_table_cache import read_price_table
     print(f"[DEBUG] 输入文件: {input_file}")
     if price_file:
         print(f"[DEBUG] 价格文件: {price_file}")
@@ -301,12 +327,15 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
         df['数量'] = ''
         print("[警告] 未找到数量列")
     
-    # 3. 生成标准型号（合并所有单元格，仅用于生成）
-    # 修复标准型号生成逻辑
+    # 3. 生成标准型号（合并所有单元格，仅用于生成），DN/PN/材质整列预先解析
+    merged_texts = pd.Series([
+        ' '.join([str(cell).strip() for cell in row if pd.notna(cell) and str(cell).strip() != ''])
+        for row in df.itertuples(index=False)
+    ], index=df.index, dtype=object)
+    columns = extract_spec_columns(merged_texts)
     models = []
-    for idx, row in df.iterrows():
-        merged = ' '.join([str(cell).strip() for cell in row if pd.notna(cell) and str(cell).strip() != ''])
-        model = parse_valve_info(merged, '', None, True)
+    for merged, dn, pn, material in zip(merged_texts, columns[DN_COLUMN], columns[PN_COLUMN], columns[MATERIAL_COLUMN]):
+        model = parse_valve_info(merged, '', None, True, dn, pn, material)
         models.append(model if model is not None else '')
     df['标准型号'] = models
 
@@ -318,61 +347,23 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
         # 确保规格型号列为字符串类型
         df['规格型号'] = df['规格型号'].astype(str)
         
-        # 从所有单元格提取DN
-        for idx, row in df.iterrows():
-            spec = row.get('规格型号', '')
-            # 检查是否为NaN或空值
-            if pd.isna(spec) or spec == '' or str(spec).strip() == '' or str(spec).lower() == 'nan':
-                # 从该行的所有单元格中提取DN信息
-                found_dn = None
-                source_cell = ''
-                
-                # 遍历该行的所有单元格
-                for col_idx, cell_value in enumerate(row):
-                    if pd.notna(cell_value):
-                        cell_str = str(cell_value).strip()
-                        if 'DN' in cell_str:
-                            dn_match = re.search(r'DN\s*(\d+)', cell_str, re.IGNORECASE)
-                            if dn_match:
-                                found_dn = f'DN{dn_match.group(1)}'
-                                source_cell = f"列{col_idx+1}({df.columns[col_idx]})"
-                                print(f"[调试] 行{idx+1}: 从{source_cell}提取规格型号: {cell_str} -> {found_dn}")
-                                break
-                
-                # 如果找到了DN，设置到规格型号列
-                if found_dn:
-                    df.at[idx, '规格型号'] = found_dn
+        # 规格型号为空的行从所有单元格提取DN
+        spec_text = df['规格型号'].str.strip()
+        missing = df['规格型号'].isna() | (spec_text == '') | (spec_text.str.lower() == 'nan')
+        found_dn = first_cell_dn(df)
+        backfill = missing & found_dn.notna()
+        df.loc[backfill, '规格型号'] = found_dn[backfill]
+        print(f"[调试] 从单元格补全规格型号: {int(backfill.sum())} 行")
         
         # 将'nan'字符串替换为空字符串（在提取完成后）
         df['规格型号'] = df['规格型号'].replace('nan', '')
     else:
         # 旧文件结构：从所有单元格提取DN
-        df['规格型号'] = ''
-        for idx, row in df.iterrows():
-            # 从该行的所有单元格中提取DN信息
-            found_dn = None
-            source_cell = ''
-            
-            # 遍历该行的所有单元格
-            for col_idx, cell_value in enumerate(row):
-                if pd.notna(cell_value):
-                    cell_str = str(cell_value).strip()
-                    if 'DN' in cell_str:
-                        dn_match = re.search(r'DN\s*(\d+)', cell_str, re.IGNORECASE)
-                        if dn_match:
-                            found_dn = f'DN{dn_match.group(1)}'
-                            source_cell = f"列{col_idx+1}({df.columns[col_idx]})"
-                            print(f"[调试] 行{idx+1}: 从{source_cell}提取规格型号: {cell_str} -> {found_dn}")
-                            break
-            
-            # 如果找到了DN，设置到规格型号列
-            if found_dn:
-                df.at[idx, '规格型号'] = found_dn
+        found_dn = first_cell_dn(df)
+        df['规格型号'] = found_dn.fillna('')
+        print(f"[调试] 从单元格提取规格型号: {int(found_dn.notna().sum())} 行")
 
-    # 5. 品牌库
-    brand_list = ["上海沪工", "上海良工", "中核苏阀", "上海泰科", "上海科尼特"]
-
-    # 6. 品牌列：填充品牌信息
+    # 5. 品牌列：填充品牌信息（品牌库见 BRAND_LIST）
     if selected_brand:
         # 如果提供了选择的品牌，直接使用它
         print(f"[DEBUG] 使用选择的品牌: {selected_brand}")
@@ -394,13 +385,10 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
                 if pd.isna(brand) or brand == '' or str(brand).strip() == '' or str(brand).lower() == 'nan':
                     # 尝试从项目名称中提取品牌
                     project_name = str(row.get('项目名称', row.get('品名', ''))).strip()
-                    found_brand = ''
-                    for brand_name in brand_list:
-                        if brand_name in project_name:
-                            found_brand = brand_name
-                            df.at[idx, '品牌'] = found_brand
-                            print(f"[调试] 行{idx+1}: 从项目名称提取品牌: {project_name} -> {found_brand}")
-                            break
+                    found_brand = _BRAND_AUTOMATON.first(project_name)
+                    if found_brand:
+                        df.at[idx, '品牌'] = found_brand
+                        print(f"[调试] 行{idx+1}: 从项目名称提取品牌: {project_name} -> {found_brand}")
         else:
             # 旧文件结构：从备 注列提取品牌信息
             df['品牌'] = ''
@@ -411,21 +399,16 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
                 # 合并两个备注列
                 all_remarks = f"{remark} {remark2}".strip()
                 
-                found_brand = ''
-                for brand in brand_list:
-                    if brand in all_remarks:
-                        found_brand = brand
-                        print(f"[调试] 行{idx+1}: 从备注提取品牌: {all_remarks} -> {brand}")
-                        break
+                found_brand = _BRAND_AUTOMATON.first(all_remarks)
+                if found_brand:
+                    print(f"[调试] 行{idx+1}: 从备注提取品牌: {all_remarks} -> {found_brand}")
                 
                 # 如果没有找到品牌，尝试从项目名称中提取
                 if not found_brand:
                     project_name = str(row.get('项目名称', '')).strip()
-                    for brand in brand_list:
-                        if brand in project_name:
-                            found_brand = brand
-                            print(f"[调试] 行{idx+1}: 从项目名称提取品牌: {project_name} -> {brand}")
-                            break
+                    found_brand = _BRAND_AUTOMATON.first(project_name)
+                    if found_brand:
+                        print(f"[调试] 行{idx+1}: 从项目名称提取品牌: {project_name} -> {found_brand}")
                 
                 df.at[idx, '品牌'] = found_brand
 
@@ -497,11 +480,8 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
     prices = []
     totals = []
     if price_file is not None and os.path.exists(price_file):
-        # 根据文件扩展名选择读取方式
-        if price_file.endswith('.csv'):
-            price_df = pd.read_csv(price_file)
-        else:
-            price_df = pd.read_excel(price_file)
+        # 经共享缓存读取价格表（按文件扩展名选择解析方式）
+        price_df = read_price_table(price_file)
         print(f"[调试] 价格表列名: {list(price_df.columns)}")
         print(f"[调试] 价格表前3行数据:")
         print(price_df.head(3))
@@ -540,6 +520,36 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
         else:
             print(f"[调试] 使用价格列: {price_col}")
             
+            # 检查价格表是否有品牌列
+            brand_col = None
+            for col in price_df.columns:
+                if '品牌' in str(col):
+                    brand_col = col
+                    break
+            
+            # 检查价格表是否有规格列
+            spec_col = None
+            for col in price_df.columns:
+                if '规格' in str(col):
+                    spec_col = col
+                    break
+            
+            print(f"[调试] 找到的品牌列: {brand_col}")
+            print(f"[调试] 找到的规格列: {spec_col}")
+            
+            # 三条件索引：(品牌, 标准型号, 规格) 归一化后 -> 价格表中第一条匹配行的位置
+            match_index = {}
+            if brand_col and spec_col:
+                keys = zip(
+                    price_df[brand_col].map(normalize),
+                    price_df['标准型号'].map(normalize),
+                    price_df[spec_col].map(normalize),
+                )
+                for pos, key in enumerate(keys):
+                    if key not in match_index:
+                        match_index[key] = pos
+                print(f"[调试] 三条件索引构建完成: {len(match_index)} 个键")
+            
             for i in range(len(df)):
                 std_model = normalize(str(df.iloc[i].get('标准型号', '')).strip())
                 spec = normalize(str(df.iloc[i].get('规格型号', '')).strip())
@@ -553,53 +563,11 @@ def process_excel_to_standard_csv(input_file, output_file=None, price_file=None,
                 # 三条件匹配逻辑：品牌、标准型号、规格型号都必须匹配
                 matched_price = ''
                 
-                # 检查价格表是否有品牌列
-                brand_col = None
-                for col in price_df.columns:
-                    if '品牌' in str(col):
-                        brand_col = col
-                        break
-                
-                # 检查价格表是否有规格列
-                spec_col = None
-                for col in price_df.columns:
-                    if '规格' in str(col):
-                        spec_col = col
-                        break
-                
-                print(f"[调试] 价格表列名: {list(price_df.columns)}")
-                print(f"[调试] 找到的品牌列: {brand_col}")
-                print(f"[调试] 找到的规格列: {spec_col}")
-                print(f"[调试] 价格表前3行数据:")
-                print(price_df.head(3))
-                
                 # 严格三条件匹配：品牌+标准型号+规格型号必须都匹配
                 if brand and std_model and spec and brand_col and spec_col:
-                    print(f"[调试] 开始三条件匹配:")
-                    print(f"  询价表: 品牌='{brand}', 标准型号='{std_model}', 规格型号='{spec}'")
-                    
-                    # 分别检查每个条件
-                    brand_matches = price_df[price_df[brand_col].apply(normalize) == brand]
-                    print(f"  品牌匹配: {len(brand_matches)} 条")
-                    
-                    model_matches = price_df[price_df['标准型号'].apply(normalize) == std_model]
-                    print(f"  型号匹配: {len(model_matches)} 条")
-                    
-                    spec_matches = price_df[price_df[spec_col].apply(normalize) == spec]
-                    print(f"  规格匹配: {len(spec_matches)} 条")
-                    
-                    # 显示价格表中的一些示例数据
-                    print(f"  价格表品牌示例: {price_df[brand_col].head(3).tolist()}")
-                    print(f"  价格表型号示例: {price_df['标准型号'].head(3).tolist()}")
-                    print(f"  价格表规格示例: {price_df[spec_col].head(3).tolist()}")
-                    
-                    matches = price_df[
-                        (price_df[brand_col].apply(normalize) == brand) &
-                        (price_df['标准型号'].apply(normalize) == std_model) &
-                        (price_df[spec_col].apply(normalize) == spec)
-                    ]
-                    if not matches.empty:
-                        matched_price = str(matches.iloc[0][price_col])
+                    key = (brand, std_model, spec)
+                    if key in match_index:
+                        matched_price = str(price_df.iloc[match_index[key]][price_col])
                         print(f"[调试] 三条件匹配成功: 品牌={brand}, 标准型号={std_model}, 规格型号={spec} -> {matched_price}")
                     else:
                         print(f"[调试] 三条件匹配失败: 品牌={brand}, 标准型号={std_model}, 规格型号={spec}")
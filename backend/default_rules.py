@@ -1,6 +1,49 @@
+import copy
 import json
 import os
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+# 进程内规则缓存：规则文件绝对路径 -> ((mtime_ns, size), 规则)；文件被外部修改后按签名自动失效
+_rules_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_rules_lock = threading.Lock()
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_rules_file(path: str) -> Optional[Dict[str, Any]]:
+    """经缓存读取规则文件；文件不存在、为空或损坏时返回 None。返回的字典由缓存共享，调用方只读"""
+    signature = _file_signature(path)
+    if signature is None:
+        return None
+    with _rules_lock:
+        cached = _rules_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    try:
+        print(f"📖 正在读取规则文件: {path}")
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        if not content.strip():
+            print(f"⚠️  规则文件为空")
+            return None
+        rules = json.loads(content)
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON解析错误: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ 加载规则文件失败: {e}")
+        return None
+    with _rules_lock:
+        _rules_cache[path] = (signature, rules)
+    return rules
+
 
 class DefaultRulesManager:
     """默认规则管理器"""
@@ -245,53 +288,53 @@ class DefaultRulesManager:
         os.makedirs(user_dir, exist_ok=True)
         return rules_file
     
+    def _rules_file(self, username: str) -> str:
+        return os.path.abspath(os.path.join(self.data_root, username, "default_rules.json"))
+    
+    def rules_version(self, username: str) -> Optional[Tuple[int, int]]:
+        """用户规则文件的版本号（修改时间, 大小），文件不存在时为 None"""
+        return _file_signature(self._rules_file(username))
+    
     def load_user_rules(self, username: str) -> Dict[str, Any]:
-        """加载用户的默认规则"""
-        rules_file = self.get_user_rules_file(username)
-        
-        if os.path.exists(rules_file):
-            try:
-                print(f"📖 正在读取用户规则文件: {rules_file}")
-                with open(rules_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    print(f"📄 文件内容长度: {len(content)} 字符")
-                    if content.strip():
-                        rules = json.loads(content)
-                        print(f"✅ 成功加载用户规则，包含 {len(rules)} 个主要配置项")
-                        return rules
-                    else:
-                        print(f"⚠️  规则文件为空")
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON解析错误: {e}")
-            except Exception as e:
-                print(f"❌ 加载用户规则失败: {e}")
-        else:
-            print(f"⚠️  用户 {username} 的规则文件不存在: {rules_file}")
+        """加载用户的默认规则（返回可修改的副本）"""
+        return copy.deepcopy(self._cached_user_rules(username))
+    
+    def _cached_user_rules(self, username: str) -> Dict[str, Any]:
+        """用户规则的共享只读版本：文件未变化时直接使用进程内缓存，不重新读取解析"""
+        rules = _read_rules_file(self._rules_file(username))
+        if rules is not None:
+            return rules
         
         # 如果用户规则文件不存在或损坏，创建一个默认的
-        print(f"🔧 为用户 {username} 创建默认规则文件")
+        print(f"⚠️  用户 {username} 的规则文件不存在或无法读取，创建默认规则文件")
         self.create_default_rules_for_new_user(username)
         
         # 重新尝试加载
-        if os.path.exists(rules_file):
-            try:
-                with open(rules_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"❌ 重新加载用户规则失败: {e}")
+        rules = _read_rules_file(self._rules_file(username))
+        if rules is not None:
+            return rules
         
         # 如果还是失败，返回系统默认规则
         print(f"🔄 返回系统默认规则")
         return self.get_default_rules()
     
     def save_user_rules(self, username: str, rules: Dict[str, Any]) -> bool:
-        """保存用户的默认规则"""
+        """保存用户的默认规则，并同步更新进程内缓存"""
         try:
-            rules_file = self.get_user_rules_file(username)
+            rules_file = os.path.abspath(self.get_user_rules_file(username))
             print(f"💾 正在保存用户规则到: {rules_file}")
             
-            with open(rules_file, 'w', encoding='utf-8') as f:
+            temp_file = rules_file + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(rules, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, rules_file)
+            
+            signature = _file_signature(rules_file)
+            with _rules_lock:
+                if signature is not None:
+                    _rules_cache[rules_file] = (signature, copy.deepcopy(rules))
+                else:
+                    _rules_cache.pop(rules_file, None)
             
             print(f"✅ 用户规则保存成功")
             return True
@@ -305,16 +348,10 @@ class DefaultRulesManager:
             print(f"🔧 为新用户 {username} 创建默认规则文件")
             
             # 获取模板规则 - 优先使用 dage 用户的规则，否则使用系统默认规则
-            template_rules = None
-            dage_rules_file = self.get_user_rules_file('dage')
-            
-            if os.path.exists(dage_rules_file):
-                try:
-                    with open(dage_rules_file, 'r', encoding='utf-8') as f:
-                        template_rules = json.load(f)
-                    print(f"✅ 使用 dage 用户的规则作为模板")
-                except Exception as e:
-                    print(f"⚠️  读取 dage 用户规则失败: {e}")
+            # dage 的规则经进程内缓存读取，只在其文件变化后重新解析
+            template_rules = _read_rules_file(self._rules_file('dage'))
+            if template_rules:
+                print(f"✅ 使用 dage 用户的规则作为模板")
             
             # 如果没有 dage 用户规则，使用系统默认规则
             if not template_rules:
@@ -500,7 +537,7 @@ class DefaultRulesManager:
     # -----------------------------
     def get_user_discount(self, username: str) -> float:
         """获取用户折扣（0-1），默认 1.0"""
-        rules = self.load_user_rules(username) or {}
+        rules = self._cached_user_rules(username) or {}
         pricing = rules.get("pricing", {}) or {}
         discount = pricing.get("discount", 1.0)
         try:
@@ -542,9 +579,8 @@ class DefaultRulesManager:
         """应用默认规则补全阀门信息 - 所有默认数据都从用户的default_rules.json中读取"""
         print(f"🔍 apply_default_rules 被调用: username={username}")
         
-        # 确保用户有默认规则文件
-        user_rules = self.load_user_rules(username)
-        print(f"📋 从用户规则文件加载的规则: {user_rules}")
+        # 确保用户有默认规则文件（经进程内缓存，文件未变化时不重新读取）
+        user_rules = self._cached_user_rules(username)
         
         # 识别产品类型
         product_type = valve_info.get('product_type', '')
@@ -608,4 +644,21 @@ class DefaultRulesManager:
         else:
             options["structure_forms"] = {}
         
-        return options
\ No newline at end of file
+        return options
+
+
+_managers: Dict[str, DefaultRulesManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_rules_manager(data_root: str = None) -> DefaultRulesManager:
+    """返回进程内共享的规则管理器（每个数据根目录一个实例）"""
+    if data_root is None:
+        data_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "merchant_data")
+    key = os.path.abspath(data_root)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = DefaultRulesManager(key)
+            _managers[key] = manager
+        return manager
@@ -2,10 +2,14 @@
 增强的报价处理器 - 集成改进的价格匹配功能
 """
 import os
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from typing import List
 from datetime import datetime
-from improved_price_matcher import ImprovedPriceMatcher
+from improved_price_matcher import ImprovedPriceMatcher, parse_quantity
+from unified_price_index import match_batch_multi
+from multi_company_models import MultiCompanyQuoteResult
 from csv_utils import safe_read_csv, safe_to_csv
 
 def process_quote_with_enhanced_matching(inquiry_file, price_file, output_file, username=None):
@@ -146,11 +150,11 @@ def generate_multi_brand_quote(inquiry_file, price_files, output_file, username=
         
         inquiry_df = standardize_inquiry_columns(inquiry_df)
         
-        # 为每个公司创建价格列
-        company_results = {}
+        # 加载各公司价格表
+        matchers = {}
         
         for company_name, price_file_path in price_files.items():
-            print(f"\n🏢 [MULTI] 处理公司: {company_name}")
+            print(f"\n🏢 [MULTI] 加载公司价格表: {company_name}")
             
             if not os.path.exists(price_file_path):
                 print(f"⚠️ [MULTI] 价格文件不存在: {price_file_path}")
@@ -163,116 +167,29 @@ def generate_multi_brand_quote(inquiry_file, price_files, output_file, username=
                 print(f"❌ [MULTI] {company_name} 价格表加载失败")
                 continue
             
-            # 为每行产品匹配价格
-            company_prices = []
-            company_totals = []
-            
-            for idx, row in inquiry_df.iterrows():
-                # 跳过合计行
-                if pd.isna(row.get('品名')) or str(row.get('品名')).strip() in ['合计', '总计', '']:
-                    company_prices.append('')
-                    company_totals.append('')
-                    continue
-                
-                product_name = str(row.get('品名', ''))
-                specification = str(row.get('规格型号', ''))
-                model_code = str(row.get('标准型号', ''))
-                quantity = row.get('数量', 1)
-                
-                # 匹配产品
-                match_result = matcher.match_product(product_name, specification, model_code)
-                
-                if match_result['success']:
-                    best_match = match_result['best_match']
-                    price = best_match['价格']
-                    company_prices.append(price)
-                    
-                    # 计算总价
-                    try:
-                        if not pd.isna(quantity) and quantity != '':
-                            qty = float(quantity)
-                            total = price * qty
-                        else:
-                            total = 0.0  # 数量为空时，总价设为0
-                        company_totals.append(total)
-                    except (ValueError, TypeError):
-                        company_totals.append(0.0)  # 计算失败时，总价设为0
-                else:
-                    company_prices.append('')
-                    company_totals.append('')
-            
-            company_results[company_name] = {
-                'prices': company_prices,
-                'totals': company_totals
-            }
-        
-        # 构建最终的报价表
-        result_df = inquiry_df.copy()
-        
-        # 添加各公司的价格和总价列
-        for company_name, data in company_results.items():
-            result_df[f'{company_name}_单价'] = data['prices']
-            result_df[f'{company_name}_总价'] = data['totals']
-        
-        # 添加最优价格列
-        price_columns = [f'{company}_单价' for company in company_results.keys()]
-        total_columns = [f'{company}_总价' for company in company_results.keys()]
-        
-        if price_columns:
-            # 计算最低单价
-            result_df['最低单价'] = result_df[price_columns].min(axis=1, skipna=True)
-            result_df['最低总价'] = result_df[total_columns].min(axis=1, skipna=True)
-            
-            # 标识最优供应商
-            best_suppliers = []
-            for idx, row in result_df.iterrows():
-                min_price = row['最低单价']
-                best_supplier = ''
-                
-                if not pd.isna(min_price) and min_price > 0:
-                    for company in company_results.keys():
-                        if row[f'{company}_单价'] == min_price:
-                            best_supplier = company
-                            break
-                
-                best_suppliers.append(best_supplier)
-            
-            result_df['最优供应商'] = best_suppliers
-        
-        # 添加合计行
-        summary_row = {'品名': '合计'}
+            matchers[company_name] = matcher
         
-        for company_name in company_results.keys():
-            total_col = f'{company_name}_总价'
-            if total_col in result_df.columns:
-                total = result_df[total_col].sum(skipna=True)
-                summary_row[total_col] = total
+        # 在合并索引上整表匹配，每个询价行一次查找得到各公司的最佳行
+        results = match_batch_multi(matchers, inquiry_df)
+        companies = list(results.keys())
         
-        if '最低总价' in result_df.columns:
-            summary_row['最低总价'] = result_df['最低总价'].sum(skipna=True)
+        # 询价行 × 公司 的单价矩阵，合计行和未匹配行为 NaN
+        matched = np.column_stack([results[company]["位置"] >= 0 for company in companies]) if companies \
+            else np.zeros((len(inquiry_df), 0), dtype=bool)
+        price_matrix = np.full(matched.shape, np.nan)
+        for j, company_name in enumerate(companies):
+            price_matrix[:, j] = np.where(matched[:, j], results[company_name]["价格"], np.nan)
         
-        # 添加合计行
-        summary_df = pd.DataFrame([summary_row])
-        result_df = pd.concat([result_df, summary_df], ignore_index=True)
-        
-        # 保存结果
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        
-        if output_file.endswith('.csv'):
-            safe_to_csv(result_df, output_file)
-        else:
-            result_df.to_excel(output_file, index=False, engine='openpyxl')
+        result_df = build_comparison_frame(inquiry_df, companies, price_matrix, matched)
+        save_quote_frame(result_df, output_file)
         
         print(f"✅ [MULTI] 多品牌报价处理完成，结果保存到: {output_file}")
         
         # 打印统计信息
         print(f"📊 [MULTI] 处理统计:")
-        print(f"   参与公司数: {len(company_results)}")
-        for company_name in company_results.keys():
-            total_col = f'{company_name}_总价'
-            if total_col in result_df.columns:
-                company_total = result_df[total_col].sum(skipna=True)
-                print(f"   {company_name}总价: ¥{company_total:.2f}")
+        print(f"   参与公司数: {len(companies)}")
+        for company_name in companies:
+            print(f"   {company_name}总价: ¥{result_df[f'{company_name}_总价'].iloc[-1]:.2f}")
         
         return output_file
         
@@ -280,4 +197,64 @@ def generate_multi_brand_quote(inquiry_file, price_files, output_file, username=
         print(f"❌ [MULTI] 多品牌报价处理失败: {str(e)}")
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
+
+
+def build_comparison_frame(inquiry_df: pd.DataFrame, companies, price_matrix: np.ndarray, matched: np.ndarray) -> pd.DataFrame:
+    """由 询价行 × 公司 的单价矩阵生成价格对比表
+
+    各公司单价/总价列未匹配时留空；最低单价、最低总价、最优供应商按矩阵向量化计算；末尾追加合计行。
+    """
+    quantities = inquiry_df['数量'].map(parse_quantity).to_numpy(dtype=float) if '数量' in inquiry_df.columns else 1.0
+    total_matrix = price_matrix * np.reshape(quantities, (-1, 1))
+    
+    result_df = inquiry_df.copy()
+    
+    # 添加各公司的价格和总价列（未匹配留空）
+    for j, company_name in enumerate(companies):
+        result_df[f'{company_name}_单价'] = np.where(matched[:, j], price_matrix[:, j].astype(object), '')
+        result_df[f'{company_name}_总价'] = np.where(matched[:, j], total_matrix[:, j].astype(object), '')
+    
+    if len(companies):
+        # 最低单价/总价：fmin 忽略 NaN 按行取最小，全部未匹配时为 NaN
+        min_prices = np.fmin.reduce(price_matrix, axis=1)
+        result_df['最低单价'] = min_prices
+        result_df['最低总价'] = np.fmin.reduce(total_matrix, axis=1)
+        
+        # 最优供应商：最低单价大于 0 时取报该价的第一家公司
+        best_positions = np.argmax(price_matrix == min_prices[:, None], axis=1)
+        result_df['最优供应商'] = np.where(min_prices > 0, np.asarray(companies, dtype=object)[best_positions], '')
+    
+    # 添加合计行
+    summary_row = {'品名': '合计'}
+    for j, company_name in enumerate(companies):
+        summary_row[f'{company_name}_总价'] = np.nansum(total_matrix[:, j])
+    if '最低总价' in result_df.columns:
+        summary_row['最低总价'] = result_df['最低总价'].sum(skipna=True)
+    
+    return pd.concat([result_df, pd.DataFrame([summary_row])], ignore_index=True)
+
+
+def write_multi_company_quote(inquiry_df: pd.DataFrame, quote_result: MultiCompanyQuoteResult, companies: List[str],
+                              output_file: str) -> str:
+    """把 MultiCompanyMatcher 的聚合结果写成价格对比报价单（格式与 generate_multi_brand_quote 相同）"""
+    column_of = {company: j for j, company in enumerate(companies)}
+    price_matrix = np.full((len(inquiry_df), len(companies)), np.nan)
+    for info in quote_result.aggregated_prices:
+        for company, match in info.company_prices.items():
+            price_matrix[info.row_index, column_of[company]] = match.price
+    
+    result_df = build_comparison_frame(inquiry_df, companies, price_matrix, ~np.isnan(price_matrix))
+    save_quote_frame(result_df, output_file)
+    print(f"✅ [MULTI] 多公司报价单已保存: {output_file}")
+    return output_file
+
+
+def save_quote_frame(result_df: pd.DataFrame, output_file: str):
+    """按扩展名保存报价单（.csv 或 Excel）"""
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    
+    if output_file.endswith('.csv'):
+        safe_to_csv(result_df, output_file)
+    else:
+        result_df.to_excel(output_file, index=False, engine='openpyxl')
@@ -5,6 +5,10 @@ import re
 import shutil
 from pathlib import Path
 from csv_utils import safe_read_csv, safe_to_csv
+from price_table_index import build_dn_buckets, parse_dn
+
+_SPEC_DN_PATTERN = re.compile(r'DN(\d+)')
+_SPEC_DN_PART_PATTERN = re.compile(r'(?:^|、)(DN[^、]*)')
 
 # 定义文件路径
 price_file = './规范后的价格对照表数据/价格.csv'
@@ -20,7 +24,7 @@ def extract_dn_value(spec):
         return ""
         
     # 尝试匹配 DN 值，如 DN50 或 DN50、PN10
-    dn_match = re.search(r'DN(\d+)', spec)
+    dn_match = _SPEC_DN_PATTERN.search(spec)
     if dn_match:
         return f"DN{dn_match.group(1)}"
     
@@ -32,6 +36,14 @@ def extract_dn_value(spec):
             
     return ""
 
+def extract_dn_series(specs):
+    """extract_dn_value 的整列版本：对整列规格各做一次 str.extract，结果逐行相同"""
+    text = specs.where(specs.notna(), '').astype(str)
+    dn = 'DN' + text.str.extract(_SPEC_DN_PATTERN.pattern, expand=False)
+    # 没有“DN数字”时取第一个以 DN 开头的“、”分段
+    part = text.str.extract(_SPEC_DN_PART_PATTERN.pattern, expand=False)
+    return dn.fillna(part).fillna('').astype(object)
+
 def standardize_model_code(model_code):
     """标准化型号代码，去除空格和其他干扰字符"""
     if pd.isna(model_code) or model_code == "":
@@ -45,22 +57,32 @@ def standardize_model_code(model_code):
     
     return model_code
 
-def match_model(std_model, spec, price_df):
-    """根据标准型号和规格匹配价格表中的条目"""
+def match_model(std_model, spec, price_df, dn_buckets=None, dn_value=None):
+    """根据标准型号和规格匹配价格表中的条目
+
+    dn_buckets: 价格表规格列的 DN 分桶（build_dn_buckets），批量匹配时预先构建一次
+    dn_value: 询价表整列预先解析的 DN（extract_dn_series），未给出时从 spec 解析
+    """
     if pd.isna(std_model) or std_model == "":
         return None, None
     
     std_model = standardize_model_code(std_model)
     
     # 从规格中提取 DN 值
-    dn_value = extract_dn_value(spec)
+    if dn_value is None:
+        dn_value = extract_dn_value(spec)
     if not dn_value:
         return None, None
     
+    # 只在规格DN相同的分桶内查找
+    if dn_buckets is None:
+        dn_buckets = build_dn_buckets(price_df['规格'])
+    dn_num = parse_dn(dn_value)
+    dn_rows = price_df.iloc[dn_buckets.get(dn_num, [])] if dn_num is not None else price_df.iloc[0:0]
+    
     # 查找匹配的型号和规格
     # 第一种方法：尝试直接匹配标准型号部分（如Z41X-16Q）
-    matching_prices = price_df[(price_df['型号'].str.contains(std_model, regex=False, na=False)) & 
-                              (price_df['规格'] == dn_value)]
+    matching_prices = dn_rows[dn_rows['型号'].str.contains(std_model, regex=False, na=False)]
     
     # 如果没找到，尝试更宽松的匹配方式
     if matching_prices.empty:
@@ -68,16 +90,14 @@ def match_model(std_model, spec, price_df):
         key_part_match = re.search(r'([A-Z0-9]+[-][A-Z0-9]+)', std_model)
         if key_part_match:
             key_part = key_part_match.group(1)
-            matching_prices = price_df[(price_df['型号'].str.contains(key_part, regex=False, na=False)) & 
-                                     (price_df['规格'] == dn_value)]
+            matching_prices = dn_rows[dn_rows['型号'].str.contains(key_part, regex=False, na=False)]
     
     # 如果仍然没找到，尝试匹配型号中的主要部分（如Z41X）
     if matching_prices.empty:
         base_model_match = re.search(r'([A-Z]+\d+[A-Z]+)', std_model)
         if base_model_match:
             base_model = base_model_match.group(1)
-            matching_prices = price_df[(price_df['型号'].str.contains(base_model, regex=False, na=False)) & 
-                                     (price_df['规格'] == dn_value)]
+            matching_prices = dn_rows[dn_rows['型号'].str.contains(base_model, regex=False, na=False)]
     
     if not matching_prices.empty:
         # 如果有多个品牌，返回所有品牌的价格
@@ -125,6 +145,12 @@ def process_inquiry_file(file_path, price_df):
         
         print(f"📋 [DEBUG] 添加报价列完成")
         
+        # 价格表按规格DN分桶，只构建一次
+        dn_buckets = build_dn_buckets(price_df['规格'])
+        # 询价表规格列的 DN 整列解析一次
+        dn_values = extract_dn_series(inquiry_df['规格型号']) if '规格型号' in inquiry_df.columns \
+            else pd.Series('', index=inquiry_df.index, dtype=object)
+        
         # 遍历每一行
         for idx, row in inquiry_df.iterrows():
             print(f"\n🔍 [DEBUG] 处理第 {idx+1} 行:")
@@ -136,7 +162,7 @@ def process_inquiry_file(file_path, price_df):
             print(f"   规格型号: '{spec}'")
             print(f"   标准型号: '{std_model}'")
             
-            matched_model, prices = match_model(std_model, spec, price_df)
+            matched_model, prices = match_model(std_model, spec, price_df, dn_buckets, dn_values[idx])
             
             print(f"🔍 [DEBUG] 匹配结果:")
             print(f"   匹配型号: {matched_model}")
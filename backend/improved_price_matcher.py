@@ -1,35 +1,89 @@
 """
 改进的价格匹配器 - 根据价格表中的型号、规格、品牌、价格来匹配产品并生成总价
 """
+import copy
+import numpy as np
 import pandas as pd
 import re
 from typing import Dict, List, Optional, Tuple
 from csv_utils import safe_read_csv, safe_to_csv
+from price_table_cache import load_price_table_index
+from price_table_index import PriceTableIndex, normalize_text, parse_dn, parse_dn_series
+from match_result_cache import match_result_cache
+from keyword_automaton import KeywordAutomaton
+
+# 常见的阀门类型关键词（按提取顺序排列）
+VALVE_TYPE_KEYWORDS = [
+    '球阀', '闸阀', '截止阀', '止回阀', '蝶阀', '调节阀', '安全阀', '减压阀',
+    '电磁阀', '针型阀', '隔膜阀', '旋塞阀', '柱塞阀', '排气阀', '排泥阀'
+]
+_VALVE_TYPE_AUTOMATON = KeywordAutomaton(VALVE_TYPE_KEYWORDS)
+
+def parse_quantity(quantity) -> float:
+    """数量转为浮点数，为空或格式错误时返回 0"""
+    try:
+        if pd.isna(quantity) or quantity == '':
+            return 0.0
+        return float(quantity)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def empty_batch_result(n: int) -> Dict[str, np.ndarray]:
+    """match_batch 的空结果：价格 NaN、位置 -1 表示未匹配"""
+    return {
+        "价格": np.full(n, np.nan),
+        "型号": np.full(n, '', dtype=object),
+        "规格": np.full(n, '', dtype=object),
+        "品牌": np.full(n, '', dtype=object),
+        "匹配类型": np.full(n, '', dtype=object),
+        "置信度": np.zeros(n),
+        "位置": np.full(n, -1, dtype=np.int64),
+    }
+
+
+def tri_match_confidence(score: int) -> float:
+    """三匹配得分对应的置信度"""
+    return 0.95 if score >= 15 else 0.8
+
+
+def normalized_query(product_name: str, dn_value: str, model_code: str, selected_brand: Optional[str]) -> tuple:
+    """匹配结果缓存键中的查询部分
+
+    只做不改变匹配结果的归一化：品名去首尾空格并转小写，规格取解析出的 DN，
+    型号去首尾空格（回退策略按正则包含匹配，保留大小写），品牌与三匹配同样归一化。
+    """
+    name = str(product_name).strip().lower() if product_name else None
+    model = str(model_code).strip() if model_code else None
+    brand = normalize_text(selected_brand) if selected_brand else ''
+    return (name, parse_dn(dn_value) if dn_value else None, model, brand)
+
+
+def _first_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """取列；列名重复（多个原始列映射到同一标准列名）时取第一列"""
+    column = df[col]
+    return column.iloc[:, 0] if isinstance(column, pd.DataFrame) else column
+
 
 class ImprovedPriceMatcher:
     """改进的价格匹配器"""
     
     def __init__(self):
         self.price_df = None
+        self.index = None
         self.brand_columns = []
         
     def load_price_table(self, price_file_path: str) -> bool:
         """加载价格表，支持 .csv / .xlsx / .xls"""
         try:
-            file_lower = str(price_file_path).lower()
-            if file_lower.endswith((".xlsx", ".xls")):
-                # 直接读取Excel
-                self.price_df = pd.read_excel(price_file_path, engine="openpyxl")
-            else:
-                # 默认按CSV读取（含自动编码探测）
-                self.price_df = safe_read_csv(price_file_path)
+            # 经共享缓存取得标准化列名后的价格表及其索引（归一化列、品牌分区、DN 分桶），
+            # 同一文件的索引在请求之间复用，price_df 只读共享
+            self.index = load_price_table_index(price_file_path, standardize=self._standardize_columns)
+            self.price_df = self.index.price_df
 
             print(f"📊 [MATCHER] 成功加载价格表: {len(self.price_df)} 行数据")
             print(f"📋 [MATCHER] 价格表列名: {list(self.price_df.columns)}")
 
-            # 标准化列名
-            self.price_df = self._standardize_columns(self.price_df)
-
             # 识别品牌列
             self._identify_brand_columns()
 
@@ -100,6 +154,18 @@ class ImprovedPriceMatcher:
         # 提取DN值
         dn_value = self._extract_dn_value(specification)
         print(f"   提取的DN值: '{dn_value}'")
+
+        cache_key = ('product',) + self._query_key(product_name, dn_value, model_code, selected_brand)
+        hit, cached = match_result_cache.lookup(cache_key)
+        if hit:
+            print(f"♻️ [MATCHER] 命中匹配结果缓存")
+            return copy.deepcopy(cached)
+        result = self._match_product_uncached(product_name, model_code, selected_brand, dn_value)
+        match_result_cache.put(cache_key, copy.deepcopy(result))
+        return result
+
+    def _match_product_uncached(self, product_name: str, model_code: str, selected_brand: Optional[str], dn_value: str) -> Dict:
+        """match_product 的实际匹配（不经结果缓存）"""
         # 优先：三匹配评分（型号+名称+品牌），并在有DN时限定规格
         tri_result = self._tri_match(product_name, model_code, selected_brand, dn_value)
         if tri_result:
@@ -120,96 +186,138 @@ class ImprovedPriceMatcher:
         print(f"❌ [MATCHER] 未找到匹配项")
         return {"success": False, "error": "未找到匹配的产品"}
 
-    def _tri_match(self, product_name: str, model_code: str, selected_brand: Optional[str], dn_value: str) -> Optional[Dict]:
-        import re
-        def normalize(s: Optional[str]) -> str:
-            if pd.isna(s) or s is None:
-                return ""
-            return re.sub(r"\s+", "", str(s)).lower()
-
-        # 识别列
-        model_col = '型号' if '型号' in self.price_df.columns else None
-        name_col = None
-        for c in ['产品名称', '品名', '名称', '项目名称', '物料名称']:
-            if c in self.price_df.columns:
-                name_col = c
-                break
-        brand_col = '品牌' if '品牌' in self.price_df.columns else None
-        spec_col = '规格' if '规格' in self.price_df.columns else None
-
-        q_model = normalize(model_code)
-        q_name = normalize(product_name)
-        q_brand = normalize(selected_brand) if selected_brand else ''
-
-        # 候选集（按品牌过滤）
-        price_rows = self.price_df
-        if q_brand and brand_col:
-            price_rows = price_rows[price_rows[brand_col].apply(lambda x: normalize(x) == q_brand)]
-
-        # 规格限定（有DN时约束）
-        if dn_value and spec_col:
-            dn_num = dn_value.replace('DN', '')
-            price_rows = price_rows[price_rows[spec_col].astype(str).str.contains(dn_num, case=False, na=False)]
-
-        best_score = 0
-        best_row = None
-        for _, prow in price_rows.iterrows():
-            p_model = normalize(prow.get(model_col, '')) if model_col else ''
-            p_name = normalize(prow.get(name_col, '')) if name_col else ''
-            p_brand = normalize(prow.get(brand_col, '')) if brand_col else ''
-            score = 0
-            # 型号
-            if q_model and p_model and q_model == p_model:
-                score += 10
-            elif q_model and p_model and (q_model in p_model or p_model in q_model):
-                score += 6
-            # 名称
-            if q_name and p_name and q_name == p_name:
-                score += 5
-            elif q_name and p_name and (q_name in p_name or p_name in q_name):
-                score += 3
-            # 品牌
-            if q_brand and p_brand and q_brand == p_brand:
-                score += 2
-            elif q_brand and p_brand and (q_brand in p_brand or p_brand in q_brand):
-                score += 1
-
-            if score > best_score:
-                best_score = score
-                best_row = prow
-
-        if best_row is not None and best_score > 0:
-            return self._create_match_info(best_row, "三匹配", 0.95 if best_score >= 15 else 0.8)
+    def match_batch(self, inquiry_df: pd.DataFrame, name_col: str = '品名', spec_col: str = '规格型号',
+                    model_col: str = '标准型号', selected_brand: Optional[str] = None,
+                    skip_summary_rows: bool = True) -> Dict[str, np.ndarray]:
+        """整表匹配：结果与逐行调用 match_product 的 best_match 一致
+
+        DN 按整列解析，相同 (品名, DN, 型号) 的行只匹配一次，不输出逐行调试信息。
+        返回与 inquiry_df 行对齐的数组：价格（未匹配为 NaN）、型号、规格、品牌、
+        匹配类型、置信度，以及价格表行位置（未匹配为 -1）。
+        skip_summary_rows: 跳过品名为空或为“合计/总计”的行（不参与匹配）
+        """
+        keys = self._batch_keys(inquiry_df, name_col, spec_col, model_col, skip_summary_rows)
+        result = empty_batch_result(len(inquiry_df))
+        if self.price_df is None:
+            return result
+
+        resolved: Dict[Tuple, Optional[Tuple[int, str, float]]] = {}
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            if key not in resolved:
+                name, dn_value, model = key
+                cache_key = ('best',) + self._query_key(name, dn_value, model, selected_brand)
+                hit, resolved[key] = match_result_cache.lookup(cache_key)
+                if not hit:
+                    resolved[key] = self._best_position(name, model, selected_brand, dn_value)
+                    match_result_cache.put(cache_key, resolved[key])
+            hit = resolved[key]
+            if hit is not None:
+                result["位置"][i], result["匹配类型"][i], result["置信度"][i] = hit
+
+        self._fill_batch_result(result)
+        active = sum(key is not None for key in keys)
+        print(f"📊 [MATCHER] 批量匹配完成: {int((result['位置'] >= 0).sum())}/{active} 行命中，"
+              f"去重后实际匹配 {len(resolved)} 次")
+        return result
+
+    @classmethod
+    def _batch_keys(cls, inquiry_df: pd.DataFrame, name_col: str, spec_col: str, model_col: str,
+                    skip_summary_rows: bool = True) -> List[Optional[Tuple[str, str, str]]]:
+        """每行询价的匹配键 (品名, DN, 型号)；DN 按整列解析，不参与匹配的行为 None"""
+        n = len(inquiry_df)
+        if n == 0:
+            return []
+
+        def text_column(col: str) -> pd.Series:
+            if col in inquiry_df.columns:
+                return _first_column(inquiry_df, col).map(str)
+            return pd.Series('', index=inquiry_df.index)
+
+        names = text_column(name_col)
+        models = text_column(model_col)
+        dns = parse_dn_series(text_column(spec_col))
+        active = ~cls._summary_row_mask(inquiry_df, name_col) if skip_summary_rows else np.ones(n, dtype=bool)
+        return [
+            (name, '' if pd.isna(dn) else f"DN{int(dn)}", model) if active[i] else None
+            for i, (name, dn, model) in enumerate(zip(names, dns, models))
+        ]
+
+    def _fill_batch_result(self, result: Dict[str, np.ndarray]):
+        """按已确定的价格表行位置填入型号、规格、品牌和价格"""
+        matched = result["位置"] >= 0
+        if matched.any():
+            rows = self.price_df.iloc[result["位置"][matched]]
+            for key in ("型号", "规格", "品牌"):
+                values = rows[key].map(str).to_numpy(dtype=object) if key in rows.columns else np.full(len(rows), '', dtype=object)
+                result[key][matched] = values
+            result["价格"][matched] = [self._extract_price(row) for _, row in rows.iterrows()]
+
+    def _query_key(self, product_name: str, dn_value: str, model_code: str, selected_brand: Optional[str]) -> tuple:
+        """匹配结果缓存键：价格表版本号 + 归一化查询（见 normalized_query）"""
+        return (self._get_index().version,) + normalized_query(product_name, dn_value, model_code, selected_brand)
+
+    @staticmethod
+    def _summary_row_mask(inquiry_df: pd.DataFrame, name_col: str) -> np.ndarray:
+        """品名为空或为“合计/总计”的行"""
+        if name_col not in inquiry_df.columns:
+            return np.ones(len(inquiry_df), dtype=bool)
+        names = _first_column(inquiry_df, name_col)
+        return (names.isna() | names.map(str).str.strip().isin(['合计', '总计', ''])).to_numpy()
+
+    def _best_position(self, product_name: str, model_code: str, selected_brand: Optional[str],
+                       dn_value: str) -> Optional[Tuple[int, str, float]]:
+        """match_product 的 best_match 对应的 (价格表行位置, 匹配类型, 置信度)，不构建候选列表"""
+        tri = self._get_index().best_match(model_code, product_name, selected_brand, dn_value)
+        if tri is not None:
+            position, score = tri
+            return position, "三匹配", tri_match_confidence(score)
+        return self._fallback_position(product_name, model_code, dn_value)
+
+    def _fallback_position(self, product_name: str, model_code: str, dn_value: str) -> Optional[Tuple[int, str, float]]:
+        """三匹配落空时的回退策略，返回 (价格表行位置, 匹配类型, 置信度)"""
+        # 回退策略按置信度依次为：型号 0.9 > 规格 0.7 > 关键词 0.5，各自取第一条
+        index = self._get_index()
+        positions = index.dn_positions(dn_value) if dn_value else np.arange(len(self.price_df))
+        models = self.price_df['型号'].iloc[positions] if '型号' in self.price_df.columns else None
+        if model_code and models is not None:
+            hits = np.flatnonzero(models.str.contains(str(model_code).strip(), case=False, na=False).to_numpy())
+            if hits.size:
+                return int(positions[hits[0]]), "型号精确匹配", 0.9
+        if dn_value and positions.size:
+            return int(positions[0]), "规格匹配", 0.7
+        if product_name and models is not None:
+            for keyword in self._extract_product_keywords(product_name):
+                if len(keyword) >= 2:
+                    hits = np.flatnonzero(models.str.contains(keyword, case=False, na=False).to_numpy())
+                    if hits.size:
+                        return int(positions[hits[0]]), f"关键词匹配({keyword})", 0.5
         return None
+
+    def _tri_match(self, product_name: str, model_code: str, selected_brand: Optional[str], dn_value: str) -> Optional[Dict]:
+        """三匹配评分（型号+名称+品牌），有DN时限定规格；打分由预建索引向量化完成"""
+        result = self._get_index().best_match(model_code, product_name, selected_brand, dn_value)
+        if result is None:
+            return None
+        position, best_score = result
+        best_row = self.price_df.iloc[position]
+        return self._create_match_info(best_row, "三匹配", tri_match_confidence(best_score))
+    
+    def _get_index(self) -> PriceTableIndex:
+        """返回价格表索引（price_df 被直接赋值时按需构建）"""
+        if self.index is None or self.index.price_df is not self.price_df:
+            self.index = PriceTableIndex(self.price_df)
+        return self.index
+
+    def _dn_rows(self, dn_value: str) -> pd.DataFrame:
+        """取规格DN与 dn_value 相同的价格表行（来自预建DN分桶）"""
+        return self.price_df.iloc[self._get_index().dn_positions(dn_value)]
     
     def _extract_dn_value(self, specification: str) -> str:
-        """提取DN值"""
-        if pd.isna(specification) or not specification:
-            return ""
-        
-        spec_str = str(specification).upper()
-        
-        # 匹配DN后面的数字
-        patterns = [
-            r'DN\s*(\d+)',
-            r'φ\s*(\d+)',
-            r'Φ\s*(\d+)',
-            r'∅\s*(\d+)',
-            r'直径\s*(\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, spec_str)
-            if match:
-                return f"DN{match.group(1)}"
-        
-        # 如果没有找到DN，尝试提取纯数字
-        numbers = re.findall(r'\d+', spec_str)
-        if numbers:
-            # 取第一个数字作为DN值
-            return f"DN{numbers[0]}"
-        
-        return ""
+        """提取DN值（如“DN50”），解析规则同价格表索引的 parse_dn"""
+        dn = parse_dn(specification)
+        return f"DN{dn}" if dn is not None else ""
     
     def _match_by_model(self, model_code: str, dn_value: str) -> List[Dict]:
         """根据型号匹配"""
@@ -220,16 +328,14 @@ class ImprovedPriceMatcher:
         
         model_code = str(model_code).strip()
         
+        # 有DN时只在对应DN分桶内查找
+        candidates = self._dn_rows(dn_value) if dn_value else self.price_df
+        
         # 精确匹配
-        exact_matches = self.price_df[
-            self.price_df['型号'].str.contains(model_code, case=False, na=False)
+        exact_matches = candidates[
+            candidates['型号'].str.contains(model_code, case=False, na=False)
         ]
         
-        if dn_value:
-            exact_matches = exact_matches[
-                exact_matches['规格'].str.contains(dn_value.replace('DN', ''), case=False, na=False)
-            ]
-        
         for _, row in exact_matches.iterrows():
             match_info = self._create_match_info(row, "型号精确匹配", 0.9)
             matches.append(match_info)
@@ -243,12 +349,8 @@ class ImprovedPriceMatcher:
         if not dn_value:
             return matches
         
-        dn_number = dn_value.replace('DN', '')
-        
-        # 匹配规格列中包含相同DN值的记录
-        spec_matches = self.price_df[
-            self.price_df['规格'].str.contains(dn_number, case=False, na=False)
-        ]
+        # 规格DN相同的记录（DN分桶）
+        spec_matches = self._dn_rows(dn_value)
         
         for _, row in spec_matches.iterrows():
             match_info = self._create_match_info(row, "规格匹配", 0.7)
@@ -266,18 +368,15 @@ class ImprovedPriceMatcher:
         # 提取产品名称中的关键词
         keywords = self._extract_product_keywords(product_name)
         
+        # 有DN时只在对应DN分桶内查找
+        candidates = self._dn_rows(dn_value) if dn_value else self.price_df
+        
         for keyword in keywords:
             if len(keyword) >= 2:  # 只考虑长度>=2的关键词
-                keyword_matches = self.price_df[
-                    self.price_df['型号'].str.contains(keyword, case=False, na=False)
+                keyword_matches = candidates[
+                    candidates['型号'].str.contains(keyword, case=False, na=False)
                 ]
                 
-                if dn_value:
-                    dn_number = dn_value.replace('DN', '')
-                    keyword_matches = keyword_matches[
-                        keyword_matches['规格'].str.contains(dn_number, case=False, na=False)
-                    ]
-                
                 for _, row in keyword_matches.iterrows():
                     match_info = self._create_match_info(row, f"关键词匹配({keyword})", 0.5)
                     matches.append(match_info)
@@ -289,19 +388,10 @@ class ImprovedPriceMatcher:
         if not product_name:
             return []
         
-        # 常见的阀门类型关键词
-        valve_types = [
-            '球阀', '闸阀', '截止阀', '止回阀', '蝶阀', '调节阀', '安全阀', '减压阀',
-            '电磁阀', '针型阀', '隔膜阀', '旋塞阀', '柱塞阀', '排气阀', '排泥阀'
-        ]
-        
-        keywords = []
         product_name_str = str(product_name)
         
-        # 提取阀门类型
-        for valve_type in valve_types:
-            if valve_type in product_name_str:
-                keywords.append(valve_type)
+        # 一次扫描提取名称中出现的阀门类型
+        keywords = list(_VALVE_TYPE_AUTOMATON.find(product_name_str))
         
         # 提取型号相关的字母数字组合
         model_patterns = re.findall(r'[A-Z]+\d*[A-Z]*', product_name_str.upper())
@@ -367,58 +457,25 @@ class ImprovedPriceMatcher:
         """处理询价表并计算总价"""
         print(f"📊 [MATCHER] 开始处理询价表: {len(inquiry_df)} 行数据")
         
-        # 添加匹配结果列
-        inquiry_df['匹配型号'] = ''
-        inquiry_df['匹配规格'] = ''
-        inquiry_df['匹配品牌'] = ''
-        inquiry_df['匹配价格'] = 0.0
-        inquiry_df['单价'] = 0.0
-        inquiry_df['总价'] = 0.0
-        inquiry_df['匹配状态'] = ''
-        
-        for idx, row in inquiry_df.iterrows():
-            # 跳过合计行
-            if pd.isna(row.get('品名')) or str(row.get('品名')).strip() in ['合计', '总计', '']:
-                continue
-            
-            product_name = str(row.get('品名', ''))
-            specification = str(row.get('规格型号', ''))
-            model_code = str(row.get('标准型号', ''))
-            quantity = row.get('数量', 1)
-            
-            # 匹配产品
-            match_result = self.match_product(product_name, specification, model_code)
-            
-            if match_result['success']:
-                best_match = match_result['best_match']
-                
-                # 填充匹配信息
-                inquiry_df.at[idx, '匹配型号'] = best_match['型号']
-                inquiry_df.at[idx, '匹配规格'] = best_match['规格']
-                inquiry_df.at[idx, '匹配品牌'] = best_match['品牌']
-                inquiry_df.at[idx, '匹配价格'] = best_match['价格']
-                inquiry_df.at[idx, '单价'] = best_match['价格']
-                inquiry_df.at[idx, '匹配状态'] = f"成功({best_match['匹配类型']})"
-                
-                # 计算总价
-                try:
-                    if not pd.isna(quantity) and quantity != '':
-                        qty = float(quantity)
-                        total_price = best_match['价格'] * qty
-                        inquiry_df.at[idx, '总价'] = total_price
-                        print(f"✅ [MATCHER] 第{idx+1}行: {product_name} -> {best_match['型号']} (¥{best_match['价格']} × {qty} = ¥{total_price})")
-                    else:
-                        # 数量为空时，总价设为0
-                        inquiry_df.at[idx, '总价'] = 0.0
-                        print(f"✅ [MATCHER] 第{idx+1}行: {product_name} -> {best_match['型号']} (¥{best_match['价格']}, 数量为空)")
-                except (ValueError, TypeError):
-                    # 数量格式错误时，总价设为0
-                    inquiry_df.at[idx, '总价'] = 0.0
-                    print(f"⚠️ [MATCHER] 第{idx+1}行: 数量格式错误，总价设为0")
-            else:
-                inquiry_df.at[idx, '匹配状态'] = '未匹配'
-                print(f"❌ [MATCHER] 第{idx+1}行: {product_name} -> 未找到匹配")
-        
+        # 整表匹配，结果按列写入
+        result = self.match_batch(inquiry_df)
+        matched = result["位置"] >= 0
+
+        quantities = inquiry_df['数量'].map(parse_quantity) if '数量' in inquiry_df.columns else 1.0
+        prices = np.where(matched, result["价格"], 0.0)
+
+        inquiry_df['匹配型号'] = result["型号"]
+        inquiry_df['匹配规格'] = result["规格"]
+        inquiry_df['匹配品牌'] = result["品牌"]
+        inquiry_df['匹配价格'] = prices
+        inquiry_df['单价'] = prices
+        # 数量为空或格式错误时总价为 0
+        inquiry_df['总价'] = np.where(matched, prices * np.asarray(quantities, dtype=float), 0.0)
+        # 合计行不参与匹配，状态留空
+        inquiry_df['匹配状态'] = np.where(
+            matched, "成功(" + result["匹配类型"] + ")",
+            np.where(self._summary_row_mask(inquiry_df, '品名'), '', '未匹配'))
+
         # 添加合计行
         total_amount = inquiry_df['总价'].sum(skipna=True)
         summary_row = {
@@ -0,0 +1,106 @@
+"""
+多关键词自动机（Aho-Corasick）- 一次扫描找出文本中出现的全部关键词
+
+阀门材质/产品类型识别、价格匹配的产品关键词、询价表品牌提取原先都对每个关键词
+单独做一次子串查找。自动机在模块加载时按关键词表构建一次，之后每段文本只需从头到尾
+走一遍；命中结果按关键词表中的顺序返回，调用方在命中集合上按原有优先级取值。
+"""
+import re
+from collections import deque
+from itertools import product
+from typing import Iterable, Iterator, List, Tuple
+
+
+def _case_variants(keyword: str) -> List[str]:
+    """关键词中 ASCII 字母的全部大小写组合"""
+    choices = [(ch.lower(), ch.upper()) if ch.isascii() and ch.isalpha() else (ch,) for ch in keyword]
+    return [''.join(chars) for chars in product(*choices)]
+
+
+class KeywordAutomaton:
+    """关键词表上的 Aho-Corasick 自动机
+
+    case_insensitive 中的关键词忽略 ASCII 大小写（相当于在小写后的文本中查找），其余关键词区分大小写。
+    """
+
+    __slots__ = ('keywords', '_goto', '_fail', '_output', '_start')
+
+    def __init__(self, keywords: Iterable[str], case_insensitive: Iterable[str] = ()):
+        self.keywords: Tuple[str, ...] = tuple(dict.fromkeys(k for k in keywords if k))
+        case_insensitive = set(case_insensitive)
+        self._goto: List[dict] = [{}]
+        outputs: List[set] = [set()]
+
+        for index, keyword in enumerate(self.keywords):
+            for variant in (_case_variants(keyword) if keyword in case_insensitive else (keyword,)):
+                state = 0
+                for ch in variant:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        outputs.append(set())
+                    state = nxt
+                outputs[state].add(index)
+
+        # 按层次遍历建立失配指针，并把失配状态的输出并入当前状态
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                outputs[nxt] |= outputs[self._fail[nxt]]
+        self._output: List[Tuple[int, ...]] = [tuple(sorted(indices)) for indices in outputs]
+
+        # 在初始状态下直接跳到下一个可能开始关键词的字符
+        first_chars = ''.join(self._goto[0])
+        self._start = re.compile(f"[{re.escape(first_chars)}]") if first_chars else None
+
+    def _scan(self, text: str) -> List[Tuple[int, Tuple[int, ...]]]:
+        """单遍扫描，返回 [(结束位置, 在该位置结束的关键词下标)]"""
+        ended = []
+        if self._start is None or not text:
+            return ended
+        goto, fail, output = self._goto, self._fail, self._output
+        search = self._start.search
+        state = 0
+        position = 0
+        length = len(text)
+        while position < length:
+            if not state:
+                match = search(text, position)
+                if match is None:
+                    break
+                position = match.start()
+            ch = text[position]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            position += 1
+            if output[state]:
+                ended.append((position, output[state]))
+        return ended
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """依次给出每个命中的 (结束位置, 关键词)，结束位置是关键词最后一个字符之后的下标"""
+        for position, indices in self._scan(text):
+            for index in indices:
+                yield position, self.keywords[index]
+
+    def find(self, text: str) -> Tuple[str, ...]:
+        """文本中出现的全部关键词（去重，按关键词表中的顺序）"""
+        indices = set()
+        for _, ended in self._scan(text):
+            indices.update(ended)
+        return tuple(self.keywords[index] for index in sorted(indices))
+
+    def first(self, text: str, default: str = '') -> str:
+        """文本中出现的关键词里在关键词表中最靠前的一个"""
+        hits = self.find(text)
+        return hits[0] if hits else default
@@ -33,13 +33,26 @@ sys.path.append(current_dir)
 
 # 导入现有的处理脚本
 from convert_excel_to_csv import process_excel_to_standard_csv, extract_valve_info
-from valve_model_generator import generate_valve_models, analyze_valve_missing_params, parse_valve_info, parse_valve_info_from_combined
+from valve_model_generator import generate_valve_models, analyze_valve_missing_params, parse_valve_info, parse_valve_info_from_combined, \
+    generate_model_from_valve_info, model_code_cache, invalidate_model_codes
+from valve_parser import DN_COLUMN, MATERIAL_COLUMN, PN_COLUMN, extract_spec_columns
 from generate_quotes import process_inquiry_file, generate_summary_report
-from default_rules import DefaultRulesManager
+from default_rules import get_rules_manager as shared_rules_manager
 from csv_utils import safe_read_csv, safe_to_csv
 from ocr_correction import OCRCorrector
-from enhanced_quote_processor import process_quote_with_enhanced_matching, generate_multi_brand_quote
+from improved_price_matcher import ImprovedPriceMatcher
+from enhanced_quote_processor import process_quote_with_enhanced_matching, standardize_inquiry_columns, write_multi_company_quote
 from structured_quote_generator import generate_structured_quote
+from price_table_cache import (price_table_cache, read_price_table, read_price_table_page, load_price_table_index,
+                               load_price_table_search_view)
+from price_table_index import MODEL_WEIGHTS, NAME_WEIGHTS, BRAND_WEIGHTS, SORT_FIELDS
+from price_table_sidecar import remove_sidecar
+from price_table_journal import remove_journal
+from price_table_manifest import list_price_tables, record_price_table, forget_price_table
+from price_table_store import price_table_store, PriceTableEditError
+from match_result_cache import match_result_cache
+from multi_company_matcher import MultiCompanyMatcher
+from price_table_scanner import price_table_scanner
 
 # ------------------ OpenAPI / Swagger 配置 ------------------
 tags_metadata = [
@@ -101,11 +114,11 @@ os.makedirs(DATA_ROOT, exist_ok=True)
 interactive_batches = {}
 
 def get_rules_manager():
-    """获取规则管理器实例"""
+    """获取规则管理器实例（进程内共享，规则按文件修改时间缓存）"""
     # 获取当前脚本所在目录的绝对路径
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_root = os.path.abspath(os.path.join(current_dir, "merchant_data"))
-    return DefaultRulesManager(data_root)
+    return shared_rules_manager(data_root)
 
 class Account(BaseModel):
     username: str
@@ -327,6 +340,7 @@ async def save_user_default_rules(rules: DefaultRules, username: str = Depends(v
     print(f"💾 [API] 保存用户默认规则: username={username}")
     success = rules_manager.save_user_rules(username, rules.dict())
     if success:
+        invalidate_model_codes(username)
         return {"message": "默认规则保存成功"}
     else:
         raise HTTPException(status_code=500, detail="保存默认规则失败")
@@ -432,6 +446,8 @@ async def start_interactive_quote(
             # 分析每个产品，找出需要交互选择的产品
             incomplete_items = []
             completed_items = []
+            # DN/PN/材质整列预先解析
+            spec_columns = extract_spec_columns(df['品名'], df['规格型号'])
             
             for index, row in df.iterrows():
                 if pd.isna(row['品名']) or row['品名'] == '合计':
@@ -440,7 +456,8 @@ async def start_interactive_quote(
                 print(f"🔍 [INTERACTIVE] 分析第 {index+1} 行: {row['品名']}")
                 
                 # 分析缺失参数
-                analysis_result = analyze_valve_missing_params(row['品名'], row['规格型号'])
+                dn, pn, material = spec_columns.loc[index, [DN_COLUMN, PN_COLUMN, MATERIAL_COLUMN]]
+                analysis_result = analyze_valve_missing_params(row['品名'], row['规格型号'], dn, pn, material)
                 
                 if analysis_result:
                     # 需要交互选择
@@ -607,6 +624,7 @@ async def complete_interactive_quote(
     username: str = Depends(verify_credentials)
 ):
     """完成所有交互选择后，生成最终报价单"""
+    model_cache_usage = model_code_cache.track()
     try:
         print(f"🎯 [INTERACTIVE] 完成交互式报价: batch_id={batch_id}")
         
@@ -648,12 +666,14 @@ async def complete_interactive_quote(
             csv_path = os.path.join("规范后客户询价表数据", batch_data['csv_file'])
             df = safe_read_csv(csv_path)
             
-            # 生成型号列
+            # 生成型号列（DN/PN/材质整列预先解析）
+            spec_columns = extract_spec_columns(df['品名'], df['规格型号'])
             models = []
             for index, row in df.iterrows():
                 if pd.isna(row['品名']) or row['品名'] == '合计':
                     models.append('')
                     continue
+                dn, pn, material = spec_columns.loc[index, [DN_COLUMN, PN_COLUMN, MATERIAL_COLUMN]]
                 
                 # 检查是否是需要交互的产品
                 item_key = f"item_{index}"
@@ -677,11 +697,11 @@ async def complete_interactive_quote(
                             break
                     else:
                         # 找不到对应的项目，使用默认方式
-                        model = parse_valve_info(row['品名'], row['规格型号'], username, True)
+                        model = parse_valve_info(row['品名'], row['规格型号'], username, True, dn, pn, material)
                         models.append(model)
                 else:
                     # 使用默认方式生成型号
-                    model = parse_valve_info(row['品名'], row['规格型号'], username, True)
+                    model = parse_valve_info(row['品名'], row['规格型号'], username, True, dn, pn, material)
                     models.append(model)
             
             # 添加型号列
@@ -702,10 +722,7 @@ async def complete_interactive_quote(
             os.makedirs("规范后的价格对照表数据", exist_ok=True)
             price_csv_path = os.path.join("规范后的价格对照表数据", "价格.csv")
             
-            if price_file.endswith('.csv'):
-                price_df = safe_read_csv(price_path)
-            else:
-                price_df = pd.read_excel(price_path)
+            price_df = read_price_table(price_path)
             
             # 检查和映射价格表列名
             required_columns = ['型号', '规格', '品牌', '价格']
@@ -760,7 +777,8 @@ async def complete_interactive_quote(
             return {
                 "message": "交互式报价单生成成功",
                 "files": generated_files,
-                "total_interactions": len(batch_data['user_selections'])
+                "total_interactions": len(batch_data['user_selections']),
+                "model_cache": model_cache_usage.stats()
             }
             
         finally:
@@ -794,45 +812,8 @@ async def complete_interactive_quote(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"完成交互式报价失败: {str(e)}")
-
-def generate_model_from_valve_info(valve_info):
-    """根据阀门信息生成型号"""
-    valve_type = valve_info.get('product_type', '')
-    drive_mode = valve_info.get('drive_mode', '')
-    connection = valve_info.get('connection', '')
-    structure = valve_info.get('structure', '')
-    sealing = valve_info.get('sealing', '')
-    pressure = valve_info.get('pressure', '16')
-    material = valve_info.get('material', 'Q')
-    
-    # 对于特殊产品，直接返回完整型号
-    if valve_type in ['100X', '200X', '500X', '800X']:
-        model = ""
-        if connection == '8':
-            model = "8"
-        model += valve_type + f"-{pressure}{material}"
-        return model
-    
-    # 组合标准型号
-    model = valve_type
-    
-    # 驱动方式（手动默认不标）
-    if drive_mode:
-        model += drive_mode
-    
-    # 连接方式
-    model += connection
-    
-    # 结构形式
-    model += structure
-    
-    # 密封材料
-    model += sealing
-    
-    # 压力-材料
-    model += f"-{pressure}{material}"
-    
-    return model
+    finally:
+        model_cache_usage.close()
 
 def read_csv_with_encoding_fallback(file_bytes):
     import pandas as pd
@@ -959,7 +940,11 @@ def parse_file_to_excel(file_bytes, filename, save_dir):
             raise Exception("文件解析失败，未生成有效数据")
 
         print(f"💾 [PARSE] 保存Excel文件: {save_path}")
-        df.to_excel(save_path, index=False)
+        # 先写临时文件再原子替换，读取方不会看到写了一半的文件
+        temp_path = os.path.join(save_dir, f".{excel_name}.uploading")
+        with open(temp_path, "wb") as f:
+            df.to_excel(f, index=False, engine="openpyxl")
+        os.replace(temp_path, save_path)
         print(f"✅ [PARSE] 文件解析完成: {excel_name}")
         return excel_name
 
@@ -1024,7 +1009,11 @@ async def upload_price_table(file: UploadFile = File(...), username: str = Depen
                 for existing_file in existing_files:
                     existing_path = os.path.join(user_dir, existing_file)
                     try:
+                        price_table_cache.invalidate(existing_path)
                         os.remove(existing_path)
+                        remove_sidecar(existing_path)
+                        remove_journal(existing_path)
+                        forget_price_table(existing_path)
                         print(f"🗑️ [UPLOAD] 删除现有价格表: {existing_file}")
                     except Exception as e:
                         print(f"⚠️ [UPLOAD] 删除现有文件失败: {e}")
@@ -1033,6 +1022,10 @@ async def upload_price_table(file: UploadFile = File(...), username: str = Depen
             try:
                 excel_name = parse_file_to_excel(file_bytes, file.filename, user_dir)
                 print(f"✅ [UPLOAD] 价格表上传成功: {excel_name}")
+                price_table_scanner.invalidate(os.path.dirname(user_dir))
+                
+                # 预热解析缓存，同时生成列式旁路文件和价格表清单条目供后续读取
+                record_price_table(os.path.join(user_dir, excel_name))
                 
                 # 返回成功信息和品牌列表
                 return {
@@ -1290,7 +1283,7 @@ def append_quote_to_original(price_file, inquiry_file, output_file, price_column
     自动识别价格表的产品名称、型号、规格字段，提升兼容性。
     """
     orig_df = pd.read_excel(inquiry_file)
-    price_df = pd.read_excel(price_file)
+    price_df = read_price_table(price_file)
     if price_columns:
         price_df = price_df.rename(columns=price_columns)
     orig_df['标准型号'] = ''
@@ -1412,6 +1405,8 @@ async def generate_quote(
     address: str = Form(None),
     tax_rate: str = Form(None)
 ):
+    match_cache_usage = match_result_cache.track()
+    model_cache_usage = model_code_cache.track()
     try:
         print(f"🚀 [QUOTE] 开始生成价格后的报价单")
         print(f"📁 [QUOTE] 用户: {username}")
@@ -1562,6 +1557,8 @@ async def generate_quote(
             print(f"🎉 [QUOTE] 报价单生成成功(回退到第一方案): {os.path.basename(standard_xlsx)}")
             result_payload.update({"file": os.path.basename(standard_xlsx), "scheme": "scheme1"})
 
+        result_payload["match_cache"] = match_cache_usage.stats()
+        result_payload["model_cache"] = model_cache_usage.stats()
         return result_payload
 
     except HTTPException:
@@ -1571,6 +1568,9 @@ async def generate_quote(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"生成报价单失败: {str(e)}")
+    finally:
+        match_cache_usage.close()
+        model_cache_usage.close()
 
 @app.post("/api/generate-enhanced-quote")
 async def generate_enhanced_quote(
@@ -1579,6 +1579,7 @@ async def generate_enhanced_quote(
     username: str = Depends(verify_credentials)
 ):
     """使用增强价格匹配功能生成报价单"""
+    match_cache_usage = match_result_cache.track()
     try:
         print(f"🚀 [ENHANCED-API] 开始增强报价生成")
         print(f"👤 [ENHANCED-API] 用户: {username}")
@@ -1615,7 +1616,8 @@ async def generate_enhanced_quote(
             return {
                 "message": "增强报价单生成成功",
                 "file": output_filename,
-                "enhanced": True
+                "enhanced": True,
+                "match_cache": match_cache_usage.stats()
             }
         else:
             raise HTTPException(status_code=500, detail="增强报价单生成失败")
@@ -1627,6 +1629,8 @@ async def generate_enhanced_quote(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"增强报价生成失败: {str(e)}")
+    finally:
+        match_cache_usage.close()
 
 @app.post("/api/generate-multi-company-quote")
 async def generate_multi_company_quote_api(
@@ -1634,6 +1638,7 @@ async def generate_multi_company_quote_api(
     username: str = Depends(verify_credentials)
 ):
     """生成多公司价格对比报价单"""
+    match_cache_usage = match_result_cache.track()
     try:
         print(f"🚀 [MULTI-API] 开始多公司报价生成")
         print(f"👤 [MULTI-API] 用户: {username}")
@@ -1647,43 +1652,58 @@ async def generate_multi_company_quote_api(
         if not os.path.exists(inquiry_path):
             raise HTTPException(status_code=404, detail=f"询价表文件不存在: {inquiry_file}")
         
-        # 扫描所有价格表文件
         if not os.path.exists(price_dir):
             raise HTTPException(status_code=404, detail="价格表目录不存在")
         
-        price_files = {}
-        supported_formats = ['.xlsx', '.xls', '.csv']
+        # 已验证并加载索引的价格表（扫描结果在上传、删除价格表时失效；加载失败的表标记为无效）
+        scanned_tables = price_table_scanner.load_price_tables(user_dir)
+        price_tables = [pt for pt in scanned_tables if pt.is_valid]
+        invalid_tables = [
+            {"file": os.path.basename(pt.file_path), "error": pt.error_message}
+            for pt in scanned_tables if not pt.is_valid
+        ]
         
-        for filename in os.listdir(price_dir):
-            if any(filename.lower().endswith(fmt) for fmt in supported_formats):
-                company_name = Path(filename).stem  # 使用文件名作为公司名
-                price_files[company_name] = os.path.join(price_dir, filename)
+        if not price_tables:
+            raise HTTPException(status_code=404, detail="未找到任何有效的价格表文件")
         
-        if not price_files:
-            raise HTTPException(status_code=404, detail="未找到任何价格表文件")
+        companies = [pt.company_name for pt in price_tables]
+        print(f"📊 [MULTI-API] 发现价格表: {companies}")
         
-        print(f"📊 [MULTI-API] 发现价格表: {list(price_files.keys())}")
+        # 读取询价表
+        if inquiry_path.endswith('.csv'):
+            inquiry_df = safe_read_csv(inquiry_path)
+        else:
+            inquiry_df = pd.read_excel(inquiry_path)
+        inquiry_df = standardize_inquiry_columns(inquiry_df)
+        
+        # 多公司匹配
+        quote_result = MultiCompanyMatcher().match_products_multi_company(inquiry_df, price_tables)
         
         # 生成输出文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"{timestamp}_多公司价格对比.xlsx"
         output_path = os.path.join(user_dir, "报价单", output_filename)
         
-        # 使用多公司报价功能
-        result_file = generate_multi_brand_quote(
-            inquiry_file=inquiry_path,
-            price_files=price_files,
-            output_file=output_path,
-            username=username
-        )
+        result_file = write_multi_company_quote(inquiry_df, quote_result, companies, output_path)
         
         if result_file and os.path.exists(result_file):
             print(f"✅ [MULTI-API] 多公司报价生成成功: {output_filename}")
             return {
                 "message": "多公司价格对比报价单生成成功",
                 "file": output_filename,
-                "companies": list(price_files.keys()),
-                "company_count": len(price_files)
+                "companies": companies,
+                "company_count": len(companies),
+                "invalid_tables": invalid_tables,
+                "statistics": {
+                    "summary": quote_result.summary,
+                    "total_products": quote_result.total_products,
+                    "matched_products": quote_result.matched_products,
+                    "match_rate": round(quote_result.match_rate, 4),
+                    "processing_time": round(quote_result.processing_time, 3),
+                    "errors": quote_result.errors,
+                    "warnings": quote_result.warnings,
+                },
+                "match_cache": match_cache_usage.stats()
             }
         else:
             raise HTTPException(status_code=500, detail="多公司报价单生成失败")
@@ -1695,6 +1715,8 @@ async def generate_multi_company_quote_api(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"多公司报价生成失败: {str(e)}")
+    finally:
+        match_cache_usage.close()
 
 @app.get("/api/download/{file_type}/{filename}")
 async def download_file(file_type: str, filename: str, username: str = Depends(verify_credentials)):
@@ -1968,7 +1990,9 @@ def match_quote_with_price_table(quote_file, price_file, selected_brand=None):
     import pandas as pd
     import re
     quote_df = pd.read_excel(quote_file)
-    price_df = pd.read_excel(price_file)
+    # 价格表索引跨请求缓存：归一化列与品牌分区在加载时已构建，price_df 只读共享
+    price_index = load_price_table_index(price_file)
+    price_df = price_index.price_df
 
     # 自动识别标准型号、名称、品牌列
     model_col = None
@@ -1997,39 +2021,25 @@ def match_quote_with_price_table(quote_file, price_file, selected_brand=None):
         quote_df['总价'] = ''
         print("[DEBUG] 添加总价列")
 
+    q_brand = normalize(selected_brand) if selected_brand else ''  # 只用所选品牌
+    # 只在选中品牌的分区内打分，分区对所有行共用
+    if selected_brand and brand_col:
+        brand_positions = price_index.partition_positions(brand_col, q_brand)
+    else:
+        brand_positions = price_index.candidate_positions()
+
     for idx, row in quote_df.iterrows():
-        best_score = 0
-        best_match = None
         q_model = normalize(row.get(model_col, '')) if model_col else ''
         q_name = normalize(row.get(name_col, '')) if name_col else ''
-        q_brand = normalize(selected_brand) if selected_brand else ''  # 只用所选品牌
-        # 只遍历选中品牌的行
-        if selected_brand and brand_col:
-            price_rows = price_df[price_df[brand_col].apply(lambda x: normalize(x) == q_brand)]
-        else:
-            price_rows = price_df
-        for _, prow in price_rows.iterrows():
-            p_model = normalize(prow.get(model_col, '')) if model_col else ''
-            p_name = normalize(prow.get(name_col, '')) if name_col else ''
-            p_brand = normalize(prow.get(brand_col, '')) if brand_col else ''
-            score = 0
-            # 完全相等优先
-            if q_model and p_model and q_model == p_model:
-                score += 10
-            elif q_model and p_model and (q_model in p_model or p_model in q_model):
-                score += 6
-            if q_name and p_name and q_name == p_name:
-                score += 5
-            elif q_name and p_name and (q_name in p_name or p_name in q_name):
-                score += 3
-            # 品牌只用所选品牌，不再考虑询价表品牌
-            if q_brand and p_brand and q_brand == p_brand:
-                score += 2
-            elif q_brand and p_brand and (q_brand in p_brand or p_brand in q_brand):
-                score += 1
-            if score > best_score:
-                best_score = score
-                best_match = prow
+        # 完全相等优先；品牌只用所选品牌，不再考虑询价表品牌
+        scores = price_index.score_columns(brand_positions, [
+            (model_col, q_model, MODEL_WEIGHTS),
+            (name_col, q_name, NAME_WEIGHTS),
+            (brand_col, q_brand, BRAND_WEIGHTS),
+        ])
+        result = price_index.argmax(brand_positions, scores)
+        best_match = price_df.iloc[result[0]] if result else None
+        best_score = result[1] if result else 0
         # 匹配到则写入单价和品牌，否则保持空白
         if best_match is not None and best_score > 0:
             unit_price = best_match.get('单价', '')
@@ -2112,37 +2122,8 @@ async def get_price_table_list(username: str = Depends(verify_credentials)):
         if not os.path.exists(user_dir):
             return JSONResponse(content={"files": []})
         
-        # 获取所有Excel文件
-        files = []
-        for filename in os.listdir(user_dir):
-            if filename.endswith(('.xlsx', '.xls')):
-                file_path = os.path.join(user_dir, filename)
-                file_stat = os.stat(file_path)
-                
-                # 获取文件基本信息
-                file_info = {
-                    "filename": filename,
-                    "size": file_stat.st_size,
-                    "modified_time": datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
-                    "created_time": datetime.fromtimestamp(file_stat.st_ctime).isoformat()
-                }
-                
-                # 尝试获取行数和列数
-                try:
-                    df = pd.read_excel(file_path)
-                    file_info["row_count"] = len(df)
-                    file_info["column_count"] = len(df.columns)
-                    file_info["columns"] = df.columns.tolist()
-                except Exception as e:
-                    print(f"⚠️ 读取文件 {filename} 的详细信息失败: {e}")
-                    file_info["row_count"] = None
-                    file_info["column_count"] = None
-                    file_info["columns"] = []
-                
-                files.append(file_info)
-        
-        # 按修改时间排序，最新的在前
-        files.sort(key=lambda x: x["modified_time"], reverse=True)
+        # 从价格表清单读取文件信息（按修改时间排序，最新的在前），不逐个打开Excel
+        files = list_price_tables(user_dir)
         
         return JSONResponse(content={"files": files})
         
@@ -2166,26 +2147,18 @@ async def get_price_table_content(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取Excel文件
-        df = pd.read_excel(file_path)
-        
-        # 处理NaN值，将其替换为None，以便JSON序列化
-        df_cleaned = df.where(pd.notna(df), None)
-        
-        # 计算分页
-        total_rows = len(df_cleaned)
-        total_pages = (total_rows + page_size - 1) // page_size  # 向上取整
-        
-        # 计算起始和结束索引
+        # 计算分页：总行数取自缓存中常驻的表，只切出当前页，不整表复制
         start_idx = (page - 1) * page_size
+        columns, page_df, total_rows = read_price_table_page(file_path, start_idx, start_idx + page_size)
+        total_pages = (total_rows + page_size - 1) // page_size  # 向上取整
         end_idx = min(start_idx + page_size, total_rows)
         
-        # 获取当前页的数据
-        page_data = df_cleaned.iloc[start_idx:end_idx]
+        # 只对当前页把NaN值替换为None，以便JSON序列化
+        page_data = page_df.astype(object).where(pd.notna(page_df), None)
         
         # 转换为字典格式
         data = {
-            "columns": df_cleaned.columns.tolist(),
+            "columns": columns,
             "data": page_data.values.tolist(),
             "pagination": {
                 "current_page": page,
@@ -2197,7 +2170,7 @@ async def get_price_table_content(
                 "start_index": start_idx + 1,  # 显示用的索引，从1开始
                 "end_index": end_idx
             },
-            "total_columns": len(df_cleaned.columns)
+            "total_columns": len(columns)
         }
         
         return JSONResponse(content=data)
@@ -2206,6 +2179,108 @@ async def get_price_table_content(
         print(f"❌ [ERROR] 获取价格表内容失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取价格表内容失败: {str(e)}")
 
+@app.get("/api/price-table/{filename}/search")
+async def search_price_table(
+    filename: str,
+    model: str = Query("", description="型号前缀"),
+    brand: str = Query("", description="品牌（忽略空白与大小写）"),
+    dn_min: Optional[int] = Query(None, ge=0, description="最小DN"),
+    dn_max: Optional[int] = Query(None, ge=0, description="最大DN"),
+    price_min: Optional[float] = Query(None, description="最低单价"),
+    price_max: Optional[float] = Query(None, description="最高单价"),
+    q: str = Query("", description="全文检索：型号/名称/规格/品牌包含该文本"),
+    sort_by: Optional[str] = Query(None, description="排序字段：model / brand / dn / price"),
+    order: str = Query("asc", description="排序方向：asc / desc"),
+    page: int = Query(1, ge=1, description="页码，从1开始"),
+    page_size: int = Query(50, ge=1, le=1000, description="每页显示数量，最大1000"),
+    username: str = Depends(verify_credentials)
+):
+    """在价格表中搜索、筛选并排序（基于标准化列名的缓存索引，不重新解析文件）"""
+    try:
+        user_dir = os.path.join(DATA_ROOT, username, "价格表")
+        file_path = os.path.join(user_dir, filename)
+        
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        if sort_by is not None and sort_by not in SORT_FIELDS:
+            raise HTTPException(status_code=400, detail=f"不支持的排序字段: {sort_by}")
+        if order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail=f"不支持的排序方向: {order}")
+        
+        # 与匹配器共用标准化列名（型号/规格/品牌/价格）的索引；与原始列名视图取自同一版本，行位置一致
+        index, df = load_price_table_search_view(file_path, ImprovedPriceMatcher()._standardize_columns)
+        positions = index.search(
+            model_prefix=model, brand=brand, dn_min=dn_min, dn_max=dn_max,
+            price_min=price_min, price_max=price_max, text=q,
+            sort_by=sort_by, descending=order == "desc",
+        )
+        
+        total_rows = len(positions)
+        total_pages = (total_rows + page_size - 1) // page_size  # 向上取整
+        start_idx = (page - 1) * page_size
+        page_positions = positions[start_idx:start_idx + page_size]
+        
+        # 返回原始列名的行，row_indices 可直接用于行编辑接口
+        page_df = df.iloc[page_positions]
+        page_data = page_df.astype(object).where(pd.notna(page_df), None)
+        
+        return JSONResponse(content={
+            "columns": df.columns.tolist(),
+            "data": page_data.values.tolist(),
+            "row_indices": page_positions.tolist(),
+            "pagination": {
+                "current_page": page,
+                "page_size": page_size,
+                "total_rows": total_rows,
+                "total_pages": total_pages,
+                "has_next": page < total_pages,
+                "has_prev": page > 1
+            },
+            "total_columns": len(df.columns)
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ [ERROR] 搜索价格表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"搜索价格表失败: {str(e)}")
+
+@app.patch("/api/price-table/{filename}")
+async def patch_price_table(
+    filename: str,
+    data: Dict[str, Any],
+    username: str = Depends(verify_credentials)
+):
+    """批量编辑价格表：行更新/新增/删除与列增删一次提交，全部校验通过才整体生效，只持久化一次
+
+    请求体 {"operations": [{"op": "update_row", "row": 0, "data": {...}}, {"op": "add_row", "data": {...}},
+    {"op": "delete_row", "row": 3}, {"op": "add_column", "column": "备注"}, {"op": "delete_column", "column": "备注"}]}，
+    按顺序执行，行索引以前面的操作完成后的表为准。
+    """
+    try:
+        user_dir = os.path.join(DATA_ROOT, username, "价格表")
+        file_path = os.path.join(user_dir, filename)
+        
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            raise HTTPException(status_code=400, detail="operations 不能为空")
+        
+        report = price_table_store.patch(file_path, operations)
+        print(f"✏️ [PATCH] 批量编辑价格表 {filename}: {report['summary']}")
+        
+        return JSONResponse(content={"message": "批量编辑成功", **report})
+        
+    except HTTPException:
+        raise
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ [ERROR] 批量编辑价格表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量编辑价格表失败: {str(e)}")
+
 @app.post("/api/price-table/{filename}/update")
 async def update_price_table_content(
     filename: str, 
@@ -2221,15 +2296,10 @@ async def update_price_table_content(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 从请求数据中提取列名和数据
+        # 从请求数据中提取列名和数据，整表替换（内存中生效，后台写回）
         columns = data.get("columns", [])
         rows = data.get("data", [])
-        
-        # 创建DataFrame
-        df = pd.DataFrame(rows, columns=columns)
-        
-        # 保存到文件
-        df.to_excel(file_path, index=False)
+        price_table_store.replace(file_path, columns, rows)
         
         return JSONResponse(content={"message": "价格表更新成功"})
         
@@ -2248,8 +2318,13 @@ async def delete_price_table(filename: str, username: str = Depends(verify_crede
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 删除文件
+        # 先放弃在编状态和缓存，避免后台写回把文件写回来
+        price_table_cache.invalidate(file_path)
         os.remove(file_path)
+        remove_sidecar(file_path)
+        remove_journal(file_path)
+        forget_price_table(file_path)
+        price_table_scanner.invalidate(os.path.dirname(user_dir))
         
         return JSONResponse(content={"message": "价格表删除成功"})
         
@@ -2272,18 +2347,13 @@ async def add_row_to_price_table(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取现有数据
-        df = pd.read_excel(file_path)
-        
-        # 添加新行
-        new_row = pd.DataFrame([row_data])
-        df = pd.concat([df, new_row], ignore_index=True)
-        
-        # 保存文件
-        df.to_excel(file_path, index=False)
-        
-        return JSONResponse(content={"message": "行添加成功", "new_row_index": len(df) - 1})
+        # 在内存中追加行并增量更新索引，后台写回
+        new_row_index = price_table_store.add_row(file_path, row_data)
         
+        return JSONResponse(content={"message": "行添加成功", "new_row_index": new_row_index})
+
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ [ERROR] 添加行失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"添加行失败: {str(e)}")
@@ -2304,22 +2374,13 @@ async def update_row_in_price_table(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取现有数据
-        df = pd.read_excel(file_path)
-        
-        if row_index >= len(df):
-            raise HTTPException(status_code=400, detail="行索引超出范围")
-        
-        # 更新指定行
-        for column, value in row_data.items():
-            if column in df.columns:
-                df.at[row_index, column] = value
-        
-        # 保存文件
-        df.to_excel(file_path, index=False)
+        # 更新指定行（内存中生效并增量更新索引，后台写回）
+        price_table_store.update_row(file_path, row_index, row_data)
         
         return JSONResponse(content={"message": "行更新成功"})
         
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ [ERROR] 更新行失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"更新行失败: {str(e)}")
@@ -2339,20 +2400,13 @@ async def delete_row_from_price_table(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取现有数据
-        df = pd.read_excel(file_path)
-        
-        if row_index >= len(df):
-            raise HTTPException(status_code=400, detail="行索引超出范围")
-        
-        # 删除指定行
-        df = df.drop(row_index).reset_index(drop=True)
-        
-        # 保存文件
-        df.to_excel(file_path, index=False)
+        # 删除指定行（内存中生效并增量更新索引，后台写回）
+        price_table_store.delete_row(file_path, row_index)
         
         return JSONResponse(content={"message": "行删除成功"})
         
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ [ERROR] 删除行失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"删除行失败: {str(e)}")
@@ -2372,26 +2426,14 @@ async def add_column_to_price_table(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取现有数据
-        df = pd.read_excel(file_path)
-        
-        # 从请求数据中获取列名
+        # 从请求数据中获取列名，添加新列（内存中生效，后台写回）
         column_name = data.get("column_name", "")
-        if not column_name:
-            raise HTTPException(status_code=400, detail="列名不能为空")
-        
-        # 检查列名是否已存在
-        if column_name in df.columns:
-            raise HTTPException(status_code=400, detail="列名已存在")
-        
-        # 添加新列
-        df[column_name] = ""
-        
-        # 保存文件
-        df.to_excel(file_path, index=False)
+        price_table_store.add_column(file_path, column_name)
         
         return JSONResponse(content={"message": "列添加成功"})
         
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ [ERROR] 添加列失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"添加列失败: {str(e)}")
@@ -2411,20 +2453,13 @@ async def delete_column_from_price_table(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 读取现有数据
-        df = pd.read_excel(file_path)
-        
-        if column_name not in df.columns:
-            raise HTTPException(status_code=400, detail="列名不存在")
-        
-        # 删除指定列
-        df = df.drop(columns=[column_name])
-        
-        # 保存文件
-        df.to_excel(file_path, index=False)
+        # 删除指定列（内存中生效，后台写回）
+        price_table_store.delete_column(file_path, column_name)
         
         return JSONResponse(content={"message": "列删除成功"})
         
+    except PriceTableEditError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ [ERROR] 删除列失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"删除列失败: {str(e)}")
@@ -2445,6 +2480,7 @@ async def generate_structured_quote_api(
     sales_email: str = Form(None),
     username: str = Depends(verify_credentials)
 ):
+    match_cache_usage = match_result_cache.track()
     try:
         user_dir = os.path.join(DATA_ROOT, username)
         price_path = os.path.join(user_dir, "价格表", price_file)
@@ -2475,7 +2511,11 @@ async def generate_structured_quote_api(
         )
 
         filename = os.path.basename(output_file)
-        return {"message": "结构化报价单生成成功", "file": filename}
+        return {
+            "message": "结构化报价单生成成功",
+            "file": filename,
+            "match_cache": match_cache_usage.stats(),
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -2483,6 +2523,31 @@ async def generate_structured_quote_api(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"生成结构化报价失败: {str(e)}")
+    finally:
+        match_cache_usage.close()
+
+@app.get("/api/admin/price-table-cache")
+async def admin_price_table_cache_stats(username: str = Depends(verify_credentials)):
+    """价格表解析缓存的命中统计，以及在编价格表的待压缩编辑日志"""
+    if not is_admin(username):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    stats = price_table_cache.stats()
+    stats["editing"] = price_table_store.stats()
+    return stats
+
+@app.get("/api/admin/match-cache")
+async def admin_match_cache_stats(username: str = Depends(verify_credentials)):
+    """匹配结果缓存的命中统计"""
+    if not is_admin(username):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return match_result_cache.stats()
+
+@app.get("/api/admin/model-cache")
+async def admin_model_cache_stats(username: str = Depends(verify_credentials)):
+    """标准型号缓存的命中统计"""
+    if not is_admin(username):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return model_code_cache.stats()
 
 # -----------------------------
 # 管理员设置用户折扣
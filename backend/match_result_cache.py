@@ -0,0 +1,130 @@
+"""
+匹配结果缓存 - 进程内共享的有界 LRU，记忆化单条询价的匹配结果
+
+询价表里同一阀门行经常重复出现，客户也会反复发送几乎相同的表。
+键由调用方给出：命名空间 + 价格表版本号 + 归一化后的查询字段。
+价格表版本号取自文件签名 (路径, 修改时间, 大小)，编辑或重新上传后
+旧条目自然不再命中，随 LRU 淘汰。
+单次请求的命中统计由 track() 返回的 CacheUsage 逐次计数（按 contextvar 区分请求），
+不受同时进行的其他请求影响。
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# 默认最多缓存的匹配结果条数，可通过环境变量 MATCH_CACHE_SIZE 调整
+DEFAULT_MATCH_CACHE_SIZE = int(os.environ.get("MATCH_CACHE_SIZE", "20000"))
+
+_MISSING = object()
+
+
+def _hit_stats(hits: int, misses: int) -> Dict[str, Any]:
+    """命中统计：命中、未命中次数和命中率"""
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+class CacheUsage:
+    """一次调用（如一个请求）内的缓存命中计数，由 MatchResultCache.track() 创建
+
+    可以用作 with 语句，或在 finally 中调用 close() 结束计数。
+    """
+
+    def __init__(self, cache: "MatchResultCache"):
+        self._cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return _hit_stats(self.hits, self.misses)
+
+    def close(self):
+        """结束计数，之后的查找不再计入"""
+        active = self._cache._usages.get()
+        if self in active:
+            self._cache._usages.set(tuple(usage for usage in active if usage is not self))
+
+    def __enter__(self) -> "CacheUsage":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MatchResultCache:
+    """按查询键缓存匹配结果，超过条数上限时按 LRU 淘汰"""
+
+    def __init__(self, max_entries: int = DEFAULT_MATCH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 当前上下文中正在计数的 CacheUsage（可嵌套，查找同时计入每一个）
+        self._usages: ContextVar[Tuple[CacheUsage, ...]] = ContextVar(f"match_cache_usage_{id(self)}", default=())
+
+    def track(self) -> CacheUsage:
+        """开始统计当前上下文（当前请求）中的查找，返回 CacheUsage"""
+        usage = CacheUsage(self)
+        self._usages.set(self._usages.get() + (usage,))
+        return usage
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 结果)"""
+        usages = self._usages.get()
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            hit = value is not _MISSING
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            for usage in usages:
+                if hit:
+                    usage.hits += 1
+                else:
+                    usage.misses += 1
+            return (True, value) if hit else (False, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """删除键满足 predicate 的条目，返回删除条数"""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回进程累计的命中统计"""
+        with self._lock:
+            result = _hit_stats(self.hits, self.misses)
+            result.update({
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            })
+        return result
+
+
+# 进程内共享实例
+match_result_cache = MatchResultCache()
@@ -1,18 +1,133 @@
 """
-多公司匹配引擎 - 并行处理多个公司的产品匹配
+多公司匹配引擎 - 在合并索引上一次匹配多个公司的产品
+
+各公司价格表经 ImprovedPriceMatcher 载入（共享缓存中的 PriceTableIndex），
+在跨公司合并索引上整表匹配（见 unified_price_index.match_batch_multi），
+每个询价行一次查找得到各公司的最佳行，结果与 generate_multi_brand_quote 一致。
+默认（inline）在主进程内整表匹配一次；进程模式（process）使用常驻进程池：任务只传递价格表路径、版本号和一块询价行，
+工作进程按路径经自己的共享缓存载入价格表索引（Excel 走列式旁路文件），
+按版本号跨请求复用，匹配结果缓存也留在工作进程中；
+有未写回编辑的在编表和没有文件的价格表在主进程中匹配。
 """
+import atexit
+import os
+import threading
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import time
-import re
+from improved_price_matcher import ImprovedPriceMatcher, empty_batch_result
 from multi_company_models import PriceTableInfo, PriceMatch, AggregatedPriceInfo, MultiCompanyQuoteResult
+from match_result_cache import CacheUsage, match_result_cache
+from price_table_cache import price_table_cache, price_table_version
+from unified_price_index import match_batch_multi
+
+# 匹配方式：inline（主进程内一次匹配）或 process（常驻进程池按询价行分块），可通过环境变量 MULTI_MATCH_EXECUTOR 调整
+DEFAULT_EXECUTOR = os.environ.get("MULTI_MATCH_EXECUTOR", "inline")
+# 进程模式下每个任务的询价行数，可通过环境变量 MULTI_MATCH_CHUNK_ROWS 调整
+DEFAULT_CHUNK_ROWS = int(os.environ.get("MULTI_MATCH_CHUNK_ROWS", "50"))
+
+# 常驻进程池，首次使用时创建，进程数变化或进程池损坏时重建
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# 工作进程内的匹配器：价格表路径 -> (版本号, ImprovedPriceMatcher)，版本号变化时重新载入
+_WORKER_MATCHERS: Dict[str, Tuple[tuple, ImprovedPriceMatcher]] = {}
+
+
+def _matcher_for(price_df: pd.DataFrame) -> ImprovedPriceMatcher:
+    """由已标准化列名的价格表构建匹配器"""
+    matcher = ImprovedPriceMatcher()
+    matcher.price_df = price_df
+    matcher._identify_brand_columns()
+    return matcher
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """取得常驻进程池"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+            _pool_workers = max_workers
+            print(f"🔀 [MATCHER] 创建常驻进程池: {max_workers} 个进程")
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """进程池损坏（如工作进程被杀）后丢弃，下次使用时重建"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_pool():
+    """关闭常驻进程池（进程退出时自动调用）"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def _init_worker():
+    """工作进程初始化：不沿用父进程的在编表，也不重放编辑日志、调度压缩（那是主进程的事）"""
+    price_table_cache.disable_live()
+
+
+def _worker_matcher(file_path: str, version: tuple) -> ImprovedPriceMatcher:
+    """工作进程内按路径取匹配器，版本号与主进程不一致时重新载入"""
+    cached = _WORKER_MATCHERS.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    matcher = ImprovedPriceMatcher()
+    if not matcher.load_price_table(file_path):
+        raise RuntimeError(f"价格表加载失败: {os.path.basename(file_path)}")
+    if price_table_version(file_path) != version:
+        raise RuntimeError(f"价格表在匹配期间已变化: {os.path.basename(file_path)}")
+    _WORKER_MATCHERS[file_path] = (version, matcher)
+    return matcher
+
+
+def _match_chunk(tables: Dict[str, Tuple[str, tuple]],
+                 inquiry_chunk: pd.DataFrame) -> Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]:
+    """工作进程任务：对各公司匹配一块询价行
+
+    tables: 公司名 -> (价格表路径, 版本号)。只返回行位置、匹配类型和置信度，
+    以及本任务的匹配结果缓存统计。
+    """
+    matchers = {company_name: _worker_matcher(file_path, version)
+                for company_name, (file_path, version) in tables.items()}
+    with match_result_cache.track() as usage:
+        results = match_batch_multi(matchers, inquiry_chunk)
+    positions = {company: {key: result[key] for key in ("位置", "匹配类型", "置信度")}
+                 for company, result in results.items()}
+    return positions, usage.stats()
+
 
 class MultiCompanyMatcher:
-    """多公司匹配引擎"""
+    """多公司匹配引擎
+
+    executor 为 inline 时在主进程内匹配；为 process 时按询价行分块交给 max_workers 个进程的常驻进程池
+    （max_workers、chunk_rows 只用于进程模式）。
+    """
     
-    def __init__(self, max_workers: int = 4):
+    def __init__(self, max_workers: int = 4, executor: Optional[str] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS):
         self.max_workers = max_workers
+        self.executor = executor or DEFAULT_EXECUTOR
+        if self.executor not in ("inline", "process"):
+            raise ValueError(f"不支持的匹配方式: {self.executor}")
+        self.chunk_rows = max(1, chunk_rows)
         
     def match_products_multi_company(
         self, 
@@ -26,8 +141,8 @@ class MultiCompanyMatcher:
         print(f"📋 [MATCHER] 询价产品数量: {len(inquiry_data)}")
         print(f"🏢 [MATCHER] 价格表数量: {len(price_tables)}")
         
-        # 过滤有效的价格表
-        valid_price_tables = [pt for pt in price_tables if pt.is_valid and pt.data is not None]
+        # 过滤有效的价格表：有文件的按路径载入，没有文件的需带有数据
+        valid_price_tables = [pt for pt in price_tables if pt.is_valid and (pt.file_path or pt.data is not None)]
         print(f"✅ [MATCHER] 有效价格表数量: {len(valid_price_tables)}")
         
         if not valid_price_tables:
@@ -40,35 +155,26 @@ class MultiCompanyMatcher:
                 errors=["没有有效的价格表文件"]
             )
         
-        # 并行处理多个公司的匹配
         all_matches = {}
         errors = []
         warnings = []
         
-        try:
-            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(valid_price_tables))) as executor:
-                # 提交所有匹配任务
-                future_to_company = {
-                    executor.submit(self.match_single_company, inquiry_data, price_table): price_table.company_name
-                    for price_table in valid_price_tables
-                }
-                
-                # 收集结果
-                for future in as_completed(future_to_company):
-                    company_name = future_to_company[future]
-                    try:
-                        matches = future.result()
-                        all_matches[company_name] = matches
-                        print(f"✅ [MATCHER] {company_name} 匹配完成: {len(matches)} 个产品")
-                    except Exception as e:
-                        error_msg = f"{company_name} 匹配失败: {str(e)}"
-                        errors.append(error_msg)
-                        print(f"❌ [MATCHER] {error_msg}")
-        
-        except Exception as e:
-            error_msg = f"并行匹配过程出错: {str(e)}"
-            errors.append(error_msg)
-            print(f"❌ [MATCHER] {error_msg}")
+        with match_result_cache.track() as usage:
+            try:
+                matchers = self._load_matchers(valid_price_tables, errors)
+                if self.executor == "process":
+                    file_paths = {pt.company_name: pt.file_path for pt in valid_price_tables}
+                    results = self._match_with_processes(inquiry_data, matchers, file_paths, errors, usage)
+                else:
+                    results = match_batch_multi(matchers, inquiry_data)
+                for company_name, result in results.items():
+                    all_matches[company_name] = self._company_matches(
+                        inquiry_data, company_name, matchers[company_name], result, warnings)
+                    print(f"✅ [MATCHER] {company_name} 匹配完成: {len(all_matches[company_name])} 个产品")
+            except Exception as e:
+                error_msg = f"多公司匹配过程出错: {str(e)}"
+                errors.append(error_msg)
+                print(f"❌ [MATCHER] {error_msg}")
         
         # 聚合匹配结果
         aggregated_prices = self._aggregate_matches(inquiry_data, all_matches)
@@ -84,7 +190,8 @@ class MultiCompanyMatcher:
             matched_products=matched_products,
             processing_time=processing_time,
             errors=errors,
-            warnings=warnings
+            warnings=warnings,
+            cache_stats=usage.stats()
         )
         
         print(f"🎉 [MATCHER] 多公司匹配完成: {result.summary}")
@@ -92,25 +199,81 @@ class MultiCompanyMatcher:
         
         return result
     
-    def match_single_company(
-        self, 
-        inquiry_data: pd.DataFrame, 
-        price_table: PriceTableInfo
-    ) -> List[PriceMatch]:
-        """对单个公司执行产品匹配"""
-        matches = []
-        
-        if not price_table.is_valid or price_table.data is None:
-            return matches
-        
-        price_df = price_table.data
-        company_name = price_table.company_name
-        
-        print(f"🔍 [MATCHER] 开始匹配 {company_name}")
-        
-        for idx, inquiry_row in inquiry_data.iterrows():
-            # 跳过合计行和空行
-            if pd.isna(inquiry_row.get('品名')) or str(inquiry_row.get('品名')).strip() in ['合计', '']:
+    @staticmethod
+    def _load_matchers(price_tables: List[PriceTableInfo], errors: List[str]) -> Dict[str, ImprovedPriceMatcher]:
+        """各公司的匹配器：有文件的价格表经共享缓存载入索引，没有文件的按内存中的数据构建"""
+        matchers = {}
+        for price_table in price_tables:
+            company_name = price_table.company_name
+            if price_table.file_path:
+                matcher = ImprovedPriceMatcher()
+                if not matcher.load_price_table(price_table.file_path):
+                    errors.append(f"{company_name} 价格表加载失败")
+                    continue
+            else:
+                matcher = _matcher_for(ImprovedPriceMatcher()._standardize_columns(price_table.data.copy()))
+            matchers[company_name] = matcher
+        return matchers
+    
+    def _match_with_processes(
+        self,
+        inquiry_data: pd.DataFrame,
+        matchers: Dict[str, ImprovedPriceMatcher],
+        file_paths: Dict[str, str],
+        errors: List[str],
+        usage: CacheUsage
+    ) -> Dict[str, Dict[str, np.ndarray]]:
+        """常驻进程池：按询价行分块提交任务，各块结果按行序号写回，价格等字段在主进程按行位置填入
+
+        任务只传递价格表路径和版本号，工作进程中的缓存命中计入 usage；
+        在编表（工作进程读不到未写回的编辑）和没有文件的价格表在主进程中匹配。
+        """
+        remote = {}
+        for company_name in matchers:
+            file_path = file_paths.get(company_name)
+            if file_path and price_table_cache.live_version(file_path) is None:
+                remote[company_name] = (os.path.abspath(file_path), price_table_version(file_path))
+        local = {company_name: matcher for company_name, matcher in matchers.items() if company_name not in remote}
+        
+        chunks = [(start, inquiry_data.iloc[start:start + self.chunk_rows])
+                  for start in range(0, len(inquiry_data), self.chunk_rows)] if remote else []
+        print(f"🔀 [MATCHER] 进程池匹配: {len(remote)} 家公司, {len(chunks)} 个任务, 每块最多 {self.chunk_rows} 行；"
+              f"主进程匹配: {len(local)} 家公司")
+        future_to_start = {}
+        if chunks:
+            pool = _get_pool(self.max_workers)
+            future_to_start = {pool.submit(_match_chunk, remote, chunk): start for start, chunk in chunks}
+        
+        # 工作进程匹配期间，主进程匹配在编表和没有文件的价格表
+        results = match_batch_multi(local, inquiry_data) if local else {}
+        results.update({company_name: empty_batch_result(len(inquiry_data)) for company_name in remote})
+        for future in as_completed(future_to_start):
+            start = future_to_start[future]
+            try:
+                chunk_results, chunk_cache = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _discard_pool(pool)
+                error_msg = f"询价第 {start + 1} 行起的分块匹配失败: {str(e)}"
+                errors.append(error_msg)
+                print(f"❌ [MATCHER] {error_msg}")
+                continue
+            for company_name, chunk_result in chunk_results.items():
+                for key, values in chunk_result.items():
+                    results[company_name][key][start:start + len(values)] = values
+            usage.hits += chunk_cache['hits']
+            usage.misses += chunk_cache['misses']
+        
+        for company_name in remote:
+            matchers[company_name]._fill_batch_result(results[company_name])
+        return {company_name: results[company_name] for company_name in matchers}
+    
+    @staticmethod
+    def _inquiry_items(inquiry_data: pd.DataFrame) -> List[Tuple[int, str, str]]:
+        """参与匹配的询价行 (行序号, 品名, 规格型号)，跳过合计/总计行和空行"""
+        items = []
+        for i, (idx, inquiry_row) in enumerate(inquiry_data.iterrows()):
+            if pd.isna(inquiry_row.get('品名')) or str(inquiry_row.get('品名')).strip() in ['合计', '总计', '']:
                 continue
             
             product_name = str(inquiry_row.get('品名', '')).strip()
@@ -118,192 +281,116 @@ class MultiCompanyMatcher:
             
             if not product_name:
                 continue
-            
-            # 在价格表中查找匹配
-            match = self._find_best_match(product_name, specification, price_df, company_name)
-            if match:
-                matches.append(match)
-        
-        print(f"✅ [MATCHER] {company_name} 匹配结果: {len(matches)} 个产品")
-        return matches
+            items.append((i, product_name, specification))
+        return items
     
-    def _find_best_match(
-        self, 
-        product_name: str, 
-        specification: str, 
-        price_df: pd.DataFrame, 
-        company_name: str
-    ) -> Optional[PriceMatch]:
-        """在价格表中查找最佳匹配"""
-        best_match = None
-        best_score = 0
-        
-        for idx, price_row in price_df.iterrows():
-            try:
-                # 获取价格表中的产品信息
-                price_model = str(price_row.get('型号', '')).strip()
-                price_spec = str(price_row.get('规格', '')).strip()
-                price_value = price_row.get('价格', 0)
-                brand = str(price_row.get('品牌', '')).strip()
-                
-                # 跳过无效数据
-                if not price_model or pd.isna(price_value) or price_value <= 0:
-                    continue
-                
-                # 计算匹配分数
-                score = self._calculate_match_score(
-                    product_name, specification, 
-                    price_model, price_spec
-                )
-                
-                if score > best_score and score >= 0.6:  # 最低匹配阈值
-                    best_score = score
-                    best_match = PriceMatch(
-                        product_name=product_name,
-                        specification=specification,
-                        company_name=company_name,
-                        price=float(price_value),
-                        brand=brand,
-                        match_confidence=score,
-                        original_row=price_row.to_dict()
-                    )
-            
-            except Exception as e:
-                # 跳过有问题的行
+    def _company_matches(
+        self,
+        inquiry_data: pd.DataFrame,
+        company_name: str,
+        matcher: ImprovedPriceMatcher,
+        result: Dict[str, np.ndarray],
+        warnings: List[str]
+    ) -> Dict[int, PriceMatch]:
+        """把 match_batch 结构的结果转为 询价行序号 -> 匹配结果（未匹配的行不出现）"""
+        matches = {}
+        for i, product_name, specification in self._inquiry_items(inquiry_data):
+            position = result["位置"][i]
+            if position < 0:
                 continue
-        
-        return best_match
+            price = float(result["价格"][i])
+            if price < 0:
+                warnings.append(f"{company_name} 价格为负数，已跳过: {product_name} {specification}")
+                continue
+            matches[i] = PriceMatch(
+                product_name=product_name,
+                specification=specification,
+                company_name=company_name,
+                price=price,
+                brand=str(result["品牌"][i]).strip(),
+                match_confidence=float(result["置信度"][i]),
+                original_row=matcher.price_df.iloc[position].to_dict()
+            )
+        return matches
     
-    def _calculate_match_score(
+    def match_single_company(
         self, 
-        inquiry_name: str, 
-        inquiry_spec: str,
-        price_model: str, 
-        price_spec: str
-    ) -> float:
-        """计算匹配分数"""
-        score = 0.0
-        
-        # 产品名称匹配 (权重 0.4)
-        name_score = self._text_similarity(inquiry_name, price_model)
-        score += name_score * 0.4
-        
-        # 规格匹配 (权重 0.6)
-        spec_score = self._specification_similarity(inquiry_spec, price_spec)
-        score += spec_score * 0.6
-        
-        return min(score, 1.0)
-    
-    def _text_similarity(self, text1: str, text2: str) -> float:
-        """计算文本相似度"""
-        if not text1 or not text2:
-            return 0.0
-        
-        text1 = text1.lower().strip()
-        text2 = text2.lower().strip()
-        
-        # 完全匹配
-        if text1 == text2:
-            return 1.0
-        
-        # 包含关系
-        if text1 in text2 or text2 in text1:
-            return 0.8
-        
-        # 关键词匹配
-        words1 = set(re.findall(r'\w+', text1))
-        words2 = set(re.findall(r'\w+', text2))
-        
-        if words1 and words2:
-            intersection = words1.intersection(words2)
-            union = words1.union(words2)
-            return len(intersection) / len(union)
-        
-        return 0.0
-    
-    def _specification_similarity(self, spec1: str, spec2: str) -> float:
-        """计算规格相似度"""
-        if not spec1 or not spec2:
-            return 0.0
-        
-        spec1 = spec1.upper().strip()
-        spec2 = spec2.upper().strip()
-        
-        # 完全匹配
-        if spec1 == spec2:
-            return 1.0
-        
-        # 提取DN值进行比较
-        dn1 = self._extract_dn_value(spec1)
-        dn2 = self._extract_dn_value(spec2)
-        
-        if dn1 and dn2:
-            if dn1 == dn2:
-                return 0.9  # DN值匹配给高分
-            else:
-                return 0.3  # DN值不匹配给低分
-        
-        # 文本相似度
-        return self._text_similarity(spec1, spec2)
-    
-    def _extract_dn_value(self, text: str) -> Optional[str]:
-        """提取DN值"""
-        if not text:
-            return None
-        
-        # 匹配DN后面的数字
-        patterns = [
-            r'DN\s*(\d+)',
-            r'φ\s*(\d+)',
-            r'Φ\s*(\d+)',
-            r'∅\s*(\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        inquiry_data: pd.DataFrame, 
+        price_table: PriceTableInfo
+    ) -> Dict[int, PriceMatch]:
+        """对单个公司执行产品匹配，返回 询价行序号 -> 匹配结果（未匹配的行不出现）"""
+        if not price_table.is_valid or not (price_table.file_path or price_table.data is not None):
+            return {}
         
-        return None
+        company_name = price_table.company_name
+        print(f"🔍 [MATCHER] 开始匹配 {company_name}")
+        matchers = self._load_matchers([price_table], [])
+        if not matchers:
+            return {}
+        matcher = matchers[company_name]
+        matches = self._company_matches(inquiry_data, company_name, matcher, matcher.match_batch(inquiry_data), [])
+        print(f"✅ [MATCHER] {company_name} 匹配结果: {len(matches)} 个产品")
+        return matches
     
     def _aggregate_matches(
         self, 
         inquiry_data: pd.DataFrame, 
-        all_matches: Dict[str, List[PriceMatch]]
+        all_matches: Dict[str, Dict[int, PriceMatch]]
     ) -> List[AggregatedPriceInfo]:
-        """聚合匹配结果"""
+        """聚合匹配结果
+
+        各公司结果按询价行序号直接取出，统计量在 询价行 × 公司 的价格矩阵上一次算出。
+        """
+        items = self._inquiry_items(inquiry_data)
+        companies = list(all_matches)
+        row_of = {i: r for r, (i, _, _) in enumerate(items)}
+        
+        # 价格矩阵，未匹配为 NaN
+        prices = np.full((len(items), len(companies)), np.nan)
+        for j, company_name in enumerate(companies):
+            for i, match in all_matches[company_name].items():
+                if i in row_of:
+                    prices[row_of[i], j] = match.price
+        
+        matched = ~np.isnan(prices)
+        match_counts = matched.sum(axis=1)
+        min_prices = np.where(matched, prices, np.inf).min(axis=1, initial=np.inf)
+        max_prices = np.where(matched, prices, -np.inf).max(axis=1, initial=-np.inf)
+        avg_prices = np.where(matched, prices, 0.0).sum(axis=1) / np.maximum(match_counts, 1)
+        # 最低价的公司：同价时取靠前的公司
+        best_positions = np.argmin(np.where(matched, prices, np.inf), axis=1) if companies else np.zeros(len(items), dtype=int)
+        
+        quantities = inquiry_data['数量'] if '数量' in inquiry_data.columns else None
         aggregated_prices = []
-        
-        for idx, inquiry_row in inquiry_data.iterrows():
-            # 跳过合计行和空行
-            if pd.isna(inquiry_row.get('品名')) or str(inquiry_row.get('品名')).strip() in ['合计', '']:
-                continue
-            
-            product_name = str(inquiry_row.get('品名', '')).strip()
-            specification = str(inquiry_row.get('规格型号', '')).strip()
-            quantity = str(inquiry_row.get('数量', '')).strip()
-            
-            if not product_name:
-                continue
-            
-            # 收集该产品在所有公司的匹配结果
-            company_prices = {}
-            
-            for company_name, matches in all_matches.items():
-                for match in matches:
-                    if (match.product_name == product_name and 
-                        match.specification == specification):
-                        company_prices[company_name] = match
-                        break
+        for r, (i, product_name, specification) in enumerate(items):
+            quantity = str(quantities.iloc[i]).strip() if quantities is not None else ''
+            company_prices = {
+                company_name: all_matches[company_name][i]
+                for j, company_name in enumerate(companies) if matched[r, j]
+            }
             
             # 创建聚合价格信息
-            aggregated_info = AggregatedPriceInfo(
-                product_name=product_name,
-                specification=specification,
-                quantity=quantity,
-                company_prices=company_prices
-            )
+            if match_counts[r]:
+                aggregated_info = AggregatedPriceInfo(
+                    product_name=product_name,
+                    specification=specification,
+                    quantity=quantity,
+                    company_prices=company_prices,
+                    min_price=float(min_prices[r]),
+                    max_price=float(max_prices[r]),
+                    avg_price=float(avg_prices[r]),
+                    best_company=companies[best_positions[r]],
+                    match_count=int(match_counts[r]),
+                    row_index=i
+                )
+            else:
+                aggregated_info = AggregatedPriceInfo(
+                    product_name=product_name,
+                    specification=specification,
+                    quantity=quantity,
+                    row_index=i
+                )
             
             aggregated_prices.append(aggregated_info)
         
-        return aggregated_prices
\ No newline at end of file
+        return aggregated_prices
@@ -3,6 +3,7 @@
 """
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Any
+import numpy as np
 import pandas as pd
 
 @dataclass
@@ -12,6 +13,7 @@ class PriceTableInfo:
     company_name: str
     file_format: str  # 'xlsx', 'csv'
     is_valid: bool
+    # 扫描得到的价格表只记录路径，匹配时经共享缓存载入索引；没有文件的价格表才在这里携带数据
     data: Optional[pd.DataFrame] = None
     error_message: Optional[str] = None
 
@@ -46,23 +48,21 @@ class AggregatedPriceInfo:
     best_company: str = ""
     price_range: str = ""
     match_count: int = 0
+    row_index: int = -1  # 询价表中的行序号
     
     def __post_init__(self):
-        """自动计算统计信息"""
-        if self.company_prices:
-            prices = [match.price for match in self.company_prices.values()]
-            self.min_price = min(prices)
-            self.max_price = max(prices)
-            self.avg_price = sum(prices) / len(prices)
+        """自动计算统计信息（聚合时已由价格矩阵批量算出 match_count 等统计量的跳过计算）"""
+        if self.company_prices and not self.match_count:
+            prices = np.array([match.price for match in self.company_prices.values()], dtype=float)
+            best = int(np.argmin(prices))  # 同价时取靠前的公司
+            self.min_price = float(prices[best])
+            self.max_price = float(prices.max())
+            self.avg_price = float(prices.sum() / len(prices))
             self.match_count = len(prices)
-            
-            # 找到最低价格的公司
-            for company, match in self.company_prices.items():
-                if match.price == self.min_price:
-                    self.best_company = company
-                    break
-            
-            # 设置价格范围描述
+            self.best_company = list(self.company_prices)[best]
+        
+        # 设置价格范围描述
+        if self.match_count and not self.price_range:
             if self.min_price == self.max_price:
                 self.price_range = f"¥{self.min_price:.2f}"
             else:
@@ -93,6 +93,7 @@ class MultiCompanyQuoteResult:
     processing_time: float
     errors: List[str] = field(default_factory=list)
     warnings: List[str] = field(default_factory=list)
+    cache_stats: Dict[str, Any] = field(default_factory=dict)  # 匹配结果缓存命中统计
     
     @property
     def match_rate(self) -> float:
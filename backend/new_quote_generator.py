@@ -12,6 +12,7 @@ from pathlib import Path
 from datetime import datetime
 from csv_utils import safe_read_csv, safe_to_csv
 from valve_model_generator import parse_valve_info_from_combined
+from valve_parser import DN_COLUMN, MATERIAL_COLUMN, PN_COLUMN, extract_spec_columns
 from generate_quotes import process_inquiry_file
 
 def generate_quote_with_new_order(inquiry_path, price_path, output_dir, username, company):
@@ -75,10 +76,9 @@ def generate_quote_with_new_order(inquiry_path, price_path, output_dir, username
         # 步骤3: 最后生成标准型号（合并所有单元格信息）
         print("🔧 [NEW-QUOTE] 步骤3: 最后生成标准型号 - 合并所有单元格信息...")
         
-        models = []
+        combined_texts = {}
         for index, row in df.iterrows():
             if pd.isna(row['品名']) or row['品名'] == '合计':
-                models.append('')
                 continue
             
             # 合并同一行的所有单元格信息 - 真正的所有单元格，包括备注等
@@ -102,10 +102,17 @@ def generate_quote_with_new_order(inquiry_path, price_path, output_dir, username
             # 将所有单元格信息合并为一个完整的字符串
             combined_info = ' '.join(all_cell_info)
             print(f"🔧 [NEW-QUOTE] 第{index+1}行所有单元格合并信息: {combined_info}")
-            
+            combined_texts[index] = combined_info
+        
+        # DN/PN/材质对所有合并信息整列解析一次，再逐行生成标准型号
+        combined_series = pd.Series(combined_texts, dtype=object)
+        columns = extract_spec_columns(combined_series)
+        models = pd.Series('', index=df.index, dtype=object)
+        for index, combined_info, dn, pn, material in zip(combined_series.index, combined_series, columns[DN_COLUMN],
+                                                          columns[PN_COLUMN], columns[MATERIAL_COLUMN]):
             # 使用合并后的完整信息生成标准型号
-            model = parse_valve_info_from_combined(combined_info, username, True)
-            models.append(model)
+            model = parse_valve_info_from_combined(combined_info, username, True, dn, pn, material)
+            models[index] = model
             print(f"✅ [NEW-QUOTE] 第{index+1}行标准型号生成: {combined_info} -> {model}")
         
         # 添加标准型号列
@@ -0,0 +1,325 @@
+"""
+价格表缓存 - 进程内共享的已解析价格表缓存
+
+按 (文件路径, 修改时间, 文件大小) 缓存 pd.read_excel / CSV 的解析结果，
+文件被覆盖或编辑后键自动变化，旧条目按 LRU 顺序在超出内存预算时淘汰。
+同一缓存还保存由价格表构建的 PriceTableIndex（归一化列、品牌分区、DN 分桶），
+跨请求复用，避免每次匹配都重新归一化整张表。
+正在编辑、尚未并入基准文件的价格表（见 price_table_store）登记为“在编”表，
+读取时优先返回其内存中的最新内容（基准文件加编辑日志）。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from csv_utils import safe_read_csv
+from price_table_journal import has_journal
+from price_table_sidecar import load_sidecar, write_sidecar
+
+# 默认内存预算（MB），可通过环境变量 PRICE_TABLE_CACHE_MB 调整
+DEFAULT_CACHE_MB = int(os.environ.get("PRICE_TABLE_CACHE_MB", "256"))
+
+
+def _file_signature(file_path: str) -> Tuple[str, int, int]:
+    """返回缓存键使用的文件签名 (绝对路径, mtime_ns, size)"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size
+
+
+def _parse_price_file(file_path: str) -> pd.DataFrame:
+    """解析价格表文件，支持 .csv / .xlsx / .xls
+
+    Excel 文件优先载入新鲜的列式旁路文件，否则解析 Excel 并顺带重建旁路文件。
+    """
+    if str(file_path).lower().endswith(".csv"):
+        return safe_read_csv(file_path)
+    df = load_sidecar(file_path)
+    if df is not None:
+        print(f"⚡ [CACHE] 从列式旁路文件载入: {os.path.basename(file_path)}")
+        return df
+    df = pd.read_excel(file_path)
+    write_sidecar(file_path, df)
+    return df
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    """估算 DataFrame 占用的内存字节数"""
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+class PriceTableCache:
+    """按文件签名缓存价格表 DataFrame，按内存预算做 LRU 淘汰"""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+        self._live: Dict[str, Any] = {}
+        # 由 price_table_store 设置：重放磁盘上的编辑日志并返回在编表
+        self.journal_replayer: Optional[Callable[[str], Any]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> pd.DataFrame:
+        """读取价格表（经过缓存），返回调用方可以自由修改的副本
+
+        standardize: 可选的列名标准化函数，标准化后的结果按函数名单独缓存
+        """
+        live = self._live_table(file_path)
+        if live is not None:
+            return live.index(standardize).price_df.copy()
+        return self._load_file(file_path, standardize).copy()
+
+    def _lookup(self, key: tuple, count: bool = True):
+        """取缓存条目（未命中为 None）；count 为 False 时不计入命中统计"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if count:
+                if entry is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return entry[0] if entry is not None else None
+
+    def _load_file(self, file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                   count: bool = True) -> pd.DataFrame:
+        """按文件签名读取磁盘上的价格表（不含在编内容），返回缓存中的共享对象
+
+        count: 是否计入命中统计；内部为构建标准化结果或索引而读取原始结果时不重复计数。
+        """
+        signature = _file_signature(file_path)
+        variant = getattr(standardize, "__qualname__", None) if standardize else None
+        key = signature + (variant,)
+
+        df = self._lookup(key, count)
+        if df is not None:
+            return df
+
+        if variant is not None:
+            # 标准化结果建立在原始解析结果之上，原始结果同样走缓存
+            df = standardize(self._load_file(file_path, count=False).copy())
+        else:
+            df = _parse_price_file(file_path)
+            print(f"📊 [CACHE] 解析价格表: {os.path.basename(file_path)} ({len(df)} 行)")
+
+        self._store(key, df)
+        return df
+
+    def view(self, file_path: str) -> pd.DataFrame:
+        """返回价格表的共享只读视图（在编表为已发布的最新快照），不做整表复制
+
+        调用方只能读取或对切片取副本，不能原地修改；之后的编辑不会改动已返回的视图。
+        """
+        live = self._live_table(file_path)
+        if live is not None:
+            # 在编表的 df 会被原地编辑，这里取经编辑锁发布的只读快照
+            return live.index(None).price_df
+        return self._load_file(file_path)
+
+    def load_index(self, file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None):
+        """读取价格表的匹配索引（经过缓存）
+
+        返回的索引及其 price_df 在请求之间共享，调用方只能读取。
+        """
+        live = self._live_table(file_path)
+        if live is not None:
+            return live.index(standardize)
+        return self.load_file_index(file_path, standardize)
+
+    def load_file_index(self, file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None):
+        """按文件签名读取磁盘上价格表的索引（不含在编内容、不重放编辑日志）"""
+        from price_table_index import PriceTableIndex
+
+        signature = _file_signature(file_path)
+        variant = getattr(standardize, "__qualname__", None) if standardize else None
+        key = signature + (variant, "index")
+
+        index = self._lookup(key)
+        if index is not None:
+            return index
+
+        index = PriceTableIndex(self._load_file(file_path, standardize, count=False).copy())
+        index.version = key
+        index.frozen = True
+        print(f"📊 [CACHE] 构建价格表索引: {os.path.basename(file_path)} ({len(index.partitions(index.brand_col)) if index.brand_col else 0} 个品牌分区)")
+        self._store(key, index, _frame_nbytes(index.price_df) + index.nbytes())
+        return index
+
+    def _live_table(self, file_path: str):
+        """在编表；没有在编表但磁盘上留有编辑日志时（如进程重启后），由 journal_replayer 重放登记"""
+        with self._lock:
+            live = self._live.get(os.path.abspath(file_path))
+            if live is not None:
+                self.hits += 1
+                return live
+        if self.journal_replayer is not None and has_journal(file_path):
+            return self.journal_replayer(file_path)
+        return None
+
+    def live_version(self, file_path: str) -> Optional[tuple]:
+        """在编表的版本号；没有在编表时返回 None"""
+        with self._lock:
+            live = self._live.get(os.path.abspath(file_path))
+            return live.version if live is not None else None
+
+    def live_shape(self, file_path: str) -> Optional[Tuple[int, List[str]]]:
+        """在编表当前的 (行数, 列名)；没有在编表时返回 None（不重放编辑日志）"""
+        with self._lock:
+            live = self._live.get(os.path.abspath(file_path))
+        if live is None:
+            return None
+        return live.row_count, [str(col) for col in live.columns]
+
+    def disable_live(self):
+        """在子进程中调用：丢弃从父进程继承的在编表登记（不关闭它们），并停止重放编辑日志
+
+        编辑、日志和压缩只由主进程负责，子进程只按文件读取。
+        """
+        with self._lock:
+            self._live.clear()
+        self.journal_replayer = None
+
+    def attach_live(self, file_path: str, table):
+        """登记在编表，并取出该文件当前版本已缓存的索引交给它（其余条目丢弃）"""
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            signature = _file_signature(file_path)
+            indexes = {
+                key[3]: entry[0] for key, entry in self._entries.items()
+                if key[:3] == signature and len(key) == 5 and key[4] == "index"
+            }
+            for key in [k for k in self._entries if k[0] == abs_path]:
+                self._drop(key)
+            self._live[abs_path] = table
+            return indexes
+
+    def detach_live(self, file_path: str, table, indexes: Optional[Dict[Optional[str], Any]] = None):
+        """在编表已写回磁盘：注销它，并把其索引按新的文件签名放回缓存"""
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            if self._live.get(abs_path) is table:
+                del self._live[abs_path]
+            if not indexes:
+                return
+            signature = _file_signature(file_path)
+            for variant, index in indexes.items():
+                key = signature + (variant, "index")
+                index.version = key
+                index.frozen = True
+                self._store(key, index, _frame_nbytes(index.price_df) + index.nbytes())
+            if None in indexes:
+                self._store(signature + (None,), indexes[None].price_df)
+
+    def _store(self, key: tuple, value, nbytes: Optional[int] = None):
+        if nbytes is None:
+            nbytes = _frame_nbytes(value)
+        with self._lock:
+            # 同一文件的旧版本已失效，直接丢弃
+            for stale_key in [k for k in self._entries if k[0] == key[0] and k[1:3] != key[1:3]]:
+                self._drop(stale_key)
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: tuple):
+        _, nbytes = self._entries.pop(key)
+        self._total_bytes -= nbytes
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """清除指定文件（或全部）的缓存条目；在编表一并关闭，未写回的编辑被放弃"""
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                live_tables = list(self._live.values())
+                self._live.clear()
+            else:
+                abs_path = os.path.abspath(file_path)
+                for key in [k for k in self._entries if k[0] == abs_path]:
+                    self._drop(key)
+                live = self._live.pop(abs_path, None)
+                live_tables = [live] if live is not None else []
+        for live in live_tables:
+            live.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "live_tables": len(self._live),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# 进程内共享实例
+price_table_cache = PriceTableCache()
+
+
+def read_price_table(file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> pd.DataFrame:
+    """通过共享缓存读取价格表"""
+    return price_table_cache.load(file_path, standardize)
+
+
+def read_price_table_page(file_path: str, start: int, stop: int) -> Tuple[List[str], pd.DataFrame, int]:
+    """读取价格表的一页：返回 (列名, 第 start~stop 行的副本, 总行数)
+
+    整表常驻缓存，翻页只切片当前页，耗时与页大小成正比。
+    """
+    df = price_table_cache.view(file_path)
+    return df.columns.tolist(), df.iloc[start:stop].copy(), len(df)
+
+
+def load_price_table_index(file_path: str, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None):
+    """通过共享缓存读取价格表匹配索引（只读共享）"""
+    return price_table_cache.load_index(file_path, standardize)
+
+
+def load_price_table_search_view(file_path: str, standardize: Callable[[pd.DataFrame], pd.DataFrame],
+                                 attempts: int = 5) -> Tuple[Any, pd.DataFrame]:
+    """同一版本的 (标准化列名索引, 原始列名只读视图)
+
+    索引给出的行位置直接用于视图取行；两次读取之间价格表被编辑（版本号变化）时重新读取。
+    """
+    for _ in range(attempts):
+        version = price_table_version(file_path)
+        index = price_table_cache.load_index(file_path, standardize)
+        df = price_table_cache.view(file_path)
+        if version is not None and price_table_version(file_path) == version \
+                and index.version[:len(version)] == version:
+            return index, df
+    raise RuntimeError("价格表正在被频繁编辑，请稍后重试")
+
+
+def price_table_version(file_path: str) -> Optional[tuple]:
+    """价格表版本号：在编表为编辑版本，否则为文件签名；文件不存在时返回 None"""
+    live_version = price_table_cache.live_version(file_path)
+    if live_version is not None:
+        return live_version
+    try:
+        return _file_signature(file_path)
+    except OSError:
+        return None
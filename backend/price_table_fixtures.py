@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+价格表测试与基准测试共用的模拟数据：模拟价格表、询价查询、原逐行三匹配实现和临时价格表文件
+"""
+
+import os
+import random
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+import pandas as pd
+
+from price_table_cache import price_table_cache
+
+VALVE_NAMES = ['闸阀', '蝶阀', '球阀', '止回阀', '截止阀', '减压阀', '排气阀', '过滤器']
+MODEL_PREFIXES = ['Z45X', 'Z41X', 'D71X', 'D341X', 'Q41F', 'H44X', 'J41H', 'Y42X', 'P41X']
+BRANDS = ['上海沪工', '上海良工', '中核苏阀', '上海泰科', '上海科尼特']
+DN_VALUES = [15, 20, 25, 32, 40, 50, 65, 80, 100, 125, 150, 200, 250, 300]
+
+
+def build_price_table(rows: int, seed: int = 7) -> pd.DataFrame:
+    """生成模拟价格表"""
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        data.append({
+            '产品名称': rng.choice(VALVE_NAMES),
+            '型号': f"{rng.choice(MODEL_PREFIXES)}-{rng.choice([10, 16, 25])}Q",
+            '规格': f"DN{rng.choice(DN_VALUES)}",
+            '价格': round(rng.uniform(50, 5000), 2),
+            '品牌': rng.choice(BRANDS),
+        })
+    return pd.DataFrame(data)
+
+
+def build_queries(count: int, seed: int = 11):
+    """生成模拟询价查询 (品名, 型号, 品牌, DN)"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        queries.append((
+            rng.choice(VALVE_NAMES),
+            f"{rng.choice(MODEL_PREFIXES)}-{rng.choice([10, 16, 25])}Q",
+            rng.choice(BRANDS + [None]),
+            f"DN{rng.choice(DN_VALUES)}" if rng.random() < 0.7 else '',
+        ))
+    return queries
+
+
+def legacy_tri_match(price_df: pd.DataFrame, product_name, model_code, selected_brand, dn_value):
+    """原 ImprovedPriceMatcher._tri_match 的逐行实现，返回 (行标签, 得分)"""
+    def normalize(s):
+        if pd.isna(s) or s is None:
+            return ""
+        return re.sub(r"\s+", "", str(s)).lower()
+
+    model_col = '型号' if '型号' in price_df.columns else None
+    name_col = None
+    for c in ['产品名称', '品名', '名称', '项目名称', '物料名称']:
+        if c in price_df.columns:
+            name_col = c
+            break
+    brand_col = '品牌' if '品牌' in price_df.columns else None
+    spec_col = '规格' if '规格' in price_df.columns else None
+
+    q_model = normalize(model_code)
+    q_name = normalize(product_name)
+    q_brand = normalize(selected_brand) if selected_brand else ''
+
+    price_rows = price_df
+    if q_brand and brand_col:
+        price_rows = price_rows[price_rows[brand_col].apply(lambda x: normalize(x) == q_brand)]
+    if dn_value and spec_col:
+        dn_num = dn_value.replace('DN', '')
+        price_rows = price_rows[price_rows[spec_col].astype(str).str.contains(dn_num, case=False, na=False)]
+
+    best_score = 0
+    best_label = None
+    for label, prow in price_rows.iterrows():
+        p_model = normalize(prow.get(model_col, '')) if model_col else ''
+        p_name = normalize(prow.get(name_col, '')) if name_col else ''
+        p_brand = normalize(prow.get(brand_col, '')) if brand_col else ''
+        score = 0
+        if q_model and p_model and q_model == p_model:
+            score += 10
+        elif q_model and p_model and (q_model in p_model or p_model in q_model):
+            score += 6
+        if q_name and p_name and q_name == p_name:
+            score += 5
+        elif q_name and p_name and (q_name in p_name or p_name in q_name):
+            score += 3
+        if q_brand and p_brand and q_brand == p_brand:
+            score += 2
+        elif q_brand and p_brand and (q_brand in p_brand or p_brand in q_brand):
+            score += 1
+        if score > best_score:
+            best_score = score
+            best_label = label
+
+    if best_label is not None and best_score > 0:
+        return best_label, best_score
+    return None
+
+
+
+@contextmanager
+def temp_price_table(rows: int = 30, name: str = '价格表.xlsx', frame: Optional[pd.DataFrame] = None):
+    """在临时目录写入一张模拟价格表，返回其路径；退出时关闭在编表并清除缓存
+
+    name 可以带子目录（如 "价格表/甲公司.xlsx"），扩展名为 .csv 时写 CSV；
+    frame 不为空时写入 frame，否则写入 build_price_table(rows)。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df = build_price_table(rows) if frame is None else frame
+        if path.lower().endswith('.csv'):
+            df.to_csv(path, index=False)
+        else:
+            df.to_excel(path, index=False)
+        try:
+            yield path
+        finally:
+            price_table_cache.invalidate(path)
@@ -0,0 +1,618 @@
+"""
+价格表匹配索引 - 加载价格表时预先归一化型号/名称/品牌列，向量化打分
+
+把 ImprovedPriceMatcher 三匹配中逐行 iterrows + normalize 的打分改为
+对 NumPy 定长字符串数组的一次性比较，权重保持不变：
+型号 完全相等 10 / 互相包含 6，名称 5 / 3，品牌 2 / 1。
+规格列解析为整数 DN 并按 DN 分桶，查询只在对应桶内进行。
+"""
+import copy
+import itertools
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+NAME_COLUMNS = ['产品名称', '品名', '名称', '项目名称', '物料名称']
+PRICE_COLUMNS = ['价格', '单价']
+# 价格表搜索支持的排序字段
+SORT_FIELDS = ('model', 'brand', 'dn', 'price')
+
+# (完全相等得分, 互相包含得分)
+MODEL_WEIGHTS = (10, 6)
+NAME_WEIGHTS = (5, 3)
+BRAND_WEIGHTS = (2, 1)
+
+_WHITESPACE = re.compile(r"\s+")
+_DN_PATTERNS = [re.compile(p) for p in (r'DN\s*(\d+)', r'φ\s*(\d+)', r'Φ\s*(\d+)', r'∅\s*(\d+)', r'直径\s*(\d+)')]
+# 没有 DN/φ/直径 前缀时只接受整个规格就是一个整数（如 “50”，Excel 数值列读出的 “50.0”）
+_BARE_NUMBER = re.compile(r'^\s*(\d+)(?:\.0+)?\s*$')
+_EMPTY_POSITIONS = np.array([], dtype=np.int64)
+_LOCAL_VERSIONS = itertools.count(1)
+
+
+def normalize_text(value) -> str:
+    """去除空白并转小写，空值返回空字符串"""
+    if value is None or pd.isna(value):
+        return ""
+    return _WHITESPACE.sub("", str(value)).lower()
+
+
+def parse_dn(value, fallback_number: bool = True) -> Optional[int]:
+    """从规格文本解析整数 DN：取 DN/φ/直径 后的数字；fallback_number 时纯整数规格（如 “50”）也视为 DN
+
+    “1.6MPa”、“PN16” 这类规格没有 DN，不会取其中的数字。
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    text = str(value).upper()
+    for pattern in _DN_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return int(match.group(1))
+    if not fallback_number:
+        return None
+    match = _BARE_NUMBER.match(text)
+    return int(match.group(1)) if match else None
+
+
+def to_float(value) -> float:
+    """单元格转为浮点数，空值或无法解析时为 NaN（与 pd.to_numeric(errors='coerce') 一致）"""
+    try:
+        return float(value) if value is not None and value != '' else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_dn_series(values: pd.Series) -> pd.Series:
+    """parse_dn 的整列版本：用 str.extract 按同样的优先级解析，返回可空整数列"""
+    text = values.astype(str).str.upper()
+    dn = pd.Series(np.nan, index=values.index, dtype=float)
+    for pattern in _DN_PATTERNS + [_BARE_NUMBER]:
+        if not dn.isna().any():
+            break
+        dn = dn.fillna(text.str.extract(pattern.pattern, expand=False).astype(float))
+    return dn.astype('Int64')
+
+
+def build_dn_buckets(specs: pd.Series) -> Dict[int, np.ndarray]:
+    """按整数 DN 分桶，返回 DN -> 行位置数组（按行顺序）"""
+    buckets: Dict[int, list] = {}
+    for position, dn in enumerate(specs.map(parse_dn)):
+        if dn is not None and not pd.isna(dn):
+            buckets.setdefault(int(dn), []).append(position)
+    return {dn: np.array(positions, dtype=np.int64) for dn, positions in buckets.items()}
+
+
+def _as_unicode_array(values) -> np.ndarray:
+    """转换为 NumPy 定长 unicode 数组（空表时返回 '<U1' 空数组）"""
+    values = list(values)
+    if not values:
+        return np.array([], dtype='<U1')
+    return np.array(values, dtype=str)
+
+
+def field_scores(values: np.ndarray, query: str, weights: Tuple[int, int]) -> np.ndarray:
+    """对一列归一化文本打分：完全相等得 weights[0]，互相包含得 weights[1]"""
+    if not query or values.size == 0:
+        return np.zeros(values.shape, dtype=np.int32)
+    exact_weight, partial_weight = weights
+    exact = values == query
+    partial = (values != '') & (
+        (np.char.find(values, query) >= 0) | (np.char.find(query, values) >= 0)
+    )
+    return np.where(exact, exact_weight, np.where(partial, partial_weight, 0)).astype(np.int32)
+
+
+def _bucket_insert(buckets: dict, key, position: int):
+    """把行位置按顺序插入某个分桶"""
+    if key is None:
+        return
+    positions = buckets.get(key, _EMPTY_POSITIONS)
+    buckets[key] = np.insert(positions, np.searchsorted(positions, position), position)
+
+
+def _bucket_remove(buckets: dict, key, position: int):
+    """从某个分桶移除行位置，空桶删除"""
+    positions = buckets.get(key)
+    if positions is None:
+        return
+    positions = positions[positions != position]
+    if positions.size:
+        buckets[key] = positions
+    else:
+        del buckets[key]
+
+
+def _buckets_delete_position(buckets: dict, position: int):
+    """删除一行后，所有分桶去掉该行并把其后的行位置前移一位"""
+    for key in list(buckets):
+        positions = buckets[key]
+        positions = positions[positions != position]
+        if positions.size:
+            buckets[key] = np.where(positions > position, positions - 1, positions)
+        else:
+            del buckets[key]
+
+
+def _fits_dtype(dtype, value) -> bool:
+    """值能否原样写入该类型的列（不改变列类型）"""
+    if dtype == object:
+        return True
+    is_missing = value is None or (isinstance(value, float) and np.isnan(value))
+    if pd.api.types.is_bool_dtype(dtype):
+        return isinstance(value, (bool, np.bool_))
+    if pd.api.types.is_integer_dtype(dtype):
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, np.integer)):
+            return False
+        limits = np.iinfo(dtype)
+        return limits.min <= value <= limits.max
+    if pd.api.types.is_float_dtype(dtype):
+        return is_missing or (isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)))
+    if pd.api.types.is_string_dtype(dtype):
+        return is_missing or isinstance(value, str)
+    return False
+
+
+def _set_cell(df: pd.DataFrame, position: int, column_position: int, value):
+    """原地写入单元格；值与列类型不兼容（如数字列写入文本）时先显式把该列转为 object
+
+    不依赖 pandas 对不兼容写入的处理：2.x 会警告并隐式转换，3.x 直接报错。
+    """
+    column = df.iloc[:, column_position]
+    if not _fits_dtype(column.dtype, value):
+        df.isetitem(column_position, column.astype(object))
+    df.iat[position, column_position] = value
+
+
+class NormalizedColumn:
+    """归一化后的一列：按取值去重，打分只在去重值上做一次再按编码展开"""
+
+    __slots__ = ('codes', 'uniques', '_lookup')
+
+    def __init__(self, normalized: pd.Series):
+        codes, uniques = pd.factorize(normalized, sort=False)
+        self.codes = codes.astype(np.int32, copy=False)
+        self.uniques = _as_unicode_array(uniques)
+        self._lookup: Optional[Dict[str, int]] = None
+
+    def clone(self) -> 'NormalizedColumn':
+        """可独立修改的副本（去重值数组只会整体替换，可以共享）"""
+        other = NormalizedColumn.__new__(NormalizedColumn)
+        other.codes = self.codes.copy()
+        other.uniques = self.uniques
+        other._lookup = dict(self._lookup) if self._lookup is not None else None
+        return other
+
+    def value_at(self, position: int) -> str:
+        return str(self.uniques[self.codes[position]])
+
+    def _code_for(self, value: str) -> int:
+        """取值对应的编码，新取值追加到去重值末尾"""
+        if self._lookup is None:
+            self._lookup = {str(v): i for i, v in enumerate(self.uniques)}
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.uniques)
+            self.uniques = np.append(self.uniques, np.array([value], dtype=str)) if self.uniques.size else _as_unicode_array([value])
+            self._lookup[value] = code
+        return code
+
+    def set(self, position: int, value: str):
+        self.codes[position] = self._code_for(value)
+
+    def append(self, value: str):
+        self.codes = np.append(self.codes, np.int32(self._code_for(value)))
+
+    def delete(self, position: int):
+        self.codes = np.delete(self.codes, position)
+
+    def prefix_mask(self, positions: np.ndarray, prefix: str) -> np.ndarray:
+        """判断候选行是否以 prefix 开头"""
+        if positions.size == 0 or self.uniques.size == 0:
+            return np.zeros(positions.shape, dtype=bool)
+        return np.char.startswith(self.uniques, prefix)[self.codes[positions]]
+
+    def contains_mask(self, positions: np.ndarray, text: str) -> np.ndarray:
+        """判断候选行是否包含 text"""
+        if positions.size == 0 or self.uniques.size == 0:
+            return np.zeros(positions.shape, dtype=bool)
+        return (np.char.find(self.uniques, text) >= 0)[self.codes[positions]]
+
+    def sort_keys(self, positions: np.ndarray) -> np.ndarray:
+        """候选行按归一化取值的字典序名次，用作排序键"""
+        ranks = np.empty(self.uniques.size, dtype=np.int64)
+        ranks[np.argsort(self.uniques, kind='stable')] = np.arange(self.uniques.size)
+        return ranks[self.codes[positions]]
+
+    def equals(self, positions: np.ndarray, query: str) -> np.ndarray:
+        """判断候选行是否与 query 完全相等"""
+        if positions.size == 0:
+            return np.zeros(0, dtype=bool)
+        return (self.uniques == query)[self.codes[positions]]
+
+    def scores(self, positions: np.ndarray, query: str, weights: Tuple[int, int]) -> np.ndarray:
+        """返回候选行的得分"""
+        if not query or positions.size == 0:
+            return np.zeros(positions.shape, dtype=np.int32)
+        return field_scores(self.uniques, query, weights)[self.codes[positions]]
+
+
+class PriceTableIndex:
+    """价格表的归一化列、DN 分桶、品牌分区与向量化打分引擎
+
+    索引持有的 price_df 在多个请求之间共享，调用方只能读取；
+    编辑只能经 price_table_store 调用下面的原地编辑方法，由它增量维护各结构。
+    交给读取方的是 snapshot()（不可变快照）：报价任务持有它直到结束，
+    快照仍被持有时编辑方先 clone() 出新索引再修改，已发布的快照永远不会被改动。
+    追加/删除行只记录在行序中，读取 price_df 时才一次性并入，编辑耗时与表的大小无关。
+    """
+
+    def __init__(self, price_df: pd.DataFrame):
+        self.price_df = price_df
+        # 价格表版本号，用作匹配结果缓存键的一部分；经 PriceTableCache 构建时为文件签名
+        self.version: tuple = ('local', next(_LOCAL_VERSIONS))
+        # 已发布给读取方的只读快照不能再原地编辑
+        self.frozen = False
+        self._columns: Dict[str, NormalizedColumn] = {}
+        self._partitions: Dict[str, Dict[str, np.ndarray]] = {}
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._all_positions: Optional[np.ndarray] = None
+        self.spec_col = None
+        self.dn_buckets: Dict[int, np.ndarray] = {}
+        self._detect_columns()
+
+    def _detect_columns(self):
+        """识别型号/名称/品牌/规格列，并预建对应的归一化列、品牌分区和 DN 分桶"""
+        columns = self.columns
+        self.model_col = '型号' if '型号' in columns else None
+        self.name_col = next((c for c in NAME_COLUMNS if c in columns), None)
+        self.brand_col = '品牌' if '品牌' in columns else None
+        self.price_col = next((c for c in PRICE_COLUMNS if c in columns), None)
+        spec_col = '规格' if '规格' in columns else None
+
+        for col in (self.model_col, self.name_col, self.brand_col):
+            if col is not None:
+                self.column(col)
+        # 品牌分区：归一化品牌 -> 行位置
+        if self.brand_col:
+            self.partitions(self.brand_col)
+        # 规格解析为整数 DN 后分桶
+        if spec_col != self.spec_col or (spec_col and not self.dn_buckets):
+            self.spec_col = spec_col
+            self.dn_buckets = build_dn_buckets(self.price_df[spec_col]) if spec_col else {}
+
+    @property
+    def price_df(self) -> pd.DataFrame:
+        """价格表内容；尚未并入的追加/删除行在这里一次性并入"""
+        if self._tail or self._order is not None:
+            df = pd.concat([self._base] + self._tail, ignore_index=True) if self._tail else self._base
+            if self._order is not None:
+                df = df.take(self._order)
+            self._base, self._tail, self._order = df.reset_index(drop=True), [], None
+        return self._base
+
+    @price_df.setter
+    def price_df(self, df: pd.DataFrame):
+        # _base: 已并入的行；_tail: 追加的单行表；_order: 逻辑行 -> 物理行（None 为按序全部行）
+        self._base, self._tail, self._order = df, [], None
+
+    @property
+    def columns(self) -> pd.Index:
+        """列名（不需要并入追加/删除的行）"""
+        return self._base.columns
+
+    def __len__(self) -> int:
+        if self._order is not None:
+            return len(self._order)
+        return len(self._base) + len(self._tail)
+
+    def _locate(self, position: int) -> Tuple[pd.DataFrame, int]:
+        """逻辑行位置对应的 (物理表, 行号)，不并入追加/删除的行"""
+        physical = int(self._order[position]) if self._order is not None else position
+        if physical < len(self._base):
+            return self._base, physical
+        return self._tail[physical - len(self._base)], 0
+
+    def row(self, position: int) -> pd.Series:
+        """按逻辑行位置取一行"""
+        frame, row = self._locate(position)
+        return frame.iloc[row]
+
+    def column(self, col: str) -> NormalizedColumn:
+        """返回某列的归一化结果（首次访问时构建并缓存）"""
+        normalized = self._columns.get(col)
+        if normalized is None:
+            normalized = NormalizedColumn(self.price_df[col].map(normalize_text).astype(object))
+            self._columns[col] = normalized
+        return normalized
+
+    def _first_position(self, col: str) -> int:
+        """列名重复（多个原始列映射到同一标准列名）时取第一列的位置"""
+        return list(self.columns).index(col)
+
+    def numeric(self, col: str) -> np.ndarray:
+        """返回某列解析为浮点数的结果（无法解析为 NaN，首次访问时构建并缓存）"""
+        values = self._numeric.get(col)
+        if values is None:
+            column = self.price_df.iloc[:, self._first_position(col)]
+            values = pd.to_numeric(column, errors='coerce').to_numpy(dtype=float, copy=True)
+            self._numeric[col] = values
+        return values
+
+    def dn_values(self, positions: np.ndarray) -> np.ndarray:
+        """候选行的整数 DN（没有 DN 为 NaN），由 DN 分桶展开"""
+        dn = np.full(len(self), np.nan)
+        for value, bucket in self.dn_buckets.items():
+            dn[bucket] = value
+        return dn[positions]
+
+    def partitions(self, col: str) -> Dict[str, np.ndarray]:
+        """返回某列按归一化取值分区的行位置（首次访问时构建并缓存）"""
+        parts = self._partitions.get(col)
+        if parts is None:
+            normalized = self.column(col)
+            order = np.argsort(normalized.codes, kind='stable')
+            bounds = np.flatnonzero(np.diff(normalized.codes[order])) + 1
+            parts = {}
+            for group in np.split(order, bounds) if order.size else []:
+                parts[str(normalized.uniques[normalized.codes[group[0]]])] = group.astype(np.int64)
+            self._partitions[col] = parts
+        return parts
+
+    def partition_positions(self, col: str, value: str) -> np.ndarray:
+        """返回某列归一化后等于 value 的行位置"""
+        return self.partitions(col).get(value, _EMPTY_POSITIONS)
+
+    def brand_names(self) -> List[str]:
+        """品牌下拉列表：品牌列去重后的原始取值（去首尾空格，按出现顺序）"""
+        if not self.brand_col:
+            return []
+        brand_values = self.price_df[self.brand_col].dropna().unique()
+        return [str(brand).strip() for brand in brand_values if str(brand).strip() and str(brand) != 'nan']
+
+    def dn_positions(self, dn_value) -> np.ndarray:
+        """返回规格 DN 与 dn_value 相同的行位置（DN10 不会命中 DN100）"""
+        dn = parse_dn(dn_value)
+        if dn is None:
+            return _EMPTY_POSITIONS
+        return self.dn_buckets.get(dn, _EMPTY_POSITIONS)
+
+    def candidate_positions(self, brand: str = '', dn_value: str = '') -> np.ndarray:
+        """按 DN 桶和品牌分区（归一化后相等）取候选行位置"""
+        if dn_value and self.spec_col:
+            positions = self.dn_positions(dn_value)
+            if brand and self.brand_col:
+                positions = np.intersect1d(positions, self.partition_positions(self.brand_col, brand), assume_unique=True)
+            return positions
+        if brand and self.brand_col:
+            return self.partition_positions(self.brand_col, brand)
+        if self._all_positions is None:
+            self._all_positions = np.arange(len(self), dtype=np.int64)
+        return self._all_positions
+
+    def score_columns(self, positions: np.ndarray, queries: List[Tuple[Optional[str], str, Tuple[int, int]]]) -> np.ndarray:
+        """按 (列名, 归一化查询值, 权重) 列表对候选行打分并求和，列名为 None 的项跳过"""
+        scores = np.zeros(len(positions), dtype=np.int32)
+        for col, query, weights in queries:
+            if col is not None:
+                scores += self.column(col).scores(positions, query, weights)
+        return scores
+
+    def score(self, positions: np.ndarray, model: str, name: str, brand: str) -> np.ndarray:
+        """对候选行一次性计算三匹配总分"""
+        return self.score_columns(positions, [
+            (self.model_col, model, MODEL_WEIGHTS),
+            (self.name_col, name, NAME_WEIGHTS),
+            (self.brand_col, brand, BRAND_WEIGHTS),
+        ])
+
+    @staticmethod
+    def argmax(positions: np.ndarray, scores: np.ndarray) -> Optional[Tuple[int, int]]:
+        """取得分最高且大于 0 的行 (位置, 得分)，同分取靠前的行"""
+        if positions.size == 0:
+            return None
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None
+        return int(positions[best]), int(scores[best])
+
+    def best_match(self, model_code: str, product_name: str, selected_brand: Optional[str] = None,
+                   dn_value: str = '') -> Optional[Tuple[int, int]]:
+        """返回 (最佳行位置, 得分)；没有得分大于 0 的行时返回 None
+
+        得分相同时取价格表中靠前的行，与逐行比较 `score > best_score` 的结果一致。
+        """
+        q_model = normalize_text(model_code)
+        q_name = normalize_text(product_name)
+        q_brand = normalize_text(selected_brand) if selected_brand else ''
+
+        positions = self.candidate_positions(q_brand, dn_value)
+        return self.argmax(positions, self.score(positions, q_model, q_name, q_brand))
+
+    def search(self, model_prefix: str = '', brand: str = '', dn_min: Optional[int] = None,
+               dn_max: Optional[int] = None, price_min: Optional[float] = None, price_max: Optional[float] = None,
+               text: str = '', sort_by: Optional[str] = None, descending: bool = False) -> np.ndarray:
+        """按条件筛选并排序，返回命中的行位置
+
+        品牌走品牌分区，DN 区间合并 DN 分桶，型号前缀与全文检索在归一化列的去重值上比较，
+        价格区间与排序使用缓存的数值列；未指定排序时保持价格表原有顺序。
+        """
+        q_brand = normalize_text(brand)
+        if q_brand and not self.brand_col:
+            return _EMPTY_POSITIONS
+        positions = self.candidate_positions(q_brand)
+
+        if dn_min is not None or dn_max is not None:
+            buckets = [
+                bucket for dn, bucket in self.dn_buckets.items()
+                if (dn_min is None or dn >= dn_min) and (dn_max is None or dn <= dn_max)
+            ]
+            in_range = np.sort(np.concatenate(buckets)) if buckets else _EMPTY_POSITIONS
+            positions = np.intersect1d(positions, in_range, assume_unique=True)
+
+        q_model = normalize_text(model_prefix)
+        if q_model:
+            if not self.model_col:
+                return _EMPTY_POSITIONS
+            positions = positions[self.column(self.model_col).prefix_mask(positions, q_model)]
+
+        if price_min is not None or price_max is not None:
+            if not self.price_col:
+                return _EMPTY_POSITIONS
+            prices = self.numeric(self.price_col)[positions]
+            keep = ~np.isnan(prices)
+            if price_min is not None:
+                keep &= prices >= price_min
+            if price_max is not None:
+                keep &= prices <= price_max
+            positions = positions[keep]
+
+        q_text = normalize_text(text)
+        if q_text:
+            keep = np.zeros(positions.shape, dtype=bool)
+            for col in (self.model_col, self.name_col, self.spec_col, self.brand_col):
+                if col is not None:
+                    keep |= self.column(col).contains_mask(positions, q_text)
+            positions = positions[keep]
+
+        if sort_by is None or positions.size == 0:
+            return positions
+        if sort_by == 'price':
+            keys = self.numeric(self.price_col)[positions] if self.price_col else np.full(positions.shape, np.nan)
+        elif sort_by == 'dn':
+            keys = self.dn_values(positions)
+        else:
+            col = self.model_col if sort_by == 'model' else self.brand_col
+            keys = self.column(col).sort_keys(positions).astype(float) if col else np.zeros(positions.shape)
+        # 稳定排序；没有取值的行（NaN）无论升降序都排在最后
+        order = np.argsort(-keys if descending else keys, kind='stable')
+        return positions[order]
+
+    # ---- 原地编辑：修改 price_df 的同时增量维护归一化列、分区和 DN 分桶 ----
+
+    def clone(self) -> 'PriceTableIndex':
+        """可编辑的副本：复制会被原地修改的结构，只会整体替换的数组共享"""
+        other = copy.copy(self)
+        other.price_df = self.price_df.copy()
+        # 冻结的索引可能正被读取方按需补建列，先取快照再遍历
+        other._columns = {col: normalized.clone() for col, normalized in list(self._columns.items())}
+        other._partitions = {col: dict(parts) for col, parts in list(self._partitions.items())}
+        other.dn_buckets = dict(self.dn_buckets)
+        other._numeric = {col: values.copy() for col, values in list(self._numeric.items())}
+        other.frozen = False
+        return other
+
+    def snapshot(self) -> 'PriceTableIndex':
+        """只读快照：与本索引共享 price_df 数据及各数组，只复制顶层容器（耗时与行数无关）
+
+        快照被持有期间本索引不能再原地编辑，由 price_table_store 在编辑前检查并先 clone()。
+        """
+        other = copy.copy(self)
+        other.price_df = self.price_df.copy(deep=False)
+        other._columns = dict(self._columns)
+        other._partitions = dict(self._partitions)
+        other._numeric = dict(self._numeric)
+        other.frozen = True
+        return other
+
+    def _check_writable(self):
+        if self.frozen:
+            raise RuntimeError("价格表索引快照已发布，不能原地编辑，请先 clone()")
+
+    def set_cells(self, position: int, cells: Dict[int, object]):
+        """修改一行中的若干单元格（键为列位置）"""
+        self._check_writable()
+        columns = self.columns
+        frame, row = self._locate(position)
+        for column_position, value in cells.items():
+            col = columns[column_position]
+            old_dn = parse_dn(frame.iat[row, column_position]) if col == self.spec_col else None
+            _set_cell(frame, row, column_position, value)
+            stored = frame.iat[row, column_position]
+
+            normalized = self._columns.get(col)
+            if normalized is not None:
+                new_value = normalize_text(stored)
+                parts = self._partitions.get(col)
+                if parts is not None:
+                    _bucket_remove(parts, normalized.value_at(position), position)
+                    _bucket_insert(parts, new_value, position)
+                normalized.set(position, new_value)
+            if col in self._numeric and column_position == self._first_position(col):
+                self._numeric[col][position] = to_float(stored)
+            if col == self.spec_col:
+                new_dn = parse_dn(stored)
+                if new_dn != old_dn:
+                    _bucket_remove(self.dn_buckets, old_dn, position)
+                    _bucket_insert(self.dn_buckets, new_dn, position)
+
+    def append_row(self, cells: Dict[int, object]) -> int:
+        """在末尾追加一行（键为列位置，缺失的单元格为空），返回新行位置
+
+        新行先暂存为单行表，下次读取 price_df 时与其余追加的行一起并入。
+        """
+        self._check_writable()
+        row = [cells.get(j, np.nan) for j in range(len(self.columns))]
+        new_row = pd.DataFrame([row], columns=self.columns)
+        position = len(self)
+        if self._order is not None:
+            self._order = np.append(self._order, len(self._base) + len(self._tail))
+        self._tail.append(new_row)
+
+        for col, normalized in self._columns.items():
+            value = normalize_text(new_row[col].iloc[0])
+            normalized.append(value)
+            if col in self._partitions:
+                _bucket_insert(self._partitions[col], value, position)
+        for col, values in self._numeric.items():
+            self._numeric[col] = np.append(values, to_float(row[self._first_position(col)]))
+        if self.spec_col:
+            _bucket_insert(self.dn_buckets, parse_dn(new_row[self.spec_col].iloc[0]), position)
+        self._all_positions = None
+        return position
+
+    def delete_row(self, position: int):
+        """删除一行，其后的行位置前移；price_df 中的行在下次读取时才移除"""
+        self._check_writable()
+        order = self._order if self._order is not None else np.arange(len(self), dtype=np.int64)
+        self._order = np.delete(order, position)
+        for col, normalized in self._columns.items():
+            normalized.delete(position)
+        for col, values in self._numeric.items():
+            self._numeric[col] = np.delete(values, position)
+        for parts in self._partitions.values():
+            _buckets_delete_position(parts, position)
+        _buckets_delete_position(self.dn_buckets, position)
+        self._all_positions = None
+
+    def add_column(self, col: str, fill=""):
+        """追加一列"""
+        self._check_writable()
+        self.price_df[col] = fill
+        self._detect_columns()
+
+    def drop_column(self, column_position: int):
+        """删除一列（按列位置），丢弃该列的归一化结果"""
+        self._check_writable()
+        col = self.price_df.columns[column_position]
+        keep = [j for j in range(len(self.price_df.columns)) if j != column_position]
+        self.price_df = self.price_df.iloc[:, keep]
+        if col not in self.price_df.columns:
+            self._columns.pop(col, None)
+            self._partitions.pop(col, None)
+        # 列位置变化后数值列按需重建
+        self._numeric.clear()
+        self._detect_columns()
+
+    def nbytes(self) -> int:
+        """估算索引自身（不含 price_df）占用的字节数"""
+        total = self._all_positions.nbytes if self._all_positions is not None else 0
+        for normalized in self._columns.values():
+            total += normalized.codes.nbytes + normalized.uniques.nbytes
+        for parts in self._partitions.values():
+            total += sum(p.nbytes for p in parts.values())
+        total += sum(p.nbytes for p in self.dn_buckets.values())
+        total += sum(v.nbytes for v in self._numeric.values())
+        return total
@@ -0,0 +1,172 @@
+"""
+价格表编辑日志 - 在价格表旁边追加写入每一次编辑
+
+每次行/列编辑以一行 JSON 追加到 .{文件名}.journal 并 fsync，耗时与表的大小无关。
+日志首行记录它所基于的源文件大小和修改时间；源文件被替换后旧日志自动失效。
+读取时以源文件（基准）加上日志重放得到最新内容，后台压缩再把日志并入新的基准文件。
+
+压缩时先写出 .journal.next（基于新基准、只含尚未并入的编辑），再替换基准文件，
+最后把 .journal.next 改名为日志；任何一步中断，两份日志中总有一份与磁盘上的基准匹配。
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+JOURNAL_FORMAT_VERSION = 1
+
+
+def journal_path(source_path: str) -> str:
+    """日志路径：与源文件同目录的隐藏文件，避免出现在价格表列表中"""
+    directory, filename = os.path.split(os.path.abspath(source_path))
+    return os.path.join(directory, f".{filename}.journal")
+
+
+def _next_path(source_path: str) -> str:
+    return journal_path(source_path) + ".next"
+
+
+def base_signature(path: str) -> Tuple[int, int]:
+    """基准文件签名 (大小, mtime_ns)；os.replace 改名不会改变它"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _json_default(value):
+    """numpy 标量等转为 Python 原生类型"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+
+
+def _header(signature: Tuple[int, int]) -> Dict[str, Any]:
+    return {"version": JOURNAL_FORMAT_VERSION, "source_size": signature[0], "source_mtime_ns": signature[1]}
+
+
+def _write_file(path: str, signature: Tuple[int, int], entries: List[Dict[str, Any]]):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_encode(_header(signature)))
+        for entry in entries:
+            f.write(_encode(entry))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _read_file(path: str, signature: Tuple[int, int]) -> Optional[List[Dict[str, Any]]]:
+    """读取日志条目；日志不存在或与基准不匹配时返回 None，末尾写了一半的行忽略"""
+    if not os.path.exists(path):
+        return None
+    entries = []
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return None
+    if (header.get("version") != JOURNAL_FORMAT_VERSION
+            or (header.get("source_size"), header.get("source_mtime_ns")) != signature):
+        return None
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # 进程在追加时中断，最后一条未完整写入
+            break
+    return entries
+
+
+def read_journal(source_path: str) -> List[Dict[str, Any]]:
+    """读取与当前基准文件匹配的日志条目，清理失效的日志文件"""
+    journal, next_journal = journal_path(source_path), _next_path(source_path)
+    if not os.path.exists(journal) and not os.path.exists(next_journal):
+        return []
+    signature = base_signature(source_path)
+    for path in (journal, next_journal):
+        entries = _read_file(path, signature)
+        if entries is not None:
+            if path == next_journal:
+                # 上次压缩在替换基准后中断，补完最后一步
+                os.replace(next_journal, journal)
+            elif os.path.exists(next_journal):
+                os.remove(next_journal)
+            return entries
+    print(f"⚠️ [JOURNAL] 编辑日志与价格表不匹配，已丢弃: {os.path.basename(source_path)}")
+    remove_journal(source_path)
+    return []
+
+
+def has_journal(source_path: str) -> bool:
+    return os.path.exists(journal_path(source_path)) or os.path.exists(_next_path(source_path))
+
+
+def remove_journal(source_path: str):
+    """删除源文件对应的编辑日志（如果存在）"""
+    for path in (journal_path(source_path), _next_path(source_path)):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ [JOURNAL] 删除编辑日志失败: {e}")
+
+
+class PriceTableJournal:
+    """一张价格表的编辑日志追加器"""
+
+    def __init__(self, source_path: str, entries: int = 0):
+        self.source_path = os.path.abspath(source_path)
+        self.path = journal_path(source_path)
+        self.entries = entries
+        self.size = os.path.getsize(self.path) if entries else 0
+        # 最早一条尚未并入基准的编辑的时间，用于按时间触发压缩
+        self.oldest = time.monotonic() if entries else None
+        self._file = None
+
+    def append(self, entry: Dict[str, Any]):
+        """追加一条编辑并 fsync，返回后即可确认编辑已持久化"""
+        if self._file is None:
+            if self.entries == 0:
+                _write_file(self.path, base_signature(self.source_path), [])
+            self._file = open(self.path, "ab")
+            self.size = self._file.tell()
+        data = _encode(entry)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.size += len(data)
+        self.entries += 1
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.oldest if self.oldest is not None else 0.0
+
+    def prepare_rebase(self, new_base_path: str, pending: List[Dict[str, Any]]):
+        """压缩第一步：为即将替换进来的新基准写出 .journal.next（只含尚未并入的编辑）"""
+        _write_file(_next_path(self.source_path), base_signature(new_base_path), pending)
+
+    def commit_rebase(self, pending: List[Dict[str, Any]]):
+        """压缩最后一步：基准已替换，启用新日志"""
+        self.close()
+        next_journal = _next_path(self.source_path)
+        if pending:
+            os.replace(next_journal, self.path)
+            self.size = os.path.getsize(self.path)
+            self.oldest = time.monotonic()
+        else:
+            remove_journal(self.source_path)
+            self.size = 0
+            self.oldest = None
+        self.entries = len(pending)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,170 @@
+"""
+价格表清单 - 每个用户的价格表目录下保存一份 JSON 元数据清单
+
+价格表列表接口只需要大小、修改时间、行列数、列名和品牌，不必每次打开所有 Excel。
+清单在上传、压缩和删除时更新；列表时只对每个文件做一次 stat 校验，
+大小或修改时间与清单不符（例如文件被外部替换）的条目才重新读取。
+编辑不改写清单：尚未并入文件的在编表，列表时从内存取其当前行列信息，
+品牌按在编表的版本号重新计算（同一版本只算一次）。
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+
+from price_table_cache import load_price_table_index, price_table_cache, price_table_version
+
+MANIFEST_FILENAME = ".price_tables.json"
+MANIFEST_FORMAT_VERSION = 1
+# 列表接口展示的价格表扩展名
+LISTED_EXTENSIONS = ('.xlsx', '.xls')
+
+_lock = threading.RLock()
+# 在编表的品牌：路径 -> (版本号, 品牌列表)，有新的编辑（版本号变化）时重新计算
+_live_brands: Dict[str, Tuple[tuple, List[str]]] = {}
+
+
+def manifest_path(user_dir: str) -> str:
+    """清单路径：价格表目录下的隐藏文件，不会被当作价格表列出"""
+    return os.path.join(user_dir, MANIFEST_FILENAME)
+
+
+def _read_manifest(user_dir: str) -> Dict[str, Dict[str, Any]]:
+    path = manifest_path(user_dir)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_FORMAT_VERSION:
+            return {}
+        return manifest.get("files", {})
+    except Exception as e:
+        print(f"⚠️ [MANIFEST] 读取价格表清单失败，将重新生成: {e}")
+        return {}
+
+
+def _write_manifest(user_dir: str, files: Dict[str, Dict[str, Any]]):
+    path = manifest_path(user_dir)
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_FORMAT_VERSION, "files": files}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"⚠️ [MANIFEST] 写入价格表清单失败: {e}")
+
+
+def _content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _shape(df: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "row_count": len(df),
+        "column_count": len(df.columns),
+        "columns": [str(col) for col in df.columns],
+    }
+
+
+def _describe(file_path: str) -> Dict[str, Any]:
+    """读取一张价格表的完整元数据（经共享缓存，在编表为最新内容）"""
+    stat = os.stat(file_path)
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        "created_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+        "content_hash": _content_hash(file_path),
+    }
+    try:
+        index = load_price_table_index(file_path)
+        entry.update(_shape(index.price_df))
+        entry["brands"] = index.brand_names()
+    except Exception as e:
+        print(f"⚠️ 读取文件 {os.path.basename(file_path)} 的详细信息失败: {e}")
+        entry.update({"row_count": None, "column_count": None, "columns": [], "brands": []})
+    return entry
+
+
+def _current_brands(file_path: str) -> List[str]:
+    """在编表当前内容的品牌，按版本号缓存"""
+    version = price_table_version(file_path)
+    with _lock:
+        cached = _live_brands.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    brands = load_price_table_index(file_path).brand_names()
+    with _lock:
+        _live_brands[file_path] = (version, brands)
+    return brands
+
+
+def record_price_table(file_path: str):
+    """价格表文件写入（上传、压缩）后更新其清单条目"""
+    user_dir, filename = os.path.split(os.path.abspath(file_path))
+    entry = _describe(file_path)
+    with _lock:
+        files = _read_manifest(user_dir)
+        files[filename] = entry
+        _write_manifest(user_dir, files)
+
+
+def forget_price_table(file_path: str):
+    """价格表被删除后移除其清单条目"""
+    user_dir, filename = os.path.split(os.path.abspath(file_path))
+    with _lock:
+        files = _read_manifest(user_dir)
+        if files.pop(filename, None) is not None:
+            _write_manifest(user_dir, files)
+
+
+def list_price_tables(user_dir: str) -> List[Dict[str, Any]]:
+    """从清单返回价格表列表（最新修改的在前）；缺失或过期的条目就地补齐"""
+    with _lock:
+        files = _read_manifest(user_dir)
+        changed = False
+        listed = []
+        present = set(os.listdir(user_dir))
+        for filename in sorted(present):
+            if not filename.endswith(LISTED_EXTENSIONS):
+                continue
+            file_path = os.path.join(user_dir, filename)
+            stat = os.stat(file_path)
+            entry = files.get(filename)
+            if entry is None or (entry.get("size"), entry.get("mtime_ns")) != (stat.st_size, stat.st_mtime_ns):
+                entry = _describe(file_path)
+                files[filename] = entry
+                changed = True
+            listed.append(dict(entry, filename=filename))
+        for filename in [name for name in files if name not in present]:
+            del files[filename]
+            changed = True
+        if changed:
+            _write_manifest(user_dir, files)
+
+    for entry in listed:
+        entry.pop("mtime_ns", None)
+        # 在编表的行列信息和品牌以内存中的为准，压缩后由 record_price_table 写入清单
+        file_path = os.path.abspath(os.path.join(user_dir, entry["filename"]))
+        live_shape = price_table_cache.live_shape(file_path)
+        if live_shape is None:
+            with _lock:
+                _live_brands.pop(file_path, None)
+            continue
+        row_count, columns = live_shape
+        entry.update(row_count=row_count, column_count=len(columns), columns=columns)
+        try:
+            entry["brands"] = _current_brands(file_path)
+        except Exception as e:
+            print(f"⚠️ 读取文件 {entry['filename']} 的品牌失败: {e}")
+    listed.sort(key=lambda x: x["modified_time"], reverse=True)
+    return listed
@@ -3,17 +3,67 @@
 """
 import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
+from improved_price_matcher import ImprovedPriceMatcher
 from multi_company_models import PriceTableInfo
+from price_table_cache import price_table_cache, load_price_table_index, price_table_version
+from price_table_sidecar import read_sidecar_meta
+
+# 验证时读取的样本行数
+SAMPLE_ROWS = 5
+# 缓存的验证结果条数，可通过环境变量 PRICE_TABLE_VALIDATION_CACHE_SIZE 调整
+VALIDATION_CACHE_SIZE = int(os.environ.get("PRICE_TABLE_VALIDATION_CACHE_SIZE", "256"))
+
+# 验证结果缓存：(绝对路径, mtime_ns, size) -> (是否有效, 错误信息)，文件变化后自然失效
+_validation_cache: "OrderedDict[tuple, Tuple[bool, Optional[str]]]" = OrderedDict()
+_validation_lock = threading.Lock()
+
+
+def read_header(file_path: str, sample_rows: int = SAMPLE_ROWS) -> Tuple[List[str], int]:
+    """只读取表头和前几行，返回 (列名, 非空样本行数)
+
+    .xlsx 以 openpyxl 只读流式模式打开，读到所需行即停止，不解析整个工作簿；
+    列名与 pandas 一致：空表头为 "Unnamed: i"。
+    """
+    if file_path.lower().endswith('.csv'):
+        df = pd.read_csv(file_path, nrows=sample_rows)
+        return [str(col).strip() for col in df.columns], len(df)
+    if not file_path.lower().endswith('.xlsx'):
+        # .xls 不支持流式读取
+        df = pd.read_excel(file_path, nrows=sample_rows)
+        return [str(col).strip() for col in df.columns], len(df)
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        # 只读模式按文件里的 <dimension> 记录截断行列，部分工具写出的记录不准（如只有 "A1"），改为按实际内容读取
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(max_row=sample_rows + 1, values_only=True)
+        header = next(rows, ())
+        sample_count = sum(1 for row in rows if any(value is not None for value in row))
+    finally:
+        workbook.close()
+    columns = [f"Unnamed: {i}" if value is None else str(value).strip() for i, value in enumerate(header)]
+    return columns, sample_count
+
 
 class PriceTableScanner:
     """价格表扫描器"""
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 4):
         self.supported_formats = ['.xlsx', '.xls', '.csv']
         self.required_columns = ['型号', '规格', '价格']  # 价格表必须包含的列
+        self.max_workers = max_workers
+        # 扫描结果缓存：用户目录 -> (目录中的价格表文件名, 已加载索引的价格表, 加载时的版本号)
+        self._scans: Dict[str, Tuple[List[str], List[PriceTableInfo], List[Optional[tuple]]]] = {}
+        self._scan_lock = threading.Lock()
         
     def scan_price_tables(self, user_dir: str) -> List[PriceTableInfo]:
         """扫描用户目录下的所有价格表文件"""
@@ -27,6 +77,7 @@ class PriceTableScanner:
             return price_tables
         
         try:
+            candidates = []
             for filename in os.listdir(price_table_dir):
                 file_path = os.path.join(price_table_dir, filename)
                 
@@ -39,13 +90,16 @@ class PriceTableScanner:
                 if file_ext not in self.supported_formats:
                     print(f"⚠️ [SCANNER] 跳过不支持的文件格式: {filename}")
                     continue
-                
+                candidates.append((filename, file_path, file_ext))
+            
+            # 并发验证，结果按目录顺序返回
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(candidates)))) as executor:
+                validations = list(executor.map(self.validate_price_table, [c[1] for c in candidates]))
+            
+            for (filename, file_path, file_ext), (is_valid, error_msg) in zip(candidates, validations):
                 # 提取公司名称
                 company_name = self.extract_company_name(filename)
                 
-                # 验证文件
-                is_valid, error_msg = self.validate_price_table(file_path)
-                
                 price_table = PriceTableInfo(
                     file_path=file_path,
                     company_name=company_name,
@@ -67,6 +121,66 @@ class PriceTableScanner:
         print(f"📊 [SCANNER] 扫描完成，共发现 {len(price_tables)} 个价格表文件")
         return price_tables
     
+    def load_price_tables(self, user_dir: str) -> List[PriceTableInfo]:
+        """返回用户目录下已验证并加载索引的价格表（经扫描结果缓存）
+
+        扫描结果在上传、删除价格表时由 invalidate 清除；目录中的文件名与缓存不符时也重新扫描。
+        价格表被编辑后版本号变化，重新验证该表并取其索引（经共享缓存，不重新解析文件）；
+        缓存中的 PriceTableInfo 不再修改，变化的表换成新对象后整体替换缓存条目。
+        """
+        key = os.path.abspath(user_dir)
+        listing = self._listing(user_dir)
+        with self._scan_lock:
+            cached = self._scans.get(key)
+        if cached is None or cached[0] != listing:
+            price_tables = self.scan_price_tables(user_dir)
+            # 版本号在加载索引之前取得，加载期间发生的编辑在下次调用时重新加载
+            versions = [price_table_version(price_table.file_path) for price_table in price_tables]
+            for price_table in price_tables:
+                self.load_price_table_data(price_table)
+            cached = (listing, price_tables, versions)
+            with self._scan_lock:
+                self._scans[key] = cached
+        else:
+            print(f"⚡ [SCANNER] 使用缓存的扫描结果: {len(cached[1])} 个价格表")
+            _, cached_tables, cached_versions = cached
+            price_tables, versions = list(cached_tables), list(cached_versions)
+            for i, price_table in enumerate(cached_tables):
+                version = price_table_version(price_table.file_path)
+                if version != cached_versions[i]:
+                    versions[i] = version
+                    price_tables[i] = self._reload_price_table(price_table)
+            if versions != cached_versions:
+                cached = (listing, price_tables, versions)
+                with self._scan_lock:
+                    self._scans[key] = cached
+        
+        # 返回副本，调用方修改不影响缓存
+        return [replace(price_table) for price_table in cached[1]]
+    
+    def _reload_price_table(self, price_table: PriceTableInfo) -> PriceTableInfo:
+        """价格表版本变化后重新验证并加载索引，返回新的 PriceTableInfo（不修改原对象）"""
+        is_valid, error_msg = self.validate_price_table(price_table.file_path)
+        reloaded = replace(price_table, is_valid=is_valid, error_message=error_msg, data=None)
+        if is_valid:
+            self.load_price_table_data(reloaded)
+        else:
+            print(f"❌ [SCANNER] 价格表编辑后无效: {price_table.company_name} - {error_msg}")
+        return reloaded
+    
+    def invalidate(self, user_dir: str):
+        """清除用户目录的扫描结果缓存（价格表上传或删除后调用）"""
+        with self._scan_lock:
+            self._scans.pop(os.path.abspath(user_dir), None)
+    
+    def _listing(self, user_dir: str) -> List[str]:
+        """价格表目录中支持格式的文件名"""
+        price_table_dir = os.path.join(user_dir, "价格表")
+        if not os.path.isdir(price_table_dir):
+            return []
+        return sorted(filename for filename in os.listdir(price_table_dir)
+                      if not filename.startswith('.') and Path(filename).suffix.lower() in self.supported_formats)
+    
     def extract_company_name(self, filename: str) -> str:
         """从文件名提取公司名称"""
         # 去掉文件扩展名
@@ -91,7 +205,34 @@ class PriceTableScanner:
         return name_without_ext
     
     def validate_price_table(self, file_path: str) -> tuple[bool, Optional[str]]:
-        """验证价格表文件的有效性"""
+        """验证价格表文件的有效性（结果按文件签名缓存）
+
+        有在编表时按其当前的列名和行数验证，编辑（如删除价格列）后的结果不受文件缓存影响。
+        """
+        live_shape = price_table_cache.live_shape(file_path)
+        if live_shape is not None:
+            row_count, columns = live_shape
+            return self._validate_columns(columns) if row_count else (False, "文件内容为空")
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False, "文件不存在"
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        with _validation_lock:
+            cached = _validation_cache.get(key)
+            if cached is not None:
+                _validation_cache.move_to_end(key)
+                return cached
+        
+        result = self._validate_uncached(file_path)
+        with _validation_lock:
+            _validation_cache[key] = result
+            while len(_validation_cache) > VALIDATION_CACHE_SIZE:
+                _validation_cache.popitem(last=False)
+        return result
+    
+    def _validate_uncached(self, file_path: str) -> tuple[bool, Optional[str]]:
+        """读取表头和样本行验证价格表"""
         try:
             # 检查文件是否存在
             if not os.path.exists(file_path):
@@ -107,27 +248,19 @@ class PriceTableScanner:
             
             # 尝试读取文件
             try:
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path, nrows=5)  # 只读取前5行进行验证
+                sidecar_meta = read_sidecar_meta(file_path)
+                if sidecar_meta is not None:
+                    # 列式旁路文件新鲜时，直接使用其中记录的列名和行数
+                    if sidecar_meta['rows'] == 0:
+                        return False, "文件内容为空"
+                    columns = [str(col['name']).strip() for col in sidecar_meta['columns']]
                 else:
-                    df = pd.read_excel(file_path, nrows=5)
-                
-                if df.empty:
-                    return False, "文件内容为空"
-                
-                # 检查必要的列是否存在
-                columns = [str(col).strip() for col in df.columns]
-                missing_columns = []
+                    # 只读取表头和前几行进行验证
+                    columns, sample_count = read_header(file_path)
+                    if sample_count == 0:
+                        return False, "文件内容为空"
                 
-                for required_col in self.required_columns:
-                    # 模糊匹配列名
-                    if not self._find_column_match(required_col, columns):
-                        missing_columns.append(required_col)
-                
-                if missing_columns:
-                    return False, f"缺少必要的列: {', '.join(missing_columns)}"
-                
-                return True, None
+                return self._validate_columns(columns)
                 
             except Exception as e:
                 return False, f"文件读取失败: {str(e)}"
@@ -135,6 +268,20 @@ class PriceTableScanner:
         except Exception as e:
             return False, f"验证过程出错: {str(e)}"
     
+    def _validate_columns(self, columns: List[str]) -> tuple[bool, Optional[str]]:
+        """检查必要的列是否存在"""
+        missing_columns = []
+        
+        for required_col in self.required_columns:
+            # 模糊匹配列名
+            if not self._find_column_match(required_col, columns):
+                missing_columns.append(required_col)
+        
+        if missing_columns:
+            return False, f"缺少必要的列: {', '.join(missing_columns)}"
+        
+        return True, None
+    
     def _find_column_match(self, target_col: str, columns: List[str]) -> bool:
         """模糊匹配列名"""
         target_lower = target_col.lower()
@@ -155,50 +302,26 @@ class PriceTableScanner:
         return False
     
     def load_price_table_data(self, price_table: PriceTableInfo) -> bool:
-        """加载价格表数据到内存"""
+        """预先构建价格表的匹配索引（经共享缓存），PriceTableInfo 只记录路径，不持有数据
+
+        加载失败的价格表标记为无效。
+        """
         if not price_table.is_valid:
             return False
         
         try:
-            if price_table.file_format == 'csv':
-                df = pd.read_csv(price_table.file_path)
-            else:
-                df = pd.read_excel(price_table.file_path)
-            
-            # 标准化列名
-            df = self._standardize_columns(df)
-            
-            price_table.data = df
-            print(f"📊 [SCANNER] 成功加载价格表数据: {price_table.company_name} ({len(df)} 行)")
+            # 与匹配时相同的标准化方式，匹配时直接命中缓存中的索引
+            index = load_price_table_index(price_table.file_path,
+                                           standardize=ImprovedPriceMatcher()._standardize_columns)
+            print(f"📊 [SCANNER] 成功加载价格表数据: {price_table.company_name} ({len(index)} 行)")
             return True
             
         except Exception as e:
+            price_table.is_valid = False
             price_table.error_message = f"数据加载失败: {str(e)}"
             print(f"❌ [SCANNER] 加载价格表数据失败: {price_table.company_name} - {e}")
             return False
-    
-    def _standardize_columns(self, df: pd.DataFrame) -> pd.DataFrame:
-        """标准化列名"""
-        column_mapping = {}
-        
-        for col in df.columns:
-            col_str = str(col).strip()
-            col_lower = col_str.lower()
-            
-            # 型号列映射
-            if any(keyword in col_lower for keyword in ['型号', 'model']):
-                column_mapping[col] = '型号'
-            # 规格列映射
-            elif any(keyword in col_lower for keyword in ['规格', 'spec', 'dn', '口径']):
-                column_mapping[col] = '规格'
-            # 价格列映射
-            elif any(keyword in col_lower for keyword in ['价格', 'price', '单价', '报价']):
-                column_mapping[col] = '价格'
-            # 品牌列映射
-            elif any(keyword in col_lower for keyword in ['品牌', 'brand']):
-                column_mapping[col] = '品牌'
-        
-        if column_mapping:
-            df = df.rename(columns=column_mapping)
-        
-        return df
\ No newline at end of file
+
+
+# 全局扫描器
+price_table_scanner = PriceTableScanner()
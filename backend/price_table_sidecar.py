@@ -0,0 +1,181 @@
+"""
+价格表列式旁路文件 - 在 .xlsx 旁边保存 NumPy .npz 列存副本
+
+openpyxl 解析大表需要数秒，而 .npz 的列数组可以在毫秒级载入。
+旁路文件记录源文件的大小和修改时间，只有与源文件一致时才会被使用，
+否则调用方应回退到解析 Excel。
+旁路文件位于用户可写的数据目录，所有数组都是数值或定长文本，始终以 allow_pickle=False 载入；
+混合类型列按单元格记录类型代码和文本，无法这样编码的列不写旁路文件。
+"""
+import datetime
+import json
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 2：混合类型列不再以 pickle 对象数组保存，旧版本旁路文件视为过期
+SIDECAR_FORMAT_VERSION = 2
+
+# 混合类型列的单元格类型代码
+_NULL, _STR, _BOOL, _INT, _FLOAT, _DATETIME, _TIMESTAMP = range(7)
+_DECODERS = {
+    _STR: str,
+    _BOOL: lambda text: text == "True",
+    _INT: int,
+    _FLOAT: float,
+    _DATETIME: datetime.datetime.fromisoformat,
+    _TIMESTAMP: pd.Timestamp,
+}
+
+
+def sidecar_path(source_path: str) -> str:
+    """旁路文件路径：与源文件同目录的隐藏文件，避免出现在价格表列表中"""
+    directory, filename = os.path.split(os.path.abspath(source_path))
+    return os.path.join(directory, f".{filename}.columns.npz")
+
+
+def _encode_column(series: pd.Series):
+    """把一列编码为 (类型, 数据数组, 辅助数组)：文本列的辅助数组为空值掩码，混合类型列为类型代码"""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "num", series.to_numpy(), None
+    if pd.api.types.is_datetime64_dtype(series):
+        return "datetime", series.to_numpy(), None
+
+    values = series.to_numpy(dtype=object)
+    mask = pd.isna(series).to_numpy()
+    if all(isinstance(v, str) for v in values[~mask]):
+        filled = np.where(mask, "", values)
+        return "str", filled.astype(str), mask
+    # 混合类型列：每个单元格记为 (类型代码, 文本)
+    encoded = [_encode_value(value) for value in values]
+    kinds = np.array([kind for kind, _ in encoded], dtype=np.int8)
+    return "mixed", _as_text_array([text for _, text in encoded]), kinds
+
+
+def _encode_value(value) -> Tuple[int, str]:
+    """混合类型列中的一个单元格编码为 (类型代码, 文本)；不支持的类型抛出 TypeError"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return _NULL, ""
+    if isinstance(value, str):
+        return _STR, value
+    if isinstance(value, (bool, np.bool_)):
+        return _BOOL, str(bool(value))
+    if isinstance(value, (int, np.integer)):
+        return _INT, str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return (_NULL, "") if np.isnan(value) else (_FLOAT, repr(float(value)))
+    if isinstance(value, pd.Timestamp):
+        return _TIMESTAMP, value.isoformat()
+    if isinstance(value, datetime.datetime):
+        return _DATETIME, value.isoformat()
+    raise TypeError(f"无法写入旁路文件的单元格类型: {type(value).__name__}")
+
+
+def _decode_values(texts: np.ndarray, kinds: np.ndarray) -> np.ndarray:
+    """由类型代码和文本还原混合类型列"""
+    values = np.full(len(texts), np.nan, dtype=object)
+    for kind, decode in _DECODERS.items():
+        positions = np.flatnonzero(kinds == kind)
+        if positions.size:
+            values[positions] = [decode(str(text)) for text in texts[positions]]
+    return values
+
+
+def _as_text_array(texts) -> np.ndarray:
+    """定长 unicode 数组（空列时为 '<U1'）"""
+    return np.array(texts, dtype=str) if len(texts) else np.array([], dtype='<U1')
+
+
+def _write_columns(target: str, df: pd.DataFrame, meta: dict):
+    """把 DataFrame 按列编码写入 .npz（先写临时文件再原子替换）"""
+    arrays = {}
+    columns = []
+    for i, col in enumerate(df.columns):
+        kind, data, mask = _encode_column(df.iloc[:, i])
+        if data.dtype == object:
+            # 可空扩展类型等转换出的对象数组同样按混合类型编码
+            kind, data, mask = _encode_column(df.iloc[:, i].astype(object))
+        arrays[f"c{i}"] = data
+        if mask is not None:
+            arrays[f"m{i}"] = mask
+        columns.append({"name": col if isinstance(col, (str, int, float)) else str(col), "kind": kind})
+
+    meta = dict(meta, version=SIDECAR_FORMAT_VERSION, rows=len(df), columns=columns)
+    arrays["__meta__"] = np.array(json.dumps(meta, ensure_ascii=False))
+
+    temp_target = target + ".tmp"
+    with open(temp_target, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temp_target, target)
+
+
+def _read_columns(target: str, meta: dict) -> pd.DataFrame:
+    """按元数据把 .npz 列数组还原为 DataFrame（不允许 pickle 对象）"""
+    data = {}
+    with np.load(target, allow_pickle=False) as npz:
+        for i, column in enumerate(meta["columns"]):
+            values = npz[f"c{i}"]
+            if column["kind"] == "str":
+                values = values.astype(object)
+                values[npz[f"m{i}"]] = np.nan
+            elif column["kind"] == "mixed":
+                values = _decode_values(values, npz[f"m{i}"])
+            data[i] = values
+    df = pd.DataFrame(data)
+    df.columns = [c["name"] for c in meta["columns"]]
+    return df
+
+
+def write_sidecar(source_path: str, df: pd.DataFrame) -> Optional[str]:
+    """为源文件写出列式旁路文件，失败时返回 None（不影响主流程）"""
+    try:
+        stat = os.stat(source_path)
+        target = sidecar_path(source_path)
+        _write_columns(target, df, {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns})
+        return target
+    except Exception as e:
+        print(f"⚠️ [SIDECAR] 写入列式旁路文件失败: {e}")
+        return None
+
+
+def read_sidecar_meta(source_path: str) -> Optional[dict]:
+    """读取旁路文件元数据；源文件已变化或旁路文件不存在时返回 None"""
+    target = sidecar_path(source_path)
+    if not os.path.exists(target) or not os.path.exists(source_path):
+        return None
+    try:
+        stat = os.stat(source_path)
+        with np.load(target, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["__meta__"]))
+        if (meta.get("version") != SIDECAR_FORMAT_VERSION
+                or meta.get("source_size") != stat.st_size
+                or meta.get("source_mtime_ns") != stat.st_mtime_ns):
+            return None
+        return meta
+    except Exception as e:
+        print(f"⚠️ [SIDECAR] 读取旁路文件元数据失败: {e}")
+        return None
+
+
+def load_sidecar(source_path: str) -> Optional[pd.DataFrame]:
+    """载入新鲜的旁路文件为 DataFrame；不可用时返回 None"""
+    meta = read_sidecar_meta(source_path)
+    if meta is None:
+        return None
+    try:
+        return _read_columns(sidecar_path(source_path), meta)
+    except Exception as e:
+        print(f"⚠️ [SIDECAR] 载入旁路文件失败，回退到源文件: {e}")
+        return None
+
+
+def remove_sidecar(source_path: str):
+    """删除源文件对应的旁路文件（如果存在）"""
+    target = sidecar_path(source_path)
+    if os.path.exists(target):
+        try:
+            os.remove(target)
+        except OSError as e:
+            print(f"⚠️ [SIDECAR] 删除旁路文件失败: {e}")
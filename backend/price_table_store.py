@@ -0,0 +1,481 @@
+"""
+可编辑价格表 - 在内存中编辑价格表，编辑日志持久化，后台压缩为新的基准文件
+
+行/列编辑直接作用于缓存中的 PriceTableIndex：price_df 与归一化列、品牌分区、
+DN 分桶一起增量更新，再以一行 JSON 追加到该表的编辑日志并 fsync（见 price_table_journal），
+编辑耗时与表的大小无关，所有编辑在同一把锁下串行执行，不再出现并发整表覆盖。
+读取方拿到的是按需发布的只读快照；只有快照仍被持有时，下一次编辑才需要先复制索引。
+编辑过的表登记为 price_table_cache 的“在编”表，读取时返回内存中的最新内容；
+日志超过大小或时间阈值时由后台压缩写出新的 xlsx/csv 与列式旁路文件，
+压缩完成且没有新编辑时，索引按新的文件签名交还给缓存。
+"""
+import atexit
+import itertools
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from csv_utils import safe_to_csv
+from price_table_cache import price_table_cache
+from price_table_index import PriceTableIndex
+from price_table_journal import PriceTableJournal, read_journal
+from price_table_manifest import record_price_table
+from price_table_sidecar import write_sidecar
+from price_validator import is_cell_value, validate_patch_operations
+
+# 编辑日志超过该字节数时立即压缩
+JOURNAL_MAX_BYTES = int(os.environ.get("PRICE_TABLE_JOURNAL_MAX_BYTES", str(1024 * 1024)))
+# 最早一条未压缩的编辑超过该秒数时压缩
+JOURNAL_MAX_AGE_SECONDS = float(os.environ.get("PRICE_TABLE_JOURNAL_MAX_AGE", "30"))
+# 压缩失败后首次重试的等待秒数，之后每次失败翻倍，最长不超过 JOURNAL_MAX_AGE_SECONDS
+COMPACT_RETRY_SECONDS = float(os.environ.get("PRICE_TABLE_COMPACT_RETRY", "1"))
+
+# 每次登记在编表分配一个会话号，保证不同编辑会话的版本号互不相同
+_EDIT_SESSIONS = itertools.count(1)
+
+
+def _json_value(value):
+    """单元格值转为可 JSON 序列化、可比较的 Python 值（空值为 None）"""
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+class PriceTableEditError(ValueError):
+    """编辑参数不合法（行索引越界、列名为空/重复/不存在）"""
+
+
+class EditablePriceTable:
+    """一张在编价格表：原始列名的索引，以及按需构建的标准化列名索引
+
+    各索引的 price_df 列顺序一致（标准化只改列名），编辑按列位置同步到每个索引。
+    pending 是尚未并入基准文件的编辑日志条目。
+    读取方拿到的是 index() 发布的快照，这里只保留快照及其 price_df 的弱引用，
+    用来判断编辑前是否需要先复制（见 PriceTableStore._thaw）。
+    """
+
+    def __init__(self, file_path: str, lock: threading.RLock):
+        self.file_path = os.path.abspath(file_path)
+        self.session = next(_EDIT_SESSIONS)
+        self.indexes: Dict[Optional[str], PriceTableIndex] = {}
+        self._published: Dict[Optional[str], tuple] = {}
+        self.revision = 0
+        self.pending: List[Dict[str, Any]] = []
+        self.journal: Optional[PriceTableJournal] = None
+        self.closed = False
+        self._lock = lock
+        self._timer: Optional[threading.Timer] = None
+        self._compacting = False
+        # 连续压缩失败的次数，用于计算重试等待时间
+        self._failures = 0
+
+    @property
+    def version(self) -> tuple:
+        return ('edit', self.file_path, self.session, self.revision)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """原始列名的价格表（编辑的基准）"""
+        return self.indexes[None].price_df
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.indexes[None].columns
+
+    @property
+    def row_count(self) -> int:
+        return len(self.indexes[None])
+
+    def index(self, standardize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> PriceTableIndex:
+        """返回某个列名标准化版本的只读快照（索引不存在时由原始表构建）
+
+        同一版本的快照仍被持有时直接复用，否则由当前索引发布一个新的快照。
+        """
+        variant = getattr(standardize, "__qualname__", None) if standardize else None
+        with self._lock:
+            snapshot = self._snapshot(variant)
+            if snapshot is not None:
+                return snapshot
+            index = self.indexes.get(variant)
+            if index is None:
+                index = PriceTableIndex(standardize(self.df.copy()))
+                index.version = self.version + (variant,)
+                self.indexes[variant] = index
+            snapshot = index.snapshot()
+            self._published[variant] = (weakref.ref(snapshot), weakref.ref(snapshot.price_df))
+            return snapshot
+
+    def _snapshot(self, variant: Optional[str]) -> Optional[PriceTableIndex]:
+        """当前版本已发布且仍被持有的快照（版本号不是当前版本的旧快照不再复用）"""
+        refs = self._published.get(variant)
+        snapshot = refs[0]() if refs is not None else None
+        if snapshot is None or snapshot.version != self.version + (variant,):
+            return None
+        return snapshot
+
+    def is_published(self, variant: Optional[str]) -> bool:
+        """当前版本发布的快照（或其 price_df）是否仍被读取方持有"""
+        refs = self._published.get(variant)
+        return refs is not None and any(ref() is not None for ref in refs)
+
+    def column_position(self, column: str) -> int:
+        columns = list(self.columns)
+        if column not in columns:
+            raise PriceTableEditError("列名不存在")
+        return columns.index(column)
+
+    def check_row(self, row_index: int):
+        if row_index < 0 or row_index >= self.row_count:
+            raise PriceTableEditError("行索引超出范围")
+
+    def close(self):
+        """放弃在编状态（文件被替换或删除），取消尚未执行的压缩"""
+        with self._lock:
+            self.closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.journal is not None:
+                self.journal.close()
+
+
+class PriceTableStore:
+    """在编价格表的注册表：执行编辑、记录日志、维护索引并调度后台压缩"""
+
+    def __init__(self, max_journal_bytes: int = JOURNAL_MAX_BYTES, max_journal_age: float = JOURNAL_MAX_AGE_SECONDS,
+                 retry_delay: float = COMPACT_RETRY_SECONDS):
+        self.max_journal_bytes = max_journal_bytes
+        self.max_journal_age = max_journal_age
+        self.retry_delay = retry_delay
+        self._tables: Dict[str, EditablePriceTable] = {}
+        self._lock = threading.RLock()
+
+    # ---- 编辑操作 ----
+
+    def update_row(self, file_path: str, row_index: int, row_data: Dict[str, Any]):
+        """更新一行中存在的列（不存在的列忽略）"""
+        self._edit(file_path, {"op": "update_row", "row": row_index, "data": row_data})
+
+    def add_row(self, file_path: str, row_data: Dict[str, Any]) -> int:
+        """追加一行，返回新行索引；表中没有的列会作为新列加入（其余行为空）"""
+        return self._edit(file_path, {"op": "add_row", "data": row_data})
+
+    def delete_row(self, file_path: str, row_index: int):
+        self._edit(file_path, {"op": "delete_row", "row": row_index})
+
+    def add_column(self, file_path: str, column_name: str):
+        """追加一列（值为空字符串）"""
+        self._edit(file_path, {"op": "add_column", "column": column_name})
+
+    def delete_column(self, file_path: str, column_name: str):
+        self._edit(file_path, {"op": "delete_column", "column": column_name})
+
+    def replace(self, file_path: str, columns: List[str], rows: List[list]):
+        """整表替换内容"""
+        self._edit(file_path, {"op": "replace", "columns": columns, "rows": rows})
+
+    def patch(self, file_path: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量编辑：先整体校验，全部合法才按顺序应用，编辑日志只追加一条
+
+        返回变更报告：每项操作的结果（更新行的新旧值、新增行的索引等）及汇总计数。
+        """
+        return self._edit(file_path, {"op": "batch", "ops": operations})
+
+    def _edit(self, file_path: str, entry: Dict[str, Any]):
+        with self._lock:
+            table = self._open(file_path)
+            try:
+                result = self._apply(table, entry)
+            except Exception:
+                if not table.pending:
+                    # 刚登记、没有任何编辑的表不必保持在编
+                    self._release(table)
+                raise
+            self._record(table, entry)
+            table.journal.append(entry)
+            self._schedule(table)
+            return result
+
+    @staticmethod
+    def _record(table: EditablePriceTable, entry: Dict[str, Any]):
+        """编辑生效后推进版本号并登记为待压缩"""
+        table.revision += 1
+        entry["rev"] = table.revision
+        table.pending.append(entry)
+        for variant, index in table.indexes.items():
+            index.version = table.version + (variant,)
+
+    def _apply(self, table: EditablePriceTable, entry: Dict[str, Any]):
+        """把一条编辑应用到在编表的各个索引（新编辑与日志重放共用）"""
+        op = entry["op"]
+        if op in ("update_row", "add_row") and not all(is_cell_value(v) for v in entry["data"].values()):
+            raise PriceTableEditError("单元格值必须是文本或数字")
+        if op != "replace":
+            self._thaw(table)
+        if op == "update_row":
+            row_index, row_data = entry["row"], entry["data"]
+            table.check_row(row_index)
+            columns = list(table.columns)
+            cells = {columns.index(col): value for col, value in row_data.items() if col in columns}
+            for index in table.indexes.values():
+                index.set_cells(row_index, cells)
+        elif op == "add_row":
+            row_data = entry["data"]
+            new_columns = [col for col in row_data if col not in table.columns]
+            if new_columns:
+                self._keep_raw_only(table)
+                for col in new_columns:
+                    table.indexes[None].add_column(col, fill=np.nan)
+            columns = list(table.columns)
+            cells = {columns.index(col): value for col, value in row_data.items()}
+            position = -1
+            for index in table.indexes.values():
+                position = index.append_row(cells)
+            return position
+        elif op == "delete_row":
+            table.check_row(entry["row"])
+            for index in table.indexes.values():
+                index.delete_row(entry["row"])
+        elif op == "add_column":
+            column_name = entry["column"]
+            if not column_name:
+                raise PriceTableEditError("列名不能为空")
+            if column_name in table.columns:
+                raise PriceTableEditError("列名已存在")
+            # 标准化版本的列名映射可能因此变化，只保留原始表索引，其余按需重建
+            self._keep_raw_only(table)
+            table.indexes[None].add_column(column_name)
+        elif op == "delete_column":
+            position = table.column_position(entry["column"])
+            self._keep_raw_only(table)
+            table.indexes[None].drop_column(position)
+        elif op == "batch":
+            operations = entry["ops"]
+            errors = validate_patch_operations(table.columns, table.row_count, operations)
+            if errors:
+                raise PriceTableEditError("；".join(errors))
+            return self._apply_batch(table, operations)
+        elif op == "replace":
+            # 整表换成新索引，不必复制旧索引；旧快照由读取方继续持有，但不再发布
+            table.indexes = {None: PriceTableIndex(pd.DataFrame(entry["rows"], columns=entry["columns"]))}
+            table._published.clear()
+        else:
+            raise PriceTableEditError(f"未知的编辑操作: {op}")
+        return None
+
+    def _apply_batch(self, table: EditablePriceTable, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """在索引副本上按顺序应用已校验的批量操作并生成变更报告
+
+        全部成功才换入副本；任一操作出错时在编表保持原样，不会只应用前面几项。
+        """
+        indexes, published = table.indexes, table._published
+        table.indexes = {variant: index.clone() for variant, index in indexes.items()}
+        table._published = {}
+        try:
+            return self._apply_operations(table, operations)
+        except Exception:
+            table.indexes, table._published = indexes, published
+            raise
+
+    def _apply_operations(self, table: EditablePriceTable, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        changes = []
+        summary = {"updated_rows": 0, "added_rows": 0, "deleted_rows": 0, "added_columns": 0, "deleted_columns": 0}
+        for operation in operations:
+            op = operation["op"]
+            change: Dict[str, Any] = {"op": op}
+            if op == "update_row":
+                row_index = operation["row"]
+                before = table.indexes[None].row(row_index)
+                cells = {}
+                for col, value in operation["data"].items():
+                    if col in table.columns:
+                        old_value = _json_value(before[col])
+                        if old_value != _json_value(value):
+                            cells[col] = {"old": old_value, "new": _json_value(value)}
+                self._apply(table, operation)
+                change.update(row=row_index, cells=cells)
+                summary["updated_rows"] += 1
+            elif op == "add_row":
+                change["row"] = self._apply(table, operation)
+                summary["added_rows"] += 1
+            elif op == "delete_row":
+                change["row"] = operation["row"]
+                self._apply(table, operation)
+                summary["deleted_rows"] += 1
+            else:
+                change["column"] = operation["column"]
+                self._apply(table, operation)
+                summary["added_columns" if op == "add_column" else "deleted_columns"] += 1
+            changes.append(change)
+        summary["row_count"] = table.row_count
+        summary["column_count"] = len(table.columns)
+        return {"changes": changes, "summary": summary}
+
+    @staticmethod
+    def _thaw(table: EditablePriceTable):
+        """写时复制：读取方仍持有快照（或来自缓存的冻结索引）时先复制一份再编辑，
+
+        旧快照保持不变；没有读取方持有时直接原地编辑，不复制整张表。
+        """
+        table.indexes = {
+            variant: index.clone() if index.frozen or table.is_published(variant) else index
+            for variant, index in table.indexes.items()
+        }
+        table._published.clear()
+
+    @staticmethod
+    def _keep_raw_only(table: EditablePriceTable):
+        table.indexes = {None: table.indexes[None]}
+
+    def _open(self, file_path: str) -> EditablePriceTable:
+        """取在编表；没有时以缓存中的基准索引为起点登记一张，并重放磁盘上的编辑日志"""
+        abs_path = os.path.abspath(file_path)
+        table = self._tables.get(abs_path)
+        if table is not None and not table.closed:
+            return table
+        raw_index = price_table_cache.load_file_index(file_path)
+        entries = read_journal(file_path)
+        table = EditablePriceTable(file_path, self._lock)
+        table.indexes = price_table_cache.attach_live(file_path, table)
+        table.indexes.setdefault(None, raw_index)
+        for entry in entries:
+            self._apply(table, entry)
+            self._record(table, entry)
+        table.journal = PriceTableJournal(file_path, entries=len(entries))
+        self._tables[abs_path] = table
+        if entries:
+            print(f"📒 [STORE] 重放编辑日志: {os.path.basename(file_path)} ({len(entries)} 条)")
+            self._schedule(table)
+        return table
+
+    def recover(self, file_path: str) -> Optional[EditablePriceTable]:
+        """磁盘上有未压缩的编辑日志时登记在编表（供 price_table_cache 读取时调用）"""
+        with self._lock:
+            table = self._tables.get(os.path.abspath(file_path))
+            if table is not None and not table.closed:
+                return table
+            if not os.path.exists(file_path) or not read_journal(file_path):
+                return None
+            return self._open(file_path)
+
+    # ---- 后台压缩 ----
+
+    def _schedule(self, table: EditablePriceTable):
+        """按日志大小/时间阈值安排压缩；压缩进行中不另起定时器，完成后会再次调度
+
+        上次压缩失败时按退避时间重试，不因日志超过阈值而立即重试。
+        """
+        if table._compacting or table.closed or not table.pending:
+            return
+        if table._failures:
+            delay = min(self.retry_delay * 2 ** (table._failures - 1), max(self.max_journal_age, self.retry_delay))
+            if table._timer is not None:
+                return
+        elif table.journal.size >= self.max_journal_bytes:
+            delay = 0.0
+        else:
+            delay = max(self.max_journal_age - table.journal.age(), 0.0)
+        if table._timer is not None:
+            if delay > 0:
+                return
+            table._timer.cancel()
+        table._timer = threading.Timer(delay, self._compact, args=(table,))
+        table._timer.daemon = True
+        table._timer.start()
+
+    def _compact(self, table: EditablePriceTable):
+        with self._lock:
+            table._timer = None
+            if table.closed or table._compacting or not table.pending:
+                return
+            table._compacting = True
+            revision = table.revision
+            snapshot = table.df.copy()
+
+        # 写新基准的临时文件不持锁，期间编辑照常进行并追加到日志
+        directory, filename = os.path.split(table.file_path)
+        temp_path = os.path.join(directory, f".{filename}.saving")
+        is_csv = filename.lower().endswith(".csv")
+        try:
+            if is_csv:
+                saved = safe_to_csv(snapshot, temp_path)
+            else:
+                with open(temp_path, "wb") as f:
+                    snapshot.to_excel(f, index=False, engine="openpyxl")
+                saved = True
+        except Exception as e:
+            print(f"❌ [STORE] 压缩价格表失败: {filename}: {e}")
+            saved = False
+
+        with self._lock:
+            table._compacting = False
+            if not saved:
+                # 删掉写了一半的临时文件，编辑日志仍在，稍后重试
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                table._failures += 1
+                self._schedule(table)
+                return
+            table._failures = 0
+            if table.closed:
+                # 压缩期间文件被删除或替换，放弃本次压缩
+                os.remove(temp_path)
+                return
+            remaining = [entry for entry in table.pending if entry["rev"] > revision]
+            table.journal.prepare_rebase(temp_path, remaining)
+            os.replace(temp_path, table.file_path)
+            table.journal.commit_rebase(remaining)
+            table.pending = remaining
+            if not is_csv:
+                write_sidecar(table.file_path, snapshot)
+            print(f"💾 [STORE] 编辑日志已并入价格表: {filename} (版本 {revision})")
+            if not remaining:
+                # 没有新的编辑：注销在编表，索引按新文件签名交还给缓存
+                self._release(table)
+            else:
+                self._schedule(table)
+        record_price_table(table.file_path)
+
+    def _release(self, table: EditablePriceTable):
+        table.close()
+        self._tables.pop(table.file_path, None)
+        # 交还给缓存的是快照：与索引共享数据，且已并入追加/删除的行
+        snapshots = {variant: index.snapshot() for variant, index in table.indexes.items()}
+        price_table_cache.detach_live(table.file_path, table, snapshots)
+
+    def flush(self, file_path: Optional[str] = None):
+        """立即把指定（或全部）在编表的编辑日志并入基准文件"""
+        with self._lock:
+            if file_path is None:
+                tables = list(self._tables.values())
+            else:
+                table = self._tables.get(os.path.abspath(file_path))
+                tables = [table] if table is not None else []
+            for table in tables:
+                if table._timer is not None:
+                    table._timer.cancel()
+                    table._timer = None
+        for table in tables:
+            self._compact(table)
+
+    def stats(self) -> Dict[str, Any]:
+        """在编表及其待压缩编辑日志的统计"""
+        with self._lock:
+            return {
+                os.path.basename(path): {
+                    "revision": table.revision,
+                    "pending_edits": len(table.pending),
+                    "journal_bytes": table.journal.size if table.journal else 0,
+                }
+                for path, table in self._tables.items() if not table.closed
+            }
+
+
+# 进程内共享实例；读取缓存时自动重放磁盘上的编辑日志，进程退出前把日志并入价格表
+price_table_store = PriceTableStore()
+price_table_cache.journal_replayer = price_table_store.recover
+atexit.register(price_table_store.flush)
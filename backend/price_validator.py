@@ -1,5 +1,20 @@
 import pandas as pd
 import os
+from price_table_cache import load_price_table_index
+
+# 价格表必需字段
+REQUIRED_COLUMNS = ['产品名称', '型号', '规格', '单价', '品牌']
+
+
+def _is_number(value) -> bool:
+    """单价是否为数字（与整列 pd.to_numeric(errors='coerce') 的判断一致）"""
+    return not pd.isna(pd.to_numeric(pd.Series([value], dtype=object), errors='coerce').iloc[0])
+
+
+def is_cell_value(value) -> bool:
+    """是否可以写入单元格：空值、文本、数字或布尔值（列表、字典等不行）"""
+    return value is None or isinstance(value, (str, int, float, bool))
+
 
 def validate_price_table_format(df):
     """
@@ -17,7 +32,7 @@ def validate_price_table_format(df):
             'message': str
         }
     """
-    required_columns = ['产品名称', '型号', '规格', '单价', '品牌']
+    required_columns = REQUIRED_COLUMNS
     errors = []
     brands = []
     
@@ -113,13 +128,80 @@ def extract_brands_from_price_table(file_path):
         list: 品牌列表
     """
     try:
-        df = pd.read_excel(file_path)
-        if '品牌' in df.columns:
-            brand_values = df['品牌'].dropna().unique()
-            brands = [str(brand).strip() for brand in brand_values if str(brand).strip() and str(brand) != 'nan']
-            return brands
-        else:
-            return []
+        # 与匹配共用同一份缓存索引（品牌分区在加载时已构建）
+        return load_price_table_index(file_path).brand_names()
     except Exception as e:
         print(f"❌ 读取价格表失败: {e}")
-        return [] 
\ No newline at end of file
+        return [] 
+
+
+def validate_patch_operations(columns, row_count, operations):
+    """
+    校验一批价格表编辑操作（按顺序执行，行索引以前面的操作完成后的表为准）
+    
+    Args:
+        columns: list, 当前列名
+        row_count: int, 当前行数
+        operations: list, 编辑操作，每项为 {"op": ..., ...}：
+            update_row {"row", "data"} / add_row {"data"} / delete_row {"row"} /
+            add_column {"column"} / delete_column {"column"}
+        
+    Returns:
+        list: 错误信息，为空表示全部合法
+    """
+    columns = list(columns)
+    errors = []
+    
+    for i, operation in enumerate(operations):
+        label = f"第{i + 1}项操作"
+        if not isinstance(operation, dict):
+            errors.append(f"{label}格式错误")
+            continue
+        op = operation.get("op")
+        row = operation.get("row")
+        data = operation.get("data")
+        column = operation.get("column")
+        
+        if op in ("update_row", "delete_row"):
+            if not isinstance(row, int) or isinstance(row, bool) or row < 0 or row >= row_count:
+                errors.append(f"{label}: 行索引超出范围: {row}")
+                continue
+        if op in ("update_row", "add_row"):
+            if not isinstance(data, dict) or not data:
+                errors.append(f"{label}: 缺少行数据")
+                continue
+            invalid = [str(col) for col, value in data.items() if not is_cell_value(value)]
+            if invalid:
+                errors.append(f"{label}: 单元格值必须是文本或数字: {', '.join(invalid)}")
+                continue
+            # 单价必须为数字；表中有单价列时新增行必须填写单价
+            if '单价' in data and not _is_number(data['单价']):
+                errors.append(f"{label}: 单价不是数字: {data['单价']}")
+            elif op == "add_row" and '单价' in columns and '单价' not in data:
+                errors.append(f"{label}: 新增行缺少单价")
+        
+        if op == "update_row":
+            continue
+        elif op == "add_row":
+            columns.extend(col for col in data if col not in columns)
+            row_count += 1
+        elif op == "delete_row":
+            row_count -= 1
+        elif op == "add_column":
+            if not column:
+                errors.append(f"{label}: 列名不能为空")
+            elif column in columns:
+                errors.append(f"{label}: 列名已存在: {column}")
+            else:
+                columns.append(column)
+        elif op == "delete_column":
+            if column not in columns:
+                errors.append(f"{label}: 列名不存在: {column}")
+            elif column in REQUIRED_COLUMNS:
+                errors.append(f"{label}: 不能删除必需字段: {column}")
+            else:
+                columns.remove(column)
+        else:
+            errors.append(f"{label}: 不支持的操作: {op}")
+    
+    return errors
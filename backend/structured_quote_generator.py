@@ -45,21 +45,22 @@ def _prepare_price_matcher(price_file: str) -> ImprovedPriceMatcher:
     return matcher
 
 
-def _match_row(matcher: ImprovedPriceMatcher, product_name: str, spec: str, model: str, selected_brand: Optional[str] = None) -> Optional[Dict]:
-    result = matcher.match_product(product_name, spec, model, selected_brand=selected_brand)
-    if not result.get("success"):
+def _match_rows(matcher: ImprovedPriceMatcher, records: List[Dict], selected_brand: Optional[str] = None) -> Dict:
+    """对整理后的行一次性批量匹配，返回与 records 对齐的匹配结果数组"""
+    query_df = pd.DataFrame({
+        "品名": [r["name"] for r in records],
+        "规格型号": [r["spec"] for r in records],
+        "标准型号": [r["model"] for r in records],
+    })
+    return matcher.match_batch(query_df, selected_brand=selected_brand, skip_summary_rows=False)
+
+
+def _extract_price_product_name(price_row: Optional[pd.Series]) -> Optional[str]:
+    """从匹配到的价格表行中提取产品名称（优先使用价格表中的名称列）。"""
+    if price_row is None:
         return None
-    best = result.get("best_match") or {}
-    return best
-
-
-def _extract_price_product_name(best_match: Optional[Dict]) -> Optional[str]:
-    """从匹配结果中提取价格表的产品名称（优先使用价格表中的名称列）。"""
-    if not best_match:
-        return None
-    data = best_match.get("原始数据", {}) or {}
     for key in ["产品名称", "品名", "名称", "项目名称", "物料名称"]:
-        val = data.get(key)
+        val = price_row.get(key)
         if val is not None and str(val).strip() != "":
             return str(val).strip()
     return None
@@ -118,94 +119,76 @@ def generate_structured_quote(
     has_unit_price_col = "单价" in df.columns
     has_any_unit_price = bool(has_unit_price_col and df["单价"].notna().any())
 
+    def parse_qty(raw_qty) -> float:
+        try:
+            return float(raw_qty) if str(raw_qty).strip() != "" else 0
+        except Exception:
+            return 0
+
+    records: List[Dict] = []
     if has_any_unit_price:
         for _, row in df.iterrows():
             unit_price_raw = row.get("单价", None)
             if unit_price_raw is None or str(unit_price_raw).strip() == "":
                 continue  # 仅保留匹配成功且已有单价的行
 
-            raw_name = str(row.get(mapping["产品名称"], "") or row.get("品名", "") or row.get("名称", "") or "").strip()
-            raw_model = str(row.get(mapping["型号"], "") or row.get("标准型号", "") or row.get("规格型号", "") or "").strip()
-            raw_spec = str(row.get(mapping["规格"], "") or row.get("规格型号", "") or "").strip()
-            raw_qty = row.get(mapping["数量"], row.get("数量", 1))
-            raw_remark = str(row.get(mapping["备注"], "") or row.get("备注", "") or "").strip()
-
-            try:
-                qty = float(raw_qty) if str(raw_qty).strip() != "" else 0
-            except Exception:
-                qty = 0
-            unit_price = _format_number(unit_price_raw)
-            # 仅输出有有效单价的行
-            if unit_price is None:
-                continue
-            # 应用折扣
-            if discount is None:
-                discount = 1.0
-            try:
-                unit_price = _format_number(unit_price * float(discount))
-            except Exception:
-                pass
-            amount = _format_number((unit_price or 0) * qty)
-
-            # 为了得到标准产品名称，使用三匹配仅做信息补充（不再依赖其价格）
-            best = _match_row(matcher, raw_name, raw_spec, raw_model, selected_brand=selected_brand)
-            standard_name = _extract_price_product_name(best) or raw_name
-
-            output_rows.append({
-                "产品名称(标准)": standard_name,
-                "型号": (best.get("型号") if best else None) or raw_model,
-                "规格": (best.get("规格") if best else None) or raw_spec,
-                "数量": qty,
-                "单价": unit_price,
-                "金额": amount,
-                "备注": raw_remark,
+            records.append({
+                "name": str(row.get(mapping["产品名称"], "") or row.get("品名", "") or row.get("名称", "") or "").strip(),
+                "model": str(row.get(mapping["型号"], "") or row.get("标准型号", "") or row.get("规格型号", "") or "").strip(),
+                "spec": str(row.get(mapping["规格"], "") or row.get("规格型号", "") or "").strip(),
+                "qty": parse_qty(row.get(mapping["数量"], row.get("数量", 1))),
+                "remark": str(row.get(mapping["备注"], "") or row.get("备注", "") or "").strip(),
+                "unit_price": unit_price_raw,
             })
     else:
         # 正常匹配流程（未提前写入单价的情况）
         for _, row in df.iterrows():
-            raw_name = str(row.get(mapping["产品名称"], "") or "").strip()
-            raw_model = str(row.get(mapping["型号"], "") or "").strip()
-            raw_spec = str(row.get(mapping["规格"], "") or "").strip()
-            raw_qty = row.get(mapping["数量"], 1)
-            raw_remark = str(row.get(mapping["备注"], "") or "").strip()
-
-            # 清理数量
-            try:
-                qty = float(raw_qty) if str(raw_qty).strip() != "" else 0
-            except Exception:
-                qty = 0
-
-            # 匹配价格
-            best = _match_row(matcher, raw_name, raw_spec, raw_model, selected_brand=selected_brand)
-            if not best:
-                # 非我司产品：过滤，不进入主报价
-                continue
+            records.append({
+                "name": str(row.get(mapping["产品名称"], "") or "").strip(),
+                "model": str(row.get(mapping["型号"], "") or "").strip(),
+                "spec": str(row.get(mapping["规格"], "") or "").strip(),
+                "qty": parse_qty(row.get(mapping["数量"], 1)),
+                "remark": str(row.get(mapping["备注"], "") or "").strip(),
+            })
 
-            unit_price = _format_number(best.get("价格"))
-            # 仅输出有有效单价的行
-            if unit_price is None:
+    # 整表一次匹配
+    matches = _match_rows(matcher, records, selected_brand=selected_brand)
+    if discount is None:
+        discount = 1.0
+
+    for i, record in enumerate(records):
+        position = matches["位置"][i]
+        price_row = matcher.price_df.iloc[position] if position >= 0 else None
+        if has_any_unit_price:
+            # 输入表已有单价：三匹配仅用于补充标准产品名称（不再依赖其价格）
+            unit_price = _format_number(record["unit_price"])
+        else:
+            if price_row is None:
+                # 非我司产品：过滤，不进入主报价
                 continue
-            # 应用折扣
-            if discount is None:
-                discount = 1.0
-            try:
-                unit_price = _format_number(unit_price * float(discount))
-            except Exception:
-                pass
-            amount = _format_number((unit_price or 0) * qty)
-
-            # 使用价格表标准产品名称（若有）
-            standard_name = _extract_price_product_name(best) or raw_name
-
-            output_rows.append({
-                "产品名称(标准)": standard_name,
-                "型号": best.get("型号") or raw_model,
-                "规格": best.get("规格") or raw_spec,
-                "数量": qty,
-                "单价": unit_price,
-                "金额": amount,
-                "备注": raw_remark,
-            })
+            unit_price = _format_number(matches["价格"][i])
+        # 仅输出有有效单价的行
+        if unit_price is None:
+            continue
+        # 应用折扣
+        try:
+            unit_price = _format_number(unit_price * float(discount))
+        except Exception:
+            pass
+        amount = _format_number((unit_price or 0) * record["qty"])
+
+        # 使用价格表标准产品名称（若有）
+        standard_name = _extract_price_product_name(price_row) or record["name"]
+
+        output_rows.append({
+            "产品名称(标准)": standard_name,
+            "型号": matches["型号"][i] or record["model"],
+            "规格": matches["规格"][i] or record["spec"],
+            "数量": record["qty"],
+            "单价": unit_price,
+            "金额": amount,
+            "备注": record["remark"],
+        })
 
     # 若全部为空，给出提示性空单据
     data_df = pd.DataFrame(output_rows, columns=STANDARD_COLUMNS)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试默认规则管理器：进程内规则缓存、写穿与按修改时间失效
+"""
+
+import json
+import os
+import time
+import tempfile
+from unittest import mock
+
+import default_rules
+from default_rules import DefaultRulesManager, get_rules_manager
+
+
+def test_rules_cached_until_file_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = get_rules_manager(tmp)
+        assert get_rules_manager(tmp) is manager
+
+        # dage 的规则作为新用户模板，只解析一次
+        dage = manager.get_default_rules()
+        dage["pricing"]["discount"] = 0.8
+        manager.save_user_rules('dage', dage)
+        with mock.patch.object(default_rules.json, "loads", side_effect=AssertionError):
+            manager.create_default_rules_for_new_user('a')
+            manager.create_default_rules_for_new_user('b')
+            # 文件未变化时逐行应用规则不再读取解析
+            for _ in range(100):
+                info = manager.apply_default_rules('a', {'product_type': 'Z'})
+            assert manager.get_user_discount('b') == 0.8
+
+        # 调用方修改返回值不影响缓存
+        rules = manager.load_user_rules('a')
+        rules["product_defaults"]["Z"]["connection"] = "X"
+        assert manager.apply_default_rules('a', {'product_type': 'Z'}) == info
+
+        # 保存与设置折扣写穿缓存
+        assert manager.set_user_discount('a', 0.5)
+        assert manager.get_user_discount('a') == 0.5
+
+        # 文件被外部修改后重新读取
+        time.sleep(0.01)
+        rules_file = os.path.join(tmp, 'a', 'default_rules.json')
+        with open(rules_file, 'w', encoding='utf-8') as f:
+            json.dump({"pricing": {"discount": 0.9}}, f)
+        assert DefaultRulesManager(tmp).get_user_discount('a') == 0.9
+        print("✅ 默认规则缓存正常")
+
+
+if __name__ == "__main__":
+    test_rules_cached_until_file_changes()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多关键词自动机：一次扫描的命中集合与逐个关键词子串查找一致
+"""
+
+import random
+
+from convert_excel_to_csv import BRAND_LIST, _BRAND_AUTOMATON
+from improved_price_matcher import ImprovedPriceMatcher
+from keyword_automaton import KeywordAutomaton
+
+
+def test_hits_match_substring_search():
+    keywords = ['不锈钢', '不锈钢304', '304不锈钢', '铜', '铜芯', 'PVC', 'UPVC', 'upvc', 'PP', 'pp塑料',
+                '闸阀', '给水闸阀', '缓闭', '止', 'he', 'she', 'his', 'hers']
+    folded = {'upvc', 'pp塑料'}
+    automaton = KeywordAutomaton(keywords, case_insensitive=folded)
+    alphabet = list('不锈钢304铜芯UPVCupvcPp塑料给水闸阀缓闭止heshirsx ')
+    rng = random.Random(7)
+    for _ in range(5000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        expected = tuple(k for k in keywords if (k in text.lower() if k in folded else k in text))
+        assert automaton.find(text) == expected, text
+        for end, keyword in automaton.iter_matches(text):
+            assert text[end - len(keyword):end].lower() == keyword.lower()
+    assert KeywordAutomaton([]).find('闸阀') == ()
+
+
+def test_priority_resolved_over_hits():
+    # 同时出现多个品牌时取品牌库中靠前的，与逐个查找一致
+    assert _BRAND_AUTOMATON.first('上海科尼特/上海良工 闸阀') == '上海良工'
+    assert _BRAND_AUTOMATON.first('无品牌') == ''
+    assert BRAND_LIST[0] == _BRAND_AUTOMATON.keywords[0]
+
+    keywords = ImprovedPriceMatcher()._extract_product_keywords('Z41H 闸阀/球阀')
+    assert keywords == ['球阀', '闸阀', 'Z41H']
+
+
+if __name__ == "__main__":
+    test_hits_match_substring_search()
+    test_priority_resolved_over_hits()
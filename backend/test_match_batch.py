@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 ImprovedPriceMatcher.match_batch 与逐行 match_product 的结果一致
+"""
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from improved_price_matcher import ImprovedPriceMatcher
+from price_table_fixtures import build_price_table
+
+
+def _build_inquiry(rows: int, seed: int = 5) -> pd.DataFrame:
+    rng = random.Random(seed)
+    names = ['闸阀', '蝶阀', '球阀', '止回阀', '电磁阀 ZCF', '软接头', '', None, '合计']
+    specs = ['DN50', 'φ100', 'PN16 DN080', '规格待定', '', None, 'DN999']
+    models = ['Z45X-16Q', 'D71X', 'q41f-16q', 'XYZ-1', '', None]
+    return pd.DataFrame({
+        '品名': [rng.choice(names) for _ in range(rows)],
+        '规格型号': [rng.choice(specs) for _ in range(rows)],
+        '标准型号': [rng.choice(models) for _ in range(rows)],
+        '数量': [rng.choice([1, 2.5, '', None, 'x']) for _ in range(rows)],
+    })
+
+
+def _matcher() -> ImprovedPriceMatcher:
+    matcher = ImprovedPriceMatcher()
+    matcher.price_df = build_price_table(300).rename(columns={'产品名称': '品名'})
+    return matcher
+
+
+def test_match_batch_matches_match_product():
+    matcher = _matcher()
+    inquiry_df = _build_inquiry(120)
+    # 品牌不存在时三匹配落空，走型号/规格/关键词回退策略
+    for brand in [None, '上海沪工', '不存在的品牌']:
+        batch = matcher.match_batch(inquiry_df, selected_brand=brand)
+        for i, (_, row) in enumerate(inquiry_df.iterrows()):
+            if pd.isna(row['品名']) or str(row['品名']).strip() in ['合计', '总计', '']:
+                assert batch['位置'][i] == -1
+                continue
+            single = matcher.match_product(str(row['品名']), str(row['规格型号']), str(row['标准型号']), brand)
+            if not single['success']:
+                assert batch['位置'][i] == -1
+                continue
+            best = single['best_match']
+            assert (batch['型号'][i], batch['规格'][i], batch['品牌'][i]) == (best['型号'], best['规格'], best['品牌'])
+            assert (batch['价格'][i], batch['匹配类型'][i], batch['置信度'][i]) == (best['价格'], best['匹配类型'], best['置信度'])
+
+
+def test_process_inquiry_with_totals_columns():
+    matcher = _matcher()
+    inquiry_df = _build_inquiry(40)
+    result_df = matcher.process_inquiry_with_totals(inquiry_df.copy())
+    body = result_df.iloc[:-1]
+    matched = body['匹配状态'].str.startswith('成功')
+    qty = inquiry_df['数量'].map(lambda q: float(q) if q not in ('', None, 'x') and not pd.isna(q) else 0.0)
+    assert np.allclose(body['总价'], np.where(matched, body['单价'] * qty, 0.0))
+    assert result_df.iloc[-1]['总价'] == body['总价'].sum()
+    print("✅ 批量匹配结果与逐行匹配一致")
+
+
+if __name__ == "__main__":
+    test_match_batch_matches_match_product()
+    test_process_inquiry_with_totals_columns()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试匹配结果 LRU 缓存
+"""
+
+import os
+import threading
+import time
+import tempfile
+
+import pandas as pd
+
+from improved_price_matcher import ImprovedPriceMatcher
+from match_result_cache import MatchResultCache, match_result_cache
+from multi_company_matcher import MultiCompanyMatcher
+from multi_company_models import PriceTableInfo
+from price_table_fixtures import build_price_table
+
+
+def test_lru_eviction_and_stats():
+    cache = MatchResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', None)
+    assert cache.lookup('a') == (True, 1)
+    cache.put('c', 3)  # 淘汰最久未用的 'b'
+    assert cache.lookup('b') == (False, None)
+    assert cache.lookup('c') == (True, 3)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (2, 1, 1, 2)
+    with cache.track() as usage:
+        cache.lookup('a')
+    cache.lookup('a')
+    assert usage.stats() == {'hits': 1, 'misses': 0, 'hit_rate': 1.0}
+
+
+def test_usage_counts_only_own_context():
+    cache = MatchResultCache()
+    cache.put('a', 1)
+    with cache.track() as outer:
+        cache.lookup('a')
+        with cache.track() as inner:
+            cache.lookup('b')
+        # 其他线程（另一个请求）的查找不计入本次调用
+        other = threading.Thread(target=lambda: [cache.lookup('a') for _ in range(5)])
+        other.start()
+        other.join()
+    assert (outer.hits, outer.misses) == (1, 1)
+    assert (inner.hits, inner.misses) == (0, 1)
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (6, 1)
+
+
+def test_match_product_memoized_per_table_version():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        build_price_table(200).to_excel(path, index=False)
+        matcher = ImprovedPriceMatcher()
+        assert matcher.load_price_table(path)
+
+        with match_result_cache.track() as usage:
+            first = matcher.match_product('闸阀', 'DN50', 'Z45X-16Q')
+            # 首尾空格、大小写和规格写法不同，但归一化后是同一查询
+            second = matcher.match_product(' 闸阀 ', 'dn 50', 'Z45X-16Q ')
+        assert first == second
+        assert usage.hits == 1
+
+        # 返回的是副本，调用方修改不影响缓存
+        second['best_match']['价格'] = -1
+        assert matcher.match_product('闸阀', 'DN50', 'Z45X-16Q') == first
+
+        # 价格表被重写后版本号变化，不再命中旧结果
+        time.sleep(0.01)
+        build_price_table(50, seed=3).to_excel(path, index=False)
+        assert matcher.load_price_table(path)
+        with match_result_cache.track() as usage:
+            matcher.match_product('闸阀', 'DN50', 'Z45X-16Q')
+        assert usage.stats() == {'hits': 0, 'misses': 1, 'hit_rate': 0.0}
+
+
+def test_multi_company_match_memoized():
+    with tempfile.TemporaryDirectory() as tmp:
+        price_tables = []
+        for company, seed in (('甲公司', 1), ('乙公司', 2)):
+            path = os.path.join(tmp, f'{company}.csv')
+            price_df = build_price_table(100, seed=seed)
+            price_df.to_csv(path, index=False)
+            price_tables.append(PriceTableInfo(file_path=path, company_name=company, file_format='csv',
+                                               is_valid=True, data=price_df))
+        inquiry = pd.DataFrame({'品名': ['闸阀', '闸阀', '蝶阀'], '规格型号': ['DN50', 'dn50', 'DN80'], '数量': 1})
+        matcher = MultiCompanyMatcher(executor="inline")
+        first = matcher.match_products_multi_company(inquiry, price_tables)
+        # 两行解析出相同的 (品名, DN)，只查找一次
+        assert (first.cache_stats['hits'], first.cache_stats['misses']) == (0, 2)
+        second = matcher.match_products_multi_company(inquiry, price_tables)
+        assert (second.cache_stats['hits'], second.cache_stats['misses']) == (2, 0)
+        assert [info.company_prices for info in second.aggregated_prices] == \
+            [info.company_prices for info in first.aggregated_prices]
+        print("✅ 多公司匹配结果缓存命中正常")
+
+
+if __name__ == "__main__":
+    test_lru_eviction_and_stats()
+    test_usage_counts_only_own_context()
+    test_match_product_memoized_per_table_version()
+    test_multi_company_match_memoized()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多公司匹配引擎：进程池模式与主进程内匹配结果一致，多公司报价接口与 generate_multi_brand_quote 一致
+"""
+
+import asyncio
+import os
+import tempfile
+
+import pandas as pd
+
+from enhanced_quote_processor import generate_multi_brand_quote
+import multi_company_matcher
+from match_result_cache import match_result_cache
+from multi_company_matcher import MultiCompanyMatcher
+from multi_company_models import PriceTableInfo
+from price_table_cache import price_table_cache
+from price_table_fixtures import build_price_table, build_queries
+from price_table_store import PriceTableStore
+from test_match_batch import _build_inquiry
+
+
+def _price_tables(tmp: str):
+    tables = []
+    for j, company in enumerate(['甲公司', '乙公司', '丙公司']):
+        df = build_price_table(60, seed=j)
+        path = os.path.join(tmp, f'{company}.csv')
+        df.to_csv(path, index=False)
+        tables.append(PriceTableInfo(file_path=path, company_name=company, file_format='csv', is_valid=True, data=df))
+    # 没有文件（不走结果缓存）且含混合类型列的价格表
+    mixed = build_price_table(30, seed=9)
+    mixed['备注'] = [1, 'a', None] * 10
+    tables.append(PriceTableInfo(file_path='', company_name='丁公司', file_format='xlsx', is_valid=True, data=mixed))
+    return tables
+
+
+def _summary(result):
+    return [(info.product_name, info.specification,
+             {company: (m.price, m.brand, m.match_confidence, m.original_row) for company, m in info.company_prices.items()})
+            for info in result.aggregated_prices]
+
+
+def _worker_live_state():
+    return price_table_cache.journal_replayer, price_table_cache.stats()['live_tables']
+
+
+def test_process_pool_matches_inline():
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = _price_tables(tmp)
+        inquiry = _build_inquiry(40)
+        inquiry['规格型号'] = inquiry['规格型号'].fillna('DN50')
+        try:
+            match_result_cache.clear()
+            inline = MultiCompanyMatcher(executor="inline").match_products_multi_company(inquiry, tables)
+            processed = MultiCompanyMatcher(max_workers=2, executor="process", chunk_rows=7).match_products_multi_company(inquiry, tables)
+            assert not processed.errors
+            assert _summary(processed) == _summary(inline)
+            assert processed.matched_products == inline.matched_products > 0
+
+            # 进程池跨请求常驻，工作进程按版本号复用已载入的价格表和匹配结果缓存
+            file_tables = [pt for pt in tables if pt.file_path]
+            process_matcher = MultiCompanyMatcher(max_workers=1, executor="process", chunk_rows=100)
+            process_matcher.match_products_multi_company(inquiry, file_tables)
+            pool = multi_company_matcher._pool
+            again = process_matcher.match_products_multi_company(inquiry, file_tables)
+            assert multi_company_matcher._pool is pool
+            assert again.cache_stats['misses'] == 0 and again.cache_stats['hits'] > 0
+
+            # 在编表有未写回的编辑，在主进程中匹配，结果包含编辑
+            PriceTableStore(max_journal_age=60).update_row(tables[0].file_path, 0, {'价格': 1.5})
+            edited = MultiCompanyMatcher(max_workers=2, executor="process", chunk_rows=7).match_products_multi_company(inquiry, tables)
+            expected = MultiCompanyMatcher(executor="inline").match_products_multi_company(inquiry, tables)
+            assert not edited.errors
+            assert _summary(edited) == _summary(expected)
+            # 工作进程不沿用父进程的在编表，也不重放编辑日志
+            assert multi_company_matcher._pool.submit(_worker_live_state).result() == (None, 0)
+            print("✅ 进程池匹配结果与主进程一致")
+        finally:
+            for pt in tables:
+                if pt.file_path:
+                    price_table_cache.invalidate(pt.file_path)
+
+
+def test_aggregate_by_row_index():
+    inquiry = _build_inquiry(30)
+    tables = [PriceTableInfo(file_path='', company_name=f'{c}公司', file_format='xlsx', is_valid=True,
+                             data=build_price_table(40, seed=s)) for c, s in (('甲', 10), ('乙', 11), ('丙', 12))]
+    result = MultiCompanyMatcher(executor="inline").match_products_multi_company(inquiry, tables)
+    assert len(result.aggregated_prices) == len(MultiCompanyMatcher._inquiry_items(inquiry))
+    for info in result.aggregated_prices:
+        prices = [m.price for m in info.company_prices.values()]
+        if not prices:
+            assert (info.match_count, info.best_company, info.price_range) == (0, '', '')
+            continue
+        assert (info.min_price, info.max_price, info.match_count) == (min(prices), max(prices), len(prices))
+        assert abs(info.avg_price - sum(prices) / len(prices)) < 1e-9
+        assert info.company_prices[info.best_company].price == min(prices)
+        assert info.price_range.startswith(f"¥{min(prices):.2f}")
+        # 按行序号取出的结果与该行的品名、规格一致
+        assert all(m.product_name == info.product_name and m.specification == info.specification
+                   for m in info.company_prices.values())
+
+
+def test_endpoint_matches_multi_brand_quote():
+    import main
+
+    queries = build_queries(60)
+    # 规格型号带型号前缀（如 "Z41X-16Q DN50"）或只有 DN，末尾是合计行
+    inquiry = pd.DataFrame({
+        '品名': [name for name, _, _, _ in queries] + ['合计'],
+        '规格型号': [f"{model} {dn}" if i % 2 else dn for i, (_, model, _, dn) in enumerate(queries)] + [''],
+        '数量': [i % 5 + 1 for i in range(len(queries))] + [''],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        user_dir = os.path.join(tmp, 'tester')
+        for sub in ('询价表', '价格表', '报价单'):
+            os.makedirs(os.path.join(user_dir, sub))
+        inquiry.to_excel(os.path.join(user_dir, '询价表', '询价.xlsx'), index=False)
+        price_files = {}
+        for j, company in enumerate(['甲公司', '乙公司', '丙公司']):
+            price_files[company] = os.path.join(user_dir, '价格表', f'{company}.xlsx')
+            build_price_table(500, seed=j).to_excel(price_files[company], index=False)
+        data_root, main.DATA_ROOT = main.DATA_ROOT, tmp
+        try:
+            response = asyncio.run(main.generate_multi_company_quote_api(inquiry_file='询价.xlsx', username='tester'))
+            assert sorted(response['companies']) == sorted(price_files)
+            expected_path = os.path.join(tmp, '期望.xlsx')
+            assert generate_multi_brand_quote(os.path.join(user_dir, '询价表', '询价.xlsx'),
+                                              {company: price_files[company] for company in response['companies']},
+                                              expected_path)
+
+            actual = pd.read_excel(os.path.join(user_dir, '报价单', response['file']))
+            expected = pd.read_excel(expected_path)
+            pd.testing.assert_frame_equal(actual, expected)
+            matched = expected[[f'{company}_单价' for company in price_files]].iloc[:-1].notna().any(axis=1)
+            assert response['statistics']['matched_products'] == matched.sum() > 40
+        finally:
+            main.DATA_ROOT = data_root
+            for path in price_files.values():
+                main.price_table_cache.invalidate(path)
+        print("✅ 多公司报价接口与 generate_multi_brand_quote 结果一致")
+
+
+if __name__ == "__main__":
+    test_process_pool_matches_inline()
+    test_aggregate_by_row_index()
+    test_endpoint_matches_multi_brand_quote()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表解析缓存
+"""
+
+import os
+import time
+import tempfile
+
+import pandas as pd
+
+from price_table_cache import PriceTableCache, price_table_cache, read_price_table_page
+
+
+def _write_price_table(path, rows=20):
+    df = pd.DataFrame({
+        '产品名称': ['闸阀'] * rows,
+        '型号': [f'Z45X-{i}Q' for i in range(rows)],
+        '规格': [f'DN{50 + i}' for i in range(rows)],
+        '单价': [100.0 + i for i in range(rows)],
+        '品牌': ['上海沪工'] * rows,
+    })
+    df.to_excel(path, index=False)
+    return df
+
+
+def test_cache_hit_and_invalidation():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        _write_price_table(path)
+        cache = PriceTableCache()
+
+        first = cache.load(path)
+        second = cache.load(path)
+        assert cache.stats()['misses'] == 1
+        assert cache.stats()['hits'] == 1
+        assert first.equals(second)
+
+        # 返回的是副本，调用方修改不影响缓存
+        second.loc[0, '单价'] = -1
+        assert cache.load(path).loc[0, '单价'] == 100.0
+
+        # 文件被重写后签名变化，重新解析
+        time.sleep(0.01)
+        _write_price_table(path, rows=5)
+        assert len(cache.load(path)) == 5
+        assert cache.stats()['entries'] == 1
+        print(f"✅ 缓存统计: {cache.stats()}")
+
+
+def test_standardized_variant_and_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        path_a = os.path.join(tmp, 'a.xlsx')
+        path_b = os.path.join(tmp, 'b.xlsx')
+        _write_price_table(path_a)
+        _write_price_table(path_b)
+
+        def standardize(df):
+            return df.rename(columns={'单价': '价格'})
+
+        cache = PriceTableCache()
+        df = cache.load(path_a, standardize=standardize)
+        assert '价格' in df.columns
+        # 标准化结果未命中时内部读取原始结果不重复计数
+        assert (cache.stats()['hits'], cache.stats()['misses']) == (0, 1)
+        assert '单价' in cache.load(path_a).columns
+        assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+        cache.load_index(path_a, standardize=standardize)
+        assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 2)
+
+        # 预算只够放下一个表时，最久未用的条目被淘汰
+        cache.invalidate()
+        cache.load(path_a)
+        cache.max_bytes = cache.stats()['bytes']
+        cache.load(path_b)
+        assert cache.stats()['entries'] == 1
+        assert cache.stats()['evictions'] == 1
+        print(f"✅ 淘汰统计: {cache.stats()}")
+
+
+def test_read_price_table_page():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        df = _write_price_table(path, rows=25)
+        try:
+            columns, page, total_rows = read_price_table_page(path, 20, 30)
+            assert columns == df.columns.tolist() and total_rows == 25
+            assert page['型号'].tolist() == [f'Z45X-{i}Q' for i in range(20, 25)]
+            # 返回的是当前页的副本，修改不影响缓存中的整表
+            page.iloc[0, 0] = '改'
+            assert read_price_table_page(path, 20, 21)[1].iloc[0, 0] == '闸阀'
+        finally:
+            price_table_cache.invalidate(path)
+
+
+if __name__ == "__main__":
+    test_cache_hit_and_invalidation()
+    test_standardized_variant_and_eviction()
+    test_read_price_table_page()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表向量化打分索引与原逐行打分结果一致
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from price_table_fixtures import build_price_table, build_queries, legacy_tri_match
+from price_table_index import PriceTableIndex, parse_dn
+
+
+def _assert_same(price_df, queries):
+    index = PriceTableIndex(price_df)
+    for name, model, brand, dn in queries:
+        got = index.best_match(model, name, brand, dn)
+        got = (price_df.index[got[0]], got[1]) if got else None
+        if dn:
+            # 原实现按“规格包含数字”过滤 DN，索引按整数 DN 相等过滤：先按 DN 分桶再比较打分
+            candidates = price_df[price_df['规格'].map(parse_dn) == parse_dn(dn)]
+            expected = legacy_tri_match(candidates, name, model, brand, '')
+        else:
+            expected = legacy_tri_match(price_df, name, model, brand, dn)
+        assert got == expected, f"{(name, model, brand, dn)}: {got} != {expected}"
+
+
+def test_matches_legacy_on_generated_table():
+    _assert_same(build_price_table(500), build_queries(50))
+
+
+def test_matches_legacy_on_edge_cases():
+    price_df = pd.DataFrame({
+        '产品名称': ['闸 阀', np.nan, '蝶阀', '', '闸阀DN100'],
+        '型号': ['Z45X-16Q', 'Z45X-16Q', np.nan, 'z45x-16q ', 'Z45X'],
+        '规格': ['DN100', 'DN10', np.nan, 'DN100', 100],
+        '价格': [1, 2, 3, 4, 5],
+        '品牌': ['上海沪工', ' 上海沪工', np.nan, '沪工', '上海沪工'],
+    }, index=[10, 11, 12, 13, 14])
+    queries = [
+        ('闸阀', 'Z45X-16Q', None, 'DN100'),
+        ('闸阀', 'Z45X-16Q', '上海沪工', ''),
+        ('', '', None, ''),
+        ('蝶阀', '', None, 'DN10'),
+        ('阀', 'Z45X', '沪工', 'DN1'),
+    ]
+    _assert_same(price_df, queries)
+    assert PriceTableIndex(price_df.iloc[0:0]).best_match('Z45X', '闸阀') is None
+
+
+def test_dn_buckets_do_not_confuse_dn10_and_dn100():
+    assert parse_dn('DN100') == 100
+    assert parse_dn('φ 25') == 25
+    assert parse_dn(80) == 80
+    assert parse_dn(np.nan) is None
+    # 没有 DN 前缀时只有纯整数规格才视为 DN，压力/公称压力中的数字不算
+    assert parse_dn('50') == 50
+    assert parse_dn('1.6MPa') is None
+    assert parse_dn('PN16') is None
+    price_df = pd.DataFrame({
+        '型号': ['Z45X-16Q'] * 4,
+        '规格': ['DN10', 'DN100', 'dn 10', '规格待定'],
+        '价格': [1, 2, 3, 4],
+    })
+    index = PriceTableIndex(price_df)
+    assert list(index.dn_positions('DN10')) == [0, 2]
+    assert list(index.dn_positions('DN100')) == [1]
+    assert list(index.dn_positions('DN15')) == []
+
+
+def test_brand_partitions_and_cached_index():
+    import os
+    import tempfile
+    from price_table_cache import PriceTableCache
+
+    price_df = pd.DataFrame({
+        '型号': ['Z45X-16Q', 'D71X-16Q', 'Z45X-16Q', 'Q41F-16P'],
+        '规格': ['DN50', 'DN50', 'DN100', 'DN50'],
+        '价格': [1, 2, 3, 4],
+        '品牌': [' 上海沪工', '上海良工', '上海 沪工', np.nan],
+    })
+    index = PriceTableIndex(price_df)
+    assert list(index.partition_positions('品牌', '上海沪工')) == [0, 2]
+    assert list(index.partition_positions('品牌', '')) == [3]
+    assert list(index.partition_positions('品牌', '不存在')) == []
+    assert list(index.candidate_positions('上海沪工', 'DN50')) == [0]
+    assert index.brand_names() == ['上海沪工', '上海良工', '上海 沪工']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        price_df.to_excel(path, index=False)
+        cache = PriceTableCache()
+        first = cache.load_index(path)
+        # 同一文件的索引跨请求复用
+        assert cache.load_index(path) is first
+        assert first.brand_names() == index.brand_names()
+
+
+def test_search_matches_dataframe_filter():
+    price_df = build_price_table(400)
+    price_df.loc[5, '价格'] = None
+    price_df.loc[7, '规格'] = '规格待定'
+    index = PriceTableIndex(price_df)
+    dn = price_df['规格'].map(parse_dn)
+
+    got = index.search(model_prefix='z45', brand=' 上海沪工 ', dn_min=50, dn_max=150, price_max=3000)
+    expected = price_df.index[
+        price_df['型号'].str.lower().str.startswith('z45') & (price_df['品牌'] == '上海沪工')
+        & dn.between(50, 150) & (price_df['价格'] <= 3000)
+    ]
+    assert got.tolist() == expected.tolist()
+
+    got = index.search(text='蝶阀', sort_by='price', descending=True)
+    expected = price_df[price_df['产品名称'].str.contains('蝶阀')].sort_values('价格', ascending=False, kind='stable')
+    assert got.tolist() == expected.index.tolist()
+
+    got = index.search(sort_by='dn')
+    assert got[-1] == 7 and list(dn[got[:-1]]) == sorted(dn.drop(7))
+    assert index.search(brand='不存在').size == 0
+
+    # 编辑后数值列同步更新
+    index.set_cells(5, {3: 1.5})
+    assert index.search(sort_by='price')[0] == 5
+
+
+def test_set_cells_casts_incompatible_columns_explicitly():
+    index = PriceTableIndex(pd.DataFrame({'型号': ['A', 'B'], '数量': [1, 2], '价格': [1.5, 2.5], '品牌': [np.nan, np.nan]}))
+    df = index.price_df
+    # 兼容的值保持列类型，不兼容的值先把该列转为 object（不触发 pandas 的隐式转换）
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        index.set_cells(0, {1: 3, 2: None})
+        assert (df['数量'].dtype, df['价格'].dtype) == (np.int64, np.float64)
+        index.set_cells(1, {1: 2.5, 2: '面议', 3: '上海沪工'})
+    assert df['数量'].dtype == object and df['价格'].dtype == object and df['品牌'].dtype == object
+    assert list(df['数量']) == [3, 2.5] and df.iat[1, 2] == '面议'
+    assert list(index.partitions('品牌')['上海沪工']) == [1]
+
+
+if __name__ == "__main__":
+    test_matches_legacy_on_generated_table()
+    test_matches_legacy_on_edge_cases()
+    test_dn_buckets_do_not_confuse_dn10_and_dn100()
+    test_brand_partitions_and_cached_index()
+    test_search_matches_dataframe_filter()
+    test_set_cells_casts_incompatible_columns_explicitly()
+    print("✅ 向量化打分与逐行打分结果一致")
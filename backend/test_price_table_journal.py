@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表编辑日志：崩溃恢复、失效判断与按大小触发压缩
+"""
+
+import os
+import time
+import tempfile
+
+import pandas as pd
+
+from price_table_cache import price_table_cache, read_price_table
+from price_table_fixtures import build_price_table, temp_price_table
+from price_table_journal import journal_path, read_journal, has_journal, PriceTableJournal
+from price_table_store import PriceTableStore
+
+
+def test_journal_replayed_after_restart():
+    with temp_price_table(30) as path:
+        store = PriceTableStore(max_journal_age=60)
+        store.update_row(path, 2, {'型号': 'J-2'})
+        store.add_row(path, {'产品名称': '球阀', '型号': 'J-NEW', '单价': 5})
+        store.delete_row(path, 0)
+        assert has_journal(path)
+
+        # 模拟进程重启：内存中的在编表丢失，只剩基准文件与编辑日志
+        price_table_cache.invalidate(path)
+        with open(journal_path(path), "ab") as f:
+            f.write(b'{"op": "delete_row", "ro')  # 追加时中断留下的半行
+        df = read_price_table(path)
+        assert len(df) == 30
+        assert df.loc[1, '型号'] == 'J-2' and df.loc[29, '型号'] == 'J-NEW'
+        assert price_table_cache.stats()['live_tables'] == 1
+
+
+def test_stale_journal_ignored_and_rebase_recovered():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        build_price_table(10).to_excel(path, index=False)
+        journal = PriceTableJournal(path)
+        journal.append({"op": "delete_row", "row": 0, "rev": 1})
+        journal.close()
+        assert len(read_journal(path)) == 1
+
+        # 压缩在替换基准后、启用新日志前中断：.journal.next 与新基准匹配
+        new_base = os.path.join(tmp, 'new.xlsx')
+        build_price_table(9).to_excel(new_base, index=False)
+        journal.prepare_rebase(new_base, [{"op": "delete_row", "row": 1, "rev": 2}])
+        os.replace(new_base, path)
+        assert read_journal(path) == [{"op": "delete_row", "row": 1, "rev": 2}]
+        assert not os.path.exists(journal_path(path) + ".next")
+
+        # 价格表被重新上传后旧日志失效
+        time.sleep(0.01)
+        build_price_table(5).to_excel(path, index=False)
+        assert read_journal(path) == []
+        assert not has_journal(path)
+
+
+def test_size_threshold_triggers_compaction():
+    with temp_price_table(20, name='价格表.csv') as path:
+        store = PriceTableStore(max_journal_bytes=200, max_journal_age=60)
+        for i in range(5):
+            store.update_row(path, i, {'型号': f'SIZE-{i}'})
+        deadline = time.time() + 5
+        while has_journal(path) and time.time() < deadline:
+            time.sleep(0.05)
+        assert not has_journal(path)
+        assert list(pd.read_csv(path)['型号'][:5]) == [f'SIZE-{i}' for i in range(5)]
+        print("✅ 编辑日志恢复与压缩正常")
+
+
+if __name__ == "__main__":
+    test_journal_replayed_after_restart()
+    test_stale_journal_ignored_and_rebase_recovered()
+    test_size_threshold_triggers_compaction()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表清单：列表从清单读取，上传/编辑/删除时更新
+"""
+
+import os
+import time
+from unittest import mock
+
+import price_table_manifest
+from price_table_cache import price_table_cache
+from price_table_fixtures import build_price_table, temp_price_table
+from price_table_manifest import list_price_tables, record_price_table, forget_price_table, manifest_path
+from price_table_store import PriceTableStore
+
+
+def test_listing_served_from_manifest():
+    with temp_price_table(40) as path:
+        tmp = os.path.dirname(path)
+        record_price_table(path)
+        assert os.path.exists(manifest_path(tmp))
+
+        # 清单新鲜时列表不再读取价格表
+        with mock.patch.object(price_table_manifest, "load_price_table_index", side_effect=AssertionError):
+            files = list_price_tables(tmp)
+        assert len(files) == 1
+        entry = files[0]
+        assert entry["filename"] == '价格表.xlsx' and entry["row_count"] == 40
+        assert entry["columns"] == ['产品名称', '型号', '规格', '价格', '品牌']
+        assert '上海沪工' in entry["brands"] and len(entry["content_hash"]) == 64
+
+        # 编辑不改写清单，列表时行列信息取自内存中的在编表
+        with open(manifest_path(tmp), "rb") as f:
+            manifest_before = f.read()
+        store = PriceTableStore(max_journal_age=60)
+        store.add_row(path, {'型号': 'NEW'})
+        store.add_column(path, '备注')
+        with open(manifest_path(tmp), "rb") as f:
+            assert f.read() == manifest_before
+        entry = list_price_tables(tmp)[0]
+        assert (entry["row_count"], entry["column_count"]) == (41, 6) and entry["columns"][-1] == '备注'
+
+        # 品牌按在编表的版本重新计算，版本不变时不再读取索引
+        store.update_row(path, 40, {'品牌': '新品牌'})
+        assert '新品牌' in list_price_tables(tmp)[0]["brands"]
+        with mock.patch.object(price_table_manifest, "load_price_table_index", side_effect=AssertionError):
+            assert '新品牌' in list_price_tables(tmp)[0]["brands"]
+        store.update_row(path, 40, {'品牌': '上海沪工'})
+        assert '新品牌' not in list_price_tables(tmp)[0]["brands"]
+
+        # 压缩后按新文件重新记录大小与内容哈希
+        store.flush()
+        compacted = list_price_tables(tmp)[0]
+        assert compacted["row_count"] == 41
+        assert compacted["content_hash"] != files[0]["content_hash"]
+
+        # 文件被外部替换时自动补齐，删除后条目移除
+        time.sleep(0.01)
+        build_price_table(5).to_excel(path, index=False)
+        price_table_cache.invalidate(path)
+        assert list_price_tables(tmp)[0]["row_count"] == 5
+        os.remove(path)
+        forget_price_table(path)
+        assert list_price_tables(tmp) == []
+        print("✅ 价格表清单更新正常")
+
+
+if __name__ == "__main__":
+    test_listing_served_from_manifest()
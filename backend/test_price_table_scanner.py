@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表扫描器：只读表头的流式验证、按文件签名缓存与并发扫描
+"""
+
+import os
+import re
+import time
+import tempfile
+import zipfile
+from unittest import mock
+
+import pandas as pd
+
+import price_table_scanner
+from improved_price_matcher import ImprovedPriceMatcher
+from price_table_cache import price_table_cache
+from price_table_fixtures import build_price_table, temp_price_table
+from price_table_scanner import PriceTableScanner, read_header
+from price_table_store import PriceTableStore
+
+
+def test_validation_reads_header_and_caches():
+    with tempfile.TemporaryDirectory() as tmp:
+        table_dir = os.path.join(tmp, "价格表")
+        os.makedirs(table_dir)
+        build_price_table(200).to_excel(os.path.join(table_dir, '甲公司-价格表.xlsx'), index=False)
+        build_price_table(20).drop(columns=['规格']).to_excel(os.path.join(table_dir, '乙公司_报价表.xlsx'), index=False)
+        build_price_table(0).to_excel(os.path.join(table_dir, '丙公司价格.xlsx'), index=False)
+        build_price_table(10).to_csv(os.path.join(table_dir, '丁公司.csv'), index=False)
+
+        # 表头与 pandas 一致，只读取所需行
+        path = os.path.join(table_dir, '甲公司-价格表.xlsx')
+        columns, sample_count = read_header(path)
+        assert columns == list(pd.read_excel(path, nrows=5).columns) and sample_count == 5
+
+        scanner = PriceTableScanner(max_workers=3)
+        tables = {t.company_name: t for t in scanner.scan_price_tables(tmp)}
+        assert tables['甲公司'].is_valid and tables['丁公司'].is_valid
+        assert tables['乙公司'].error_message == "缺少必要的列: 规格"
+        assert tables['丙公司'].error_message == "文件内容为空"
+
+        # 文件未变化时直接使用缓存的验证结果
+        with mock.patch.object(price_table_scanner, "read_header", side_effect=AssertionError):
+            assert [t.is_valid for t in scanner.scan_price_tables(tmp)] == [t.is_valid for t in tables.values()]
+
+        # 文件被替换后重新验证
+        time.sleep(0.01)
+        build_price_table(20).to_excel(os.path.join(table_dir, '乙公司_报价表.xlsx'), index=False)
+        assert scanner.validate_price_table(os.path.join(table_dir, '乙公司_报价表.xlsx')) == (True, None)
+        print("✅ 价格表流式验证与缓存正常")
+
+
+def test_header_ignores_wrong_dimension_record():
+    with temp_price_table(8) as path:
+        # 模拟其他工具写出的 xlsx：<dimension> 记录只有 A1，与实际内容不符
+        stale_path = path + '.tmp'
+        with zipfile.ZipFile(path) as source, zipfile.ZipFile(stale_path, 'w') as target:
+            for item in source.infolist():
+                data = source.read(item.filename)
+                if item.filename.startswith('xl/worksheets/'):
+                    data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+                target.writestr(item, data)
+        os.replace(stale_path, path)
+
+        assert read_header(path) == (['产品名称', '型号', '规格', '价格', '品牌'], 5)
+        assert PriceTableScanner().validate_price_table(path) == (True, None)
+
+
+def test_load_price_tables_cached_until_invalidated():
+    with temp_price_table(30, name=os.path.join('价格表', '甲公司-价格表.xlsx')) as path:
+        table_dir = os.path.dirname(path)
+        tmp = os.path.dirname(table_dir)
+        scanner = PriceTableScanner()
+        tables = scanner.load_price_tables(tmp)
+        # 只记录路径，匹配用的索引已预先构建在共享缓存中
+        assert [(t.company_name, t.data) for t in tables] == [('甲公司', None)]
+        hits = price_table_cache.hits
+        matcher = ImprovedPriceMatcher()
+        assert matcher.load_price_table(path) and len(matcher.price_df) == 30
+        assert price_table_cache.hits == hits + 1
+
+        # 缓存命中时不再扫描目录；编辑后只重新验证该表
+        store = PriceTableStore(max_journal_age=60)
+        store.delete_row(path, 0)
+        with mock.patch.object(scanner, "scan_price_tables", side_effect=AssertionError):
+            assert scanner.load_price_tables(tmp)[0].is_valid
+
+            # 编辑删掉价格列后重新验证为无效，补回价格列后恢复有效
+            store.delete_column(path, '价格')
+            invalid = scanner.load_price_tables(tmp)[0]
+            assert (invalid.is_valid, invalid.error_message, invalid.data) == (False, "缺少必要的列: 价格", None)
+            store.add_column(path, '单价')
+            restored = scanner.load_price_tables(tmp)[0]
+            assert restored.is_valid and restored.data is None
+            assert matcher.load_price_table(path) and '价格' in matcher.price_df.columns and len(matcher.price_df) == 29
+
+        # 新增文件或显式失效后重新扫描
+        build_price_table(10).to_csv(os.path.join(table_dir, '乙公司.csv'), index=False)
+        assert [t.company_name for t in sorted(scanner.load_price_tables(tmp), key=lambda t: t.company_name)] == ['乙公司', '甲公司']
+        scanner.invalidate(tmp)
+        with mock.patch.object(scanner, "scan_price_tables", wraps=scanner.scan_price_tables) as scan:
+            scanner.load_price_tables(tmp)
+            assert scan.call_count == 1
+
+
+if __name__ == "__main__":
+    test_validation_reads_header_and_caches()
+    test_header_ignores_wrong_dimension_record()
+    test_load_price_tables_cached_until_invalidated()
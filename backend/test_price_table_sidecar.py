@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试价格表列式旁路文件
+"""
+
+import datetime
+import json
+import os
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from price_table_sidecar import (SIDECAR_FORMAT_VERSION, load_sidecar, read_sidecar_meta, remove_sidecar, sidecar_path,
+                                 write_sidecar)
+
+
+def test_sidecar_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        pd.DataFrame({
+            '产品名称': ['闸阀', None, '蝶阀'],
+            '型号': ['Z45X-16Q', 123, 'D71X-16Q'],  # 混合类型列
+            '规格': ['DN50', 'DN100', np.nan],
+            '单价': [100.5, np.nan, 300.0],
+            '数量': [1, 2, 3],
+        }).to_excel(path, index=False)
+        original = pd.read_excel(path)
+
+        assert write_sidecar(path, original) == sidecar_path(path)
+        loaded = load_sidecar(path)
+        assert loaded is not None
+        assert list(loaded.columns) == list(original.columns)
+        pd.testing.assert_frame_equal(loaded, original, check_dtype=False)
+        assert read_sidecar_meta(path)['rows'] == 3
+
+        # 源文件变化后旁路文件视为过期
+        time.sleep(0.01)
+        original.head(1).to_excel(path, index=False)
+        assert load_sidecar(path) is None
+
+        remove_sidecar(path)
+        assert not os.path.exists(sidecar_path(path))
+        print("✅ 旁路文件读写与过期检测正常")
+
+
+def test_sidecar_never_loads_pickled_objects():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, '价格表.xlsx')
+        original = pd.DataFrame({
+            '型号': ['Z45X-16Q', 123, 2.5, True, datetime.datetime(2024, 5, 1, 8, 30), None],
+            '单价': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        })
+        original.to_excel(path, index=False)
+        write_sidecar(path, original)
+        # 旁路文件中没有对象数组，混合类型列按类型还原
+        with np.load(sidecar_path(path), allow_pickle=False) as npz:
+            assert all(npz[name].dtype != object for name in npz.files)
+        loaded = load_sidecar(path)
+        assert [type(v) for v in loaded['型号'][:5]] == [str, int, float, bool, datetime.datetime]
+        assert loaded['型号'].tolist()[:5] == original['型号'].tolist()[:5] and pd.isna(loaded['型号'][5])
+
+        # 无法按类型编码的列不写旁路文件
+        remove_sidecar(path)
+        assert write_sidecar(path, pd.DataFrame({'型号': [{'a': 1}, 'x']})) is None
+        assert not os.path.exists(sidecar_path(path))
+
+        # 被替换为含 pickle 对象的旁路文件时不会载入，回退到解析源文件
+        meta = {'source_size': os.stat(path).st_size, 'source_mtime_ns': os.stat(path).st_mtime_ns,
+                'version': SIDECAR_FORMAT_VERSION, 'rows': 1, 'columns': [{'name': '型号', 'kind': 'str'}]}
+        np.savez(sidecar_path(path), c0=np.array([{'a': 1}], dtype=object), m0=np.array([False]),
+                 __meta__=np.array(json.dumps(meta)))
+        assert read_sidecar_meta(path) is not None and load_sidecar(path) is None
+
+
+if __name__ == "__main__":
+    test_sidecar_round_trip()
+    test_sidecar_never_loads_pickled_objects()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试可编辑价格表：索引增量维护与后台压缩
+"""
+
+import os
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from improved_price_matcher import ImprovedPriceMatcher
+from price_table_cache import (price_table_cache, load_price_table_index, load_price_table_search_view, read_price_table,
+                               price_table_version)
+from price_table_fixtures import build_price_table, temp_price_table
+from price_table_index import PriceTableIndex
+from price_table_journal import remove_journal
+from price_table_store import PriceTableStore, PriceTableEditError
+
+
+def _assert_index_consistent(index: PriceTableIndex):
+    """增量维护后的结构应与按当前内容重新构建的结果一致"""
+    fresh = PriceTableIndex(index.price_df.copy())
+    assert (index.model_col, index.name_col, index.brand_col, index.spec_col) == \
+        (fresh.model_col, fresh.name_col, fresh.brand_col, fresh.spec_col)
+    for col in (fresh.model_col, fresh.name_col, fresh.brand_col):
+        if col is None:
+            continue
+        patched, rebuilt = index.column(col), fresh.column(col)
+        assert list(patched.uniques[patched.codes]) == list(rebuilt.uniques[rebuilt.codes])
+    if fresh.brand_col:
+        patched, rebuilt = index.partitions(fresh.brand_col), fresh.partitions(fresh.brand_col)
+        assert patched.keys() == rebuilt.keys()
+        for key in rebuilt:
+            assert np.array_equal(patched[key], rebuilt[key])
+    assert index.dn_buckets.keys() == fresh.dn_buckets.keys()
+    for key in fresh.dn_buckets:
+        assert np.array_equal(index.dn_buckets[key], fresh.dn_buckets[key])
+    assert np.array_equal(index.candidate_positions(), fresh.candidate_positions())
+
+
+def test_incremental_index_matches_rebuild():
+    with temp_price_table(60) as path:
+        store = PriceTableStore(max_journal_age=60)
+        index = load_price_table_index(path)
+        version = price_table_version(path)
+
+        store.update_row(path, 3, {'规格': 'DN999', '品牌': '新品牌', '单价': 12.5, '不存在的列': 1})
+        store.add_row(path, {'产品名称': '蝶阀', '型号': 'D71X', '规格': 'DN80', '品牌': '上海沪工', '单价': 88})
+        store.delete_row(path, 0)
+        index = load_price_table_index(path)
+        _assert_index_consistent(index)
+        assert price_table_version(path) != version
+        assert index.version[0] == 'edit'
+
+        store.add_column(path, '备注')
+        store.delete_column(path, '规格')
+        index = load_price_table_index(path)
+        _assert_index_consistent(index)
+        assert index.spec_col is None and '备注' in index.price_df.columns
+
+        for bad in (lambda: store.delete_row(path, 999),
+                    lambda: store.add_column(path, ''),
+                    lambda: store.add_column(path, '备注'),
+                    lambda: store.delete_column(path, '规格')):
+            try:
+                bad()
+                assert False, "应当抛出 PriceTableEditError"
+            except PriceTableEditError:
+                pass
+
+
+def test_reads_see_edits_before_and_after_persist():
+    with temp_price_table(20) as path:
+        store = PriceTableStore(max_journal_age=0.05)
+        store.update_row(path, 1, {'型号': 'NEW-1'})
+        new_row = store.add_row(path, {'产品名称': '球阀', '型号': 'Q41F', '规格': 'DN25', '单价': 10})
+        assert new_row == 20
+
+        # 分页读取的共享视图是只读快照，之后的编辑不会改动它
+        view = price_table_cache.view(path)
+        store.update_row(path, 1, {'型号': 'NEW-2'})
+        assert view.loc[1, '型号'] == 'NEW-1' and price_table_cache.view(path).loc[1, '型号'] == 'NEW-2'
+        store.update_row(path, 1, {'型号': 'NEW-1'})
+
+        # 写回之前读取到的已是编辑后的内容
+        df = read_price_table(path)
+        assert len(df) == 21 and df.loc[1, '型号'] == 'NEW-1'
+
+        store.flush()
+        assert price_table_cache.stats()['live_tables'] == 0
+        on_disk = pd.read_excel(path)
+        assert len(on_disk) == 21 and on_disk.loc[1, '型号'] == 'NEW-1'
+        assert on_disk.loc[20, '型号'] == 'Q41F'
+        # 写回后索引按新的文件签名交还给缓存，不需要重新解析
+        assert load_price_table_index(path).price_df.loc[20, '型号'] == 'Q41F'
+
+        # 日志超过时间阈值后自动并入价格表
+        store.delete_row(path, 0)
+        time.sleep(1.0)
+        assert len(pd.read_excel(path)) == 20
+        assert price_table_cache.stats()['live_tables'] == 0
+
+        # 文件被删除时放弃尚未写回的编辑
+        store.update_row(path, 0, {'型号': 'DROPPED'})
+        price_table_cache.invalidate(path)
+        remove_journal(path)
+        store.flush()
+        assert 'DROPPED' not in set(pd.read_excel(path)['型号'])
+        print("✅ 价格表增量编辑与异步写回正常")
+
+
+def test_failed_compaction_is_retried():
+    with temp_price_table(20) as path:
+        store = PriceTableStore(max_journal_age=60, retry_delay=0.05)
+        store.update_row(path, 0, {'型号': 'RETRIED'})
+        temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.saving")
+        to_excel = pd.DataFrame.to_excel
+        calls = []
+
+        def fail_once(df, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("磁盘已满")
+            return to_excel(df, *args, **kwargs)
+
+        with mock.patch.object(pd.DataFrame, "to_excel", autospec=True, side_effect=fail_once):
+            store.flush(path)
+            # 失败后删掉临时文件，编辑仍在内存与日志中
+            assert not os.path.exists(temp_path)
+            assert read_price_table(path).loc[0, '型号'] == 'RETRIED'
+            assert store.stats()[os.path.basename(path)]['pending_edits'] == 1
+            for _ in range(100):
+                if price_table_cache.stats()['live_tables'] == 0:
+                    break
+                time.sleep(0.05)
+        assert len(calls) == 2 and not os.path.exists(temp_path)
+        assert pd.read_excel(path).loc[0, '型号'] == 'RETRIED'
+        print("✅ 压缩失败后按退避时间重试")
+
+
+def test_patch_is_atomic_and_reports_changes():
+    with temp_price_table(frame=build_price_table(10).rename(columns={'价格': '单价'})) as path:
+        store = PriceTableStore(max_journal_age=60)
+        original = read_price_table(path)
+        # 任一操作不合法时整批拒绝，表保持不变
+        for operations in ([{"op": "update_row", "row": 0, "data": {'单价': 1}},
+                            {"op": "update_row", "row": 1, "data": {'单价': '面议'}}],
+                           [{"op": "delete_row", "row": 9}, {"op": "update_row", "row": 9, "data": {'型号': 'X'}}],
+                           [{"op": "add_row", "data": {'型号': 'X'}}],
+                           [{"op": "delete_column", "column": '品牌'}],
+                           [{"op": "delete_row", "row": 0}, {"op": "update_row", "row": 0, "data": {'型号': ['x', 'y']}}]):
+            try:
+                store.patch(path, operations)
+                assert False, "应当抛出 PriceTableEditError"
+            except PriceTableEditError:
+                pass
+        assert read_price_table(path).equals(original)
+        assert price_table_cache.stats()['live_tables'] == 0
+
+        # 校验通过但应用到一半出错：前面已应用的操作同样撤销，不写编辑日志
+        store.update_row(path, 5, {'型号': 'KEEP'})
+        before = read_price_table(path)
+        with mock.patch.object(PriceTableIndex, "set_cells", side_effect=RuntimeError("boom")):
+            try:
+                store.patch(path, [{"op": "delete_row", "row": 0}, {"op": "update_row", "row": 0, "data": {'型号': 'X'}}])
+                assert False, "应当抛出 RuntimeError"
+            except RuntimeError:
+                pass
+        assert read_price_table(path).equals(before)
+        assert store.stats()['价格表.xlsx']['pending_edits'] == 1
+        _assert_index_consistent(load_price_table_index(path))
+        store.update_row(path, 5, {'型号': original.loc[5, '型号']})
+
+        report = store.patch(path, [
+            {"op": "update_row", "row": 0, "data": {'单价': 9.5, '型号': original.loc[0, '型号']}},
+            {"op": "add_row", "data": {'产品名称': '球阀', '型号': 'Q41F', '单价': '12'}},
+            {"op": "delete_row", "row": 1},
+            {"op": "add_column", "column": '备注'},
+        ])
+        assert report["changes"][0]["cells"] == {'单价': {"old": original.loc[0, '单价'], "new": 9.5}}
+        assert report["changes"][1]["row"] == 10
+        assert report["summary"] == {"updated_rows": 1, "added_rows": 1, "deleted_rows": 1, "added_columns": 1,
+                                     "deleted_columns": 0, "row_count": 10, "column_count": 6}
+        # 一批操作只追加一条编辑日志
+        assert store.stats()['价格表.xlsx']['pending_edits'] == 3
+        store.flush()
+        on_disk = pd.read_excel(path)
+        assert on_disk.loc[0, '单价'] == 9.5 and on_disk.loc[9, '型号'] == 'Q41F' and '备注' in on_disk.columns
+
+
+def test_readers_keep_pinned_snapshot():
+    with temp_price_table(30) as path:
+        store = PriceTableStore(max_journal_age=60)
+        # 报价任务开始时取得的快照
+        pinned = load_price_table_index(path)
+        pinned_model = pinned.price_df.loc[0, '型号']
+        pinned_best = pinned.best_match(pinned_model, '', None)
+
+        store.update_row(path, 0, {'型号': 'CHANGED'})
+        store.delete_row(path, 1)
+        assert pinned.price_df.loc[0, '型号'] == pinned_model and len(pinned) == 30
+        assert pinned.best_match(pinned_model, '', None) == pinned_best
+        _assert_index_consistent(pinned)
+
+        # 新的读取方拿到新发布的快照；快照一经发布即不可原地修改
+        current = load_price_table_index(path)
+        assert current is not pinned and current.version != pinned.version
+        assert current.price_df.loc[0, '型号'] == 'CHANGED' and len(current) == 29
+        try:
+            current.delete_row(0)
+            assert False, "已发布的快照不应允许原地编辑"
+        except RuntimeError:
+            pass
+        store.update_row(path, 0, {'型号': 'AGAIN'})
+        assert current.price_df.loc[0, '型号'] == 'CHANGED'
+        assert load_price_table_index(path).price_df.loc[0, '型号'] == 'AGAIN'
+
+
+def test_snapshot_held_across_replace():
+    with temp_price_table(30) as path:
+        store = PriceTableStore(max_journal_age=60)
+        store.update_row(path, 0, {'型号': 'BEFORE'})
+        pinned = load_price_table_index(path)
+
+        # 整表替换后不再复用替换前发布的快照，即使读取方仍持有它
+        store.replace(path, ['型号', '规格', '单价'], [['NEW-1', 'DN50', 10], ['NEW-2', 'DN80', 20]])
+        current = load_price_table_index(path)
+        assert current is not pinned and current.version != pinned.version
+        assert list(current.price_df.columns) == ['型号', '规格', '单价'] and len(current) == 2
+        assert load_price_table_index(path).price_df.loc[0, '型号'] == 'NEW-1'
+        assert pinned.price_df.loc[0, '型号'] == 'BEFORE' and len(pinned) == 30
+
+
+def test_search_view_pins_one_version():
+    with temp_price_table(30) as path:
+        store = PriceTableStore(max_journal_age=60)
+        store.update_row(path, 0, {'型号': 'FIRST'})
+        view = price_table_cache.view
+        calls = []
+
+        def edit_between_reads(file_path):
+            # 取得索引之后、读取原始视图之前删掉一行
+            if not calls:
+                store.delete_row(file_path, 0)
+            calls.append(file_path)
+            return view(file_path)
+
+        with mock.patch.object(price_table_cache, "view", side_effect=edit_between_reads):
+            index, df = load_price_table_search_view(path, ImprovedPriceMatcher()._standardize_columns)
+        assert len(calls) == 2
+        assert len(index) == len(df) == 29
+        assert index.price_df['型号'].tolist() == df['型号'].tolist()
+
+
+def test_edits_copy_only_while_a_snapshot_is_held():
+    with temp_price_table(30) as path:
+        store = PriceTableStore(max_journal_age=60)
+        expected = read_price_table(path)
+        # 第一次编辑复制缓存中的冻结索引，之后没有读取方持有快照时原地编辑
+        store.update_row(path, 0, {'型号': 'FIRST'})
+        with mock.patch.object(PriceTableIndex, "clone", side_effect=AssertionError):
+            store.add_row(path, {'型号': 'TAIL', '规格': 'DN50'})
+            store.delete_row(path, 2)
+            # 追加的行尚未并入 price_df 时也能按行位置更新
+            store.update_row(path, 29, {'规格': 'DN65', '品牌': '新品牌'})
+            assert len(load_price_table_index(path)) == 30
+            store.update_row(path, 1, {'型号': 'AFTER-READ'})
+        expected.loc[0, '型号'] = 'FIRST'
+        expected.loc[30] = {'型号': 'TAIL', '规格': 'DN65', '品牌': '新品牌'}
+        expected = expected.drop(index=2).reset_index(drop=True)
+        expected.loc[1, '型号'] = 'AFTER-READ'
+
+        pinned = load_price_table_index(path)
+        assert pinned.price_df.astype(str).equals(expected.astype(str))
+        _assert_index_consistent(pinned)
+        # 快照仍被持有：下一次编辑先复制，快照保持不变
+        with mock.patch.object(PriceTableIndex, "clone", autospec=True, side_effect=PriceTableIndex.clone) as clone:
+            store.update_row(path, 1, {'型号': 'PINNED'})
+            assert clone.call_count == 1
+        assert pinned.price_df.loc[1, '型号'] == 'AFTER-READ'
+        assert load_price_table_index(path).price_df.loc[1, '型号'] == 'PINNED'
+
+
+if __name__ == "__main__":
+    test_incremental_index_matches_rebuild()
+    test_reads_see_edits_before_and_after_persist()
+    test_failed_compaction_is_retried()
+    test_patch_is_atomic_and_reports_changes()
+    test_readers_keep_pinned_snapshot()
+    test_snapshot_held_across_replace()
+    test_search_view_pins_one_version()
+    test_edits_copy_only_while_a_snapshot_is_held()
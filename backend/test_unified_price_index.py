@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试跨公司合并价格索引：与逐家 match_batch 结果一致，多品牌报价列按矩阵计算
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from enhanced_quote_processor import generate_multi_brand_quote
+from improved_price_matcher import ImprovedPriceMatcher
+from price_table_fixtures import build_price_table
+from test_match_batch import _build_inquiry
+from unified_price_index import match_batch_multi
+
+
+def _matchers() -> dict:
+    tables = {
+        '甲公司': build_price_table(200, seed=1),
+        # 名称列不同、没有品牌列
+        '乙公司': build_price_table(150, seed=2).rename(columns={'产品名称': '名称'}).drop(columns=['品牌']),
+        # 没有规格列时不按 DN 筛选
+        '丙公司': build_price_table(80, seed=3).drop(columns=['规格']),
+        '丁公司': build_price_table(0),
+    }
+    matchers = {}
+    for company, df in tables.items():
+        matcher = ImprovedPriceMatcher()
+        matcher.price_df = df
+        matchers[company] = matcher
+    return matchers
+
+
+def test_multi_matches_per_company_batch():
+    matchers = _matchers()
+    inquiry_df = _build_inquiry(150)
+    multi = match_batch_multi(matchers, inquiry_df)
+    assert list(multi) == list(matchers)
+    for company, matcher in matchers.items():
+        single = matcher.match_batch(inquiry_df)
+        for key in ("位置", "匹配类型", "置信度", "型号", "规格", "品牌"):
+            assert list(multi[company][key]) == list(single[key]), (company, key)
+        assert np.array_equal(multi[company]["价格"], single["价格"], equal_nan=True)
+
+
+def test_multi_brand_quote_columns():
+    with tempfile.TemporaryDirectory() as tmp:
+        price_files = {}
+        for company, seed in (('甲公司', 1), ('乙公司', 2), ('丙公司', 3)):
+            path = os.path.join(tmp, f'{company}.csv')
+            build_price_table(120, seed=seed).to_csv(path, index=False)
+            price_files[company] = path
+        inquiry_path = os.path.join(tmp, '询价表.csv')
+        _build_inquiry(60).drop(columns=['标准型号']).to_csv(inquiry_path, index=False)
+        output = os.path.join(tmp, 'out', '报价单.csv')
+
+        assert generate_multi_brand_quote(inquiry_path, price_files, output) == output
+        result_df = pd.read_csv(output).iloc[:-1]
+        prices = result_df[[f'{company}_单价' for company in price_files]].apply(pd.to_numeric, errors='coerce')
+        assert np.allclose(result_df['最低单价'], prices.min(axis=1), equal_nan=True)
+        for (_, row), (_, company_prices) in zip(result_df.iterrows(), prices.iterrows()):
+            expected = company_prices.idxmin().replace('_单价', '') if company_prices.notna().any() else ''
+            assert (row['最优供应商'] if isinstance(row['最优供应商'], str) else '') == expected
+        print("✅ 合并索引多品牌报价正常")
+
+
+if __name__ == "__main__":
+    test_multi_matches_per_company_batch()
+    test_multi_brand_quote_columns()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试表驱动阀门解析：型号与原 if/elif 判断链生成的黄金文件逐条一致
+"""
+
+import json
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import valve_model_generator
+from convert_excel_to_csv import first_cell_dn
+from default_rules import get_rules_manager
+from valve_model_generator import (analyze_valve_missing_params, invalidate_model_codes, model_code_cache,
+                                   parse_valve_info, parse_valve_info_from_combined)
+from valve_parser import DN_COLUMN, MATERIAL_COLUMN, PN_COLUMN, ValveSpec, extract_spec_columns, parse_valve_spec
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'valve_model_golden.json')
+
+
+def test_models_match_golden_file():
+    with open(GOLDEN_FILE, encoding='utf-8') as f:
+        cases = json.load(f)
+    mismatched = [(name, specs, expected, parse_valve_info(name, specs))
+                  for name, specs, expected in cases if parse_valve_info(name, specs) != expected]
+    assert not mismatched, mismatched[:10]
+    assert parse_valve_info_from_combined('闸阀 DN50 PN16 法兰连接 10 个 铸铁') == 'Z41T-16Q'
+    print(f"✅ {len(cases)} 条型号与黄金文件一致")
+
+
+def test_analyze_missing_params_uses_parsed_spec():
+    result = analyze_valve_missing_params('蝶阀', 'DN150 PN10')
+    assert result['missing_params'] == ['drive_mode', 'connection', 'structure', 'sealing']
+    assert result['valve_info']['product_type'] == 'D' and result['valve_info']['pressure'] == '10'
+    assert result['valve_info']['dn'] == 150
+
+    # 参数齐全、直接给出型号或无法识别的产品不需要交互
+    assert analyze_valve_missing_params('电动法兰明杆铜芯闸阀', 'DN80') is None
+    assert analyze_valve_missing_params('Y型过滤器', 'DN50') is None
+    assert analyze_valve_missing_params('黄铜减压阀', 'DN20') is None
+    assert analyze_valve_missing_params('水表', 'DN20') is None
+    assert analyze_valve_missing_params(None, 'DN20') is None
+
+    spec = parse_valve_spec('不锈钢304球阀', 'DN25 1.6MPa')
+    assert isinstance(spec, ValveSpec) and not hasattr(spec, '__dict__')
+    assert (spec.product_type, spec.material, spec.pressure, spec.dn) == ('Q', 'P', '16', 25)
+
+
+def test_model_codes_cached_per_rules_version():
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(valve_model_generator, 'RULES_DATA_ROOT', tmp):
+        manager = get_rules_manager(tmp)
+        manager.create_default_rules_for_new_user('a')
+        with model_code_cache.track() as usage:
+            first = parse_valve_info('球阀  DN25', '', 'a')
+            # 空白不同的同一文本、合并单元格入口都命中缓存
+            assert parse_valve_info(' 球阀 DN25 ', '', 'a') == first
+            assert parse_valve_info_from_combined('球阀 DN25', 'a') == first
+        assert usage.stats() == {"hits": 2, "misses": 1, "hit_rate": 0.6667}
+
+        # 保存规则后规则文件版本变化，按新规则重新生成
+        rules = manager.load_user_rules('a')
+        rules["product_defaults"]["Q"]["connection"] = "8"
+        manager.save_user_rules('a', rules)
+        assert invalidate_model_codes('a') >= 1
+        assert parse_valve_info('球阀 DN25', '', 'a') == first.replace('Q4', 'Q8', 1) != first
+        # 不应用规则时与用户无关
+        assert parse_valve_info('球阀 DN25', '', 'a', use_default_rules=False) == parse_valve_info('球阀 DN25', '')
+
+
+def test_spec_columns_match_per_row_parsing():
+    with open(GOLDEN_FILE, encoding='utf-8') as f:
+        cases = json.load(f)
+    names = pd.Series([name for name, _, _ in cases] + ['铸钢闸阀'])
+    specs = pd.Series([specs for _, specs, _ in cases] + [np.nan])
+    columns = extract_spec_columns(names, specs)
+    assert str(columns[DN_COLUMN].dtype) == 'int64' and str(columns[PN_COLUMN].dtype) == 'int64'
+
+    # 预先解析的整列结果传入后，逐行解析结果不变
+    mismatched = [(name, spec) for name, spec, dn, pn, material
+                  in zip(names, specs, columns[DN_COLUMN], columns[PN_COLUMN], columns[MATERIAL_COLUMN])
+                  if repr(parse_valve_spec(name, spec)) != repr(parse_valve_spec(name, spec, dn, pn, material))]
+    assert not mismatched, mismatched[:10]
+    assert columns.iloc[-1].tolist() == [50, 16, 'C']
+
+    # 询价表行内第一个含 DN 的单元格
+    df = pd.DataFrame({'品名': ['闸阀 dn80', '球阀', None], '规格型号': ['DN 50、PN16', np.nan, 'PN10'],
+                       '备注': ['DN65', 'DN 25', 'dn 40']})
+    assert first_cell_dn(df).tolist()[:2] == ['DN50', 'DN25'] and pd.isna(first_cell_dn(df).iloc[2])
+    print(f"✅ {len(names)} 条整列解析结果与逐行一致")
+
+
+if __name__ == "__main__":
+    test_models_match_golden_file()
+    test_analyze_missing_params_uses_parsed_spec()
+    test_model_codes_cached_per_rules_version()
+    test_spec_columns_match_per_row_parsing()
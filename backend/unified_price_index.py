@@ -0,0 +1,162 @@
+"""
+跨公司合并价格索引 - 把多家公司的价格表合并为一个索引，公司作为一列
+
+多品牌报价原先对每家公司分别整表匹配，耗时为 询价行数 × 公司数 × 表大小。
+合并索引对每个询价行只取一次 DN 候选、只打一次三匹配分，再按公司分组取各自最高分，
+一次查找即得到每家公司的最佳行；三匹配落空的公司再走该公司自己的回退策略，
+结果与逐家调用 ImprovedPriceMatcher.match_batch 完全一致。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from improved_price_matcher import ImprovedPriceMatcher, empty_batch_result, normalized_query, tri_match_confidence
+from match_result_cache import match_result_cache
+from price_table_index import PriceTableIndex, normalize_text
+
+# 最多缓存的合并索引个数，可通过环境变量 UNIFIED_INDEX_CACHE_SIZE 调整
+UNIFIED_INDEX_CACHE_SIZE = int(os.environ.get("UNIFIED_INDEX_CACHE_SIZE", "8"))
+
+
+def _field(index: PriceTableIndex, col: Optional[str]) -> np.ndarray:
+    """取一家公司价格表中的某个标准字段（列名重复时取第一列），没有该列时为空值"""
+    if col is None:
+        return np.full(len(index), np.nan, dtype=object)
+    position = list(index.price_df.columns).index(col)
+    return index.price_df.iloc[:, position].to_numpy(dtype=object)
+
+
+class UnifiedPriceIndex:
+    """多家公司价格表的合并索引
+
+    合并表只保留三匹配用到的字段（型号、名称、品牌、规格），各公司原来的名称列统一为“产品名称”；
+    行按公司依次排列，offsets[j] 是第 j 家公司第一行在合并表中的位置。
+    """
+
+    def __init__(self, indexes: Dict[str, PriceTableIndex]):
+        self.companies: List[str] = list(indexes)
+        # 由各公司价格表版本号组成，任一价格表变化后合并索引随之失效
+        self.version: tuple = tuple((company, index.version) for company, index in indexes.items())
+
+        sizes = [len(index) for index in indexes.values()]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.company_of = np.repeat(np.arange(len(sizes)), sizes)
+        combined = pd.DataFrame({
+            '型号': np.concatenate([_field(index, index.model_col) for index in indexes.values()] or [[]]),
+            '产品名称': np.concatenate([_field(index, index.name_col) for index in indexes.values()] or [[]]),
+            '品牌': np.concatenate([_field(index, index.brand_col) for index in indexes.values()] or [[]]),
+            '规格': np.concatenate([_field(index, index.spec_col) for index in indexes.values()] or [[]]),
+        })
+        self.index = PriceTableIndex(combined)
+        self.index.frozen = True
+        # 没有规格列的公司不按 DN 筛选（与单表匹配一致），它们的行始终参与打分
+        self._unbucketed = np.concatenate([
+            np.arange(self.offsets[j], self.offsets[j + 1])
+            for j, index in enumerate(indexes.values()) if index.spec_col is None
+        ] or [[]]).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def best_per_company(self, model_code: str, product_name: str, dn_value: str = '') -> List[Optional[Tuple[int, int]]]:
+        """一次打分得到每家公司三匹配的 (公司价格表内行位置, 得分)；没有得分大于 0 的公司为 None
+
+        同一公司内得分相同时取靠前的行，与 PriceTableIndex.best_match 一致。
+        """
+        q_model = normalize_text(model_code)
+        q_name = normalize_text(product_name)
+        positions = self.index.candidate_positions('', dn_value)
+        if dn_value and self.index.spec_col and self._unbucketed.size:
+            positions = np.union1d(positions, self._unbucketed)
+
+        best: List[Optional[Tuple[int, int]]] = [None] * len(self.companies)
+        scores = self.index.score(positions, q_model, q_name, '')
+        keep = scores > 0
+        positions, scores = positions[keep], scores[keep]
+        if positions.size == 0:
+            return best
+        companies = self.company_of[positions]
+        # 按 (公司, 得分降序, 行位置) 排序，每家公司的第一行即其最佳行
+        order = np.lexsort((positions, -scores, companies))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = companies[order][1:] != companies[order][:-1]
+        for i in order[first]:
+            company = int(companies[i])
+            best[company] = int(positions[i] - self.offsets[company]), int(scores[i])
+        return best
+
+
+_unified_cache: "OrderedDict[tuple, UnifiedPriceIndex]" = OrderedDict()
+_unified_lock = threading.Lock()
+
+
+def load_unified_index(indexes: Dict[str, PriceTableIndex]) -> UnifiedPriceIndex:
+    """按各公司价格表版本号缓存合并索引，价格表未变化时跨请求复用"""
+    key = tuple((company, index.version) for company, index in indexes.items())
+    with _unified_lock:
+        unified = _unified_cache.get(key)
+        if unified is not None:
+            _unified_cache.move_to_end(key)
+            return unified
+    unified = UnifiedPriceIndex(indexes)
+    print(f"📊 [UNIFIED] 构建合并价格索引: {len(unified.companies)} 家公司, {len(unified)} 行")
+    with _unified_lock:
+        _unified_cache[key] = unified
+        while len(_unified_cache) > UNIFIED_INDEX_CACHE_SIZE:
+            _unified_cache.popitem(last=False)
+    return unified
+
+
+def match_batch_multi(matchers: Dict[str, ImprovedPriceMatcher], inquiry_df: pd.DataFrame,
+                      name_col: str = '品名', spec_col: str = '规格型号', model_col: str = '标准型号',
+                      skip_summary_rows: bool = True) -> Dict[str, Dict[str, np.ndarray]]:
+    """对多家公司整表匹配（不指定品牌），返回 {公司: 与 match_batch 相同结构的结果}"""
+    companies = list(matchers)
+    n = len(inquiry_df)
+    results = {company: empty_batch_result(n) for company in companies}
+    # 价格表未加载的公司保持未匹配
+    matchers = {company: matcher for company, matcher in matchers.items() if matcher.price_df is not None}
+    if not matchers or n == 0:
+        return results
+
+    unified = load_unified_index({company: matcher._get_index() for company, matcher in matchers.items()})
+    keys = ImprovedPriceMatcher._batch_keys(inquiry_df, name_col, spec_col, model_col, skip_summary_rows)
+
+    resolved: Dict[Tuple, List[Optional[Tuple[int, str, float]]]] = {}
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        if key not in resolved:
+            name, dn_value, model = key
+            cache_key = ('unified', unified.version) + normalized_query(name, dn_value, model, None)
+            hit, resolved[key] = match_result_cache.lookup(cache_key)
+            if not hit:
+                resolved[key] = _resolve(unified, matchers, name, dn_value, model)
+                match_result_cache.put(cache_key, resolved[key])
+        for company, hit in zip(matchers, resolved[key]):
+            if hit is not None:
+                result = results[company]
+                result["位置"][i], result["匹配类型"][i], result["置信度"][i] = hit
+
+    for company, matcher in matchers.items():
+        matcher._fill_batch_result(results[company])
+    print(f"📊 [UNIFIED] 多公司批量匹配完成: {len(companies)} 家公司, "
+          f"{sum(key is not None for key in keys)} 行, 去重后实际查找 {len(resolved)} 次")
+    return results
+
+
+def _resolve(unified: UnifiedPriceIndex, matchers: Dict[str, ImprovedPriceMatcher],
+             name: str, dn_value: str, model: str) -> List[Optional[Tuple[int, str, float]]]:
+    """一个询价键在各公司的 (行位置, 匹配类型, 置信度)"""
+    resolved = []
+    for matcher, tri in zip(matchers.values(), unified.best_per_company(model, name, dn_value)):
+        if tri is not None:
+            position, score = tri
+            resolved.append((position, "三匹配", tri_match_confidence(score)))
+        else:
+            resolved.append(matcher._fallback_position(name, model, dn_value))
+    return resolved
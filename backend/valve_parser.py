@@ -0,0 +1,330 @@
+"""
+阀门信息解析器 - 预编译的表驱动解析
+
+原 parse_valve_info 对材质、产品类型、驱动、连接、结构、密封各写一条 if/elif 链，
+同一段文本要逐个关键词反复查找。这里把各字段的识别规则写成有序的 关键词→代号 表，
+模块加载时用全部关键词构建一个多关键词自动机：每段文本只扫描一遍得到命中集合，
+各字段再按表中顺序取第一条满足的规则，优先级与原来的判断链完全一致。
+"""
+import re
+from typing import FrozenSet, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from keyword_automaton import KeywordAutomaton
+
+# 未写 DN / PN 时的默认值
+DEFAULT_DN = 50
+DEFAULT_PN = 16
+DEFAULT_MATERIAL = 'Q'  # 球墨铸铁
+
+# extract_spec_columns 追加的列名
+DN_COLUMN = 'dn'
+PN_COLUMN = 'pn'
+MATERIAL_COLUMN = '材质代号'
+
+# 交互式报价中需要用户补全的参数
+REQUIRED_PARAMS = ('drive_mode', 'connection', 'structure', 'sealing', 'pressure')
+
+_DN_PATTERN = re.compile(r'DN(\d+)')
+# 1. 优先识别 MPa/兆帕（如 1.0MPa、1.6兆帕）
+_MPA_PATTERN = re.compile(r'([0-9]+(?:\.[0-9]+)?)\s*(Mpa|MPa|兆帕)', re.IGNORECASE)
+# 2. 识别 PN 后跟数字（如 PN1.0、PN16、PN 1.6），已覆盖“PN16”紧贴写法
+_PN_PATTERN = re.compile(r'PN[\s:：=]*([0-9]+(?:\.[0-9]+)?)', re.IGNORECASE)
+
+
+def _kw(*required: str, unless: Tuple[str, ...] = ()) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """一条匹配条件：required 全部出现且 unless 都不出现"""
+    return tuple(required), tuple(unless)
+
+
+def _any(*keywords: str) -> tuple:
+    """任一关键词出现即满足"""
+    return tuple(_kw(keyword) for keyword in keywords)
+
+
+# 各字段的 (代号, 匹配条件) 表，按优先级排列，取第一条满足的
+MATERIAL_RULES = (
+    ('U', _any('UPVC', 'upvc', 'PVC')),        # UPVC塑料
+    ('V', _any('PP', 'pp塑料')),                # PP塑料
+    ('P', _any('不锈钢304', '304不锈钢')),       # 铬镍系不锈钢
+    ('R', _any('不锈钢316', '316不锈钢')),       # 铬镍钼系不锈钢
+    ('P', _any('不锈钢')),                      # 默认304不锈钢
+    ('T', _any('黄铜', '铜制') + (_kw('铜', unless=('铜芯',)),)),  # 铜及铜合金
+    ('C', _any('碳钢', '铸钢')),
+    ('Q', _any('球墨铸铁')),
+    ('Z', _any('灰铸铁')),
+    ('K', _any('可锻铸铁')),
+)
+
+# 铸铁镶铜闸阀/给水闸阀按新标准预置铜芯密封、球墨铸铁、明杆、法兰，明确写出的驱动/连接/结构/密封仍可覆盖
+CAST_IRON_GATE = (_kw('铸铁镶铜闸阀'), _kw('给水闸阀'), _kw('铸铁', '闸阀'))
+CAST_IRON_GATE_PRESET = {'product_type': 'Z', 'sealing': 'T', 'material': 'Q', 'structure': '1', 'connection': '4'}
+
+PRODUCT_TYPE_RULES = (
+    ('L04X', _any('电磁流量计')),               # 流量计直接给出标准型号
+    ('100X', _any('遥控浮球阀')),
+    ('500X', _any('泄压', '持压')),
+    ('200X', _any('减压阀')),                   # 铜减压阀另有标准型号
+    ('800X', (_kw('缓闭', '止'),)),
+    ('Z', _any('闸阀')),
+    ('D', _any('蝶阀')),
+    ('Q', _any('球阀')),
+    ('H', _any('止回阀', '逆止阀')),
+    ('J', _any('截止阀')),
+    ('L', _any('节流阀')),
+    ('U', _any('柱塞阀')),
+    ('G', _any('隔膜阀')),
+    ('GA', (_kw('安全阀', '杠杆'),)),
+    ('A', _any('安全阀')),
+    ('S', _any('疏水阀', '蒸汽疏水阀')),
+    ('P', _any('排气阀')),
+    ('X', _any('旋塞阀')),
+    ('GL', _any('过滤器')),                     # 过滤器按材质和口径直接给出型号
+    ('LHS41X', (_kw('倒流防止器', '低阻力'), _kw('逆流防止器', '低阻力'), _kw('防回流', '低阻力'))),
+    ('HS41X', _any('倒流防止器', '逆流防止器', '防回流')),
+)
+
+# 直接给出完整型号、不再组合各部分代号的产品
+DIRECT_MODEL_TYPES = frozenset({'L04X', 'GL', 'LHS41X', 'HS41X'})
+# 型号只由 类型-压力材质 组成的特殊产品
+SPECIAL_PRODUCT_TYPES = ('100X', '200X', '500X', '800X')
+
+DRIVE_RULES = (
+    ('0', _any('电磁')),
+    ('9', _any('电动')),
+    ('6', _any('气动')),
+    ('7', _any('液动')),
+    ('3', _any('涡轮', '蜗轮')),
+    ('5', _any('锥齿轮')),
+    ('3', _any('手动', '手柄', '手轮')),
+)
+
+CONNECTION_RULES = (
+    ('1', _any('丝扣', '螺纹', '内螺纹')),
+    ('2', _any('外螺纹')),
+    ('4', _any('法兰')),
+    ('7', _any('对夹')),
+    ('8', _any('卡箍', '沟槽', '快装')),
+    ('6', _any('焊接', '承插')),
+)
+
+STRUCTURE_RULES = (
+    ('5', _any('暗杆')),
+    ('1', _any('明杆')),
+    ('4', _any('橡胶瓣')),
+)
+
+COPPER_CORE = '铜芯'
+
+# 在小写后的全文中查找的关键词
+_CASE_FOLDED: FrozenSet[str] = frozenset({'upvc', 'pp塑料'})
+# 只在品名中查找的关键词
+_NAME_ONLY: FrozenSet[str] = frozenset({'橡胶瓣'})
+
+
+def _condition_keywords(conditions):
+    for required, excluded in conditions:
+        yield from required
+        yield from excluded
+
+
+_KEYWORDS = frozenset(
+    [keyword for rules in (MATERIAL_RULES, PRODUCT_TYPE_RULES, DRIVE_RULES, CONNECTION_RULES, STRUCTURE_RULES)
+     for _, conditions in rules for keyword in _condition_keywords(conditions)]
+    + list(_condition_keywords(CAST_IRON_GATE)) + [COPPER_CORE]
+)
+# 全部字段共用一个自动机，每段文本只扫描一遍
+_AUTOMATON = KeywordAutomaton(sorted(_KEYWORDS), case_insensitive=_CASE_FOLDED)
+
+
+def keyword_hits(name: str, full_text: str) -> FrozenSet[str]:
+    """一段文本命中的全部关键词（full_text 以 name 开头）"""
+    name_end = len(name)
+    return frozenset(keyword for end, keyword in _AUTOMATON.iter_matches(full_text)
+                     if keyword not in _NAME_ONLY or end <= name_end)
+
+
+def _satisfied(conditions, hits: FrozenSet[str]) -> bool:
+    return any(hits.issuperset(required) and hits.isdisjoint(excluded) for required, excluded in conditions)
+
+
+def resolve(rules, hits: FrozenSet[str], default: str = '') -> str:
+    """按优先级取第一条满足的规则的代号，都不满足时返回 default"""
+    for code, conditions in rules:
+        if _satisfied(conditions, hits):
+            return code
+    return default
+
+
+def extract_dn(specs: str, default: int = DEFAULT_DN) -> int:
+    """规格中的 DN 口径"""
+    match = _DN_PATTERN.search(specs)
+    return int(match.group(1)) if match else default
+
+
+def extract_pn(text: str, default: int = DEFAULT_PN) -> int:
+    """文本中的 PN 压力（MPa 换算为 10 倍）"""
+    match = _MPA_PATTERN.search(text)
+    if match:
+        return int(float(match.group(1)) * 10)
+    match = _PN_PATTERN.search(text)
+    if match:
+        value = match.group(1)
+        return int(float(value) * 10) if '.' in value else int(value)
+    return default
+
+
+def _pn_from_match(mpa: pd.Series, pn_text: pd.Series) -> pd.Series:
+    """整列版 extract_pn 的取值规则：MPa 优先并换算为 10 倍，PN 带小数点时同样换算"""
+    pn_value = pn_text.astype(float)
+    pn_value = pn_value.where(~pn_text.str.contains('.', regex=False, na=False), np.trunc(pn_value * 10))
+    return np.trunc(mpa.astype(float) * 10).fillna(pn_value)
+
+
+def _keyword_mask(text: pd.Series, lowered: pd.Series, keyword: str) -> np.ndarray:
+    source = lowered if keyword in _CASE_FOLDED else text
+    return source.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+
+
+def extract_spec_columns(names: pd.Series, specs: Optional[pd.Series] = None) -> pd.DataFrame:
+    """整列解析 DN、PN 和材质代号，结果与逐行的 extract_dn / extract_pn / 材质规则一致
+
+    dn 只从规格中取（未写时为 DEFAULT_DN），pn 和材质从 品名+规格 全文中取；
+    空值按空文本处理；返回与 names 同索引的 DataFrame（dn、pn 为整数列，材质代号为字符串列）。
+    """
+    names = names.fillna('').astype(str)
+    specs = specs.fillna('').astype(str) if specs is not None else pd.Series('', index=names.index)
+    full_text = names + ' ' + specs
+    lowered = full_text.str.lower()
+
+    dn = specs.str.extract(_DN_PATTERN.pattern, expand=False).astype(float).fillna(DEFAULT_DN)
+    pn = _pn_from_match(full_text.str.extract(_MPA_PATTERN.pattern, flags=_MPA_PATTERN.flags, expand=True)[0],
+                        full_text.str.extract(_PN_PATTERN.pattern, flags=_PN_PATTERN.flags, expand=False))
+
+    # 材质：按规则顺序取第一条满足的，每个关键词只对整列查找一次
+    masks = {keyword: _keyword_mask(full_text, lowered, keyword)
+             for _, conditions in MATERIAL_RULES for keyword in _condition_keywords(conditions)}
+    no_rows = np.zeros(len(names), dtype=bool)
+    conditions = []
+    for _, rule_conditions in MATERIAL_RULES:
+        satisfied = no_rows
+        for required, excluded in rule_conditions:
+            condition = np.logical_and.reduce([masks[k] for k in required] + [~masks[k] for k in excluded])
+            satisfied = satisfied | condition
+        conditions.append(satisfied)
+    material = np.select(conditions, [code for code, _ in MATERIAL_RULES], default=DEFAULT_MATERIAL) \
+        if len(names) else np.array([], dtype=object)
+
+    return pd.DataFrame({
+        DN_COLUMN: dn.astype(np.int64),
+        PN_COLUMN: pn.fillna(DEFAULT_PN).astype(np.int64),
+        MATERIAL_COLUMN: pd.Series(material, index=names.index, dtype=object),
+    }, index=names.index)
+
+
+def add_spec_columns(df: pd.DataFrame, name_col: str = '品名', spec_col: Optional[str] = '规格型号') -> pd.DataFrame:
+    """返回追加了 dn、pn、材质代号 列的询价表副本"""
+    specs = df[spec_col] if spec_col and spec_col in df.columns else None
+    columns = extract_spec_columns(df[name_col], specs)
+    result = df.copy()
+    for col in columns.columns:
+        result[col] = columns[col]
+    return result
+
+
+class ValveSpec:
+    """从品名和规格中明确识别出的阀门参数（未应用用户默认规则和推断规则）
+
+    model 非空时表示该产品直接给出标准型号（电磁流量计、铜减压阀、过滤器、倒流防止器）。
+    """
+
+    __slots__ = ('product_type', 'drive_mode', 'connection', 'structure', 'sealing',
+                 'pressure', 'material', 'dn', 'name', 'specs', 'model')
+
+    def __init__(self, name: str, specs: str, dn: int, pressure: str, material: str, product_type: str = '',
+                 drive_mode: str = '', connection: str = '', structure: str = '', sealing: str = '',
+                 model: str = ''):
+        self.name = name
+        self.specs = specs
+        self.dn = dn
+        self.pressure = pressure
+        self.material = material
+        self.product_type = product_type
+        self.drive_mode = drive_mode
+        self.connection = connection
+        self.structure = structure
+        self.sealing = sealing
+        self.model = model
+
+    def valve_info(self) -> dict:
+        """转为规则管理器和交互式报价使用的阀门信息字典"""
+        return {
+            'product_type': self.product_type,
+            'drive_mode': self.drive_mode,
+            'connection': self.connection,
+            'structure': self.structure,
+            'sealing': self.sealing,
+            'pressure': self.pressure,
+            'material': self.material,
+            'dn': self.dn,
+            'name': self.name,
+            'specs': self.specs,
+        }
+
+    def missing_params(self) -> list:
+        return [param for param in REQUIRED_PARAMS if not getattr(self, param)]
+
+    def __repr__(self) -> str:
+        return f"ValveSpec({self.model or self.valve_info()})"
+
+
+def _direct_model(product_type: str, pressure: str, material: str, dn: int) -> str:
+    if product_type == 'L04X':
+        return f"L04X-{pressure}P"
+    if product_type == 'GL':
+        if material in ('P', 'R'):
+            return f"{'GL11W' if dn <= 40 else 'GL41W'}-{pressure}{material}"
+        if material == 'U':  # UPVC过滤器
+            return f"GL11U-{pressure}U"
+        return f"GL41H-{pressure}{material}"
+    return f"{product_type}-{pressure}{material}"
+
+
+def parse_valve_spec(name, specs, dn=None, pn=None, material=None) -> Optional[ValveSpec]:
+    """解析品名和规格，输入为空时返回 None
+
+    dn、pn、material 可传入 extract_spec_columns 对整表预先解析的结果，省去逐行正则。
+    """
+    if pd.isna(name) or pd.isna(specs):
+        return None
+    name = str(name)
+    specs = str(specs)
+    full_text = name + ' ' + specs
+    hits = keyword_hits(name, full_text)
+
+    spec = ValveSpec(name, specs,
+                     int(dn) if dn is not None else extract_dn(specs),
+                     str(int(pn) if pn is not None else extract_pn(full_text)),
+                     material if material is not None else resolve(MATERIAL_RULES, hits, DEFAULT_MATERIAL))
+    if _satisfied(CAST_IRON_GATE, hits):
+        for field, value in CAST_IRON_GATE_PRESET.items():
+            setattr(spec, field, value)
+    else:
+        spec.product_type = resolve(PRODUCT_TYPE_RULES, hits)
+        if spec.product_type == '200X' and spec.material == 'T':
+            spec.model = f"Y11X-{spec.pressure}T"
+        elif spec.product_type in DIRECT_MODEL_TYPES:
+            spec.model = _direct_model(spec.product_type, spec.pressure, spec.material, spec.dn)
+    if spec.model or not spec.product_type:
+        return spec
+
+    spec.drive_mode = resolve(DRIVE_RULES, hits, spec.drive_mode)
+    spec.connection = resolve(CONNECTION_RULES, hits, spec.connection)
+    spec.structure = resolve(STRUCTURE_RULES, hits, spec.structure)
+    if COPPER_CORE in hits:
+        spec.sealing = 'T'
+    elif spec.product_type == 'G':  # 隔膜阀默认衬胶
+        spec.sealing = 'J'
+    return spec